@@ -17,6 +17,8 @@ from src.embeddings.embeddings import (
     create_embeddings, save_embeddings
 )
 from src.embeddings.faiss import build_faiss_index
+from src.embeddings.symptom_index import build_symptom_index
+from src.tools.profiler import profiled
 from tqdm import tqdm
 
 
@@ -26,6 +28,7 @@ PDF_FILE = os.path.join(DATA_DIR, "suspected-cancer-recognition-and-referral.pdf
 ELEMENTS_FILE = os.path.join(DATA_DIR, "suspected-cancer-recognition-and-referral_elements.json")
 ENRICHED_FILE = os.path.join(DATA_DIR, "suspected-cancer-recognition-and-referral_enriched.json")
 INDEX_PATH = os.path.join(DATA_DIR, "faiss.index")
+API_WORKERS = int(os.getenv("API_WORKERS", "0")) or os.cpu_count() or 1
 
 os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
 sys.stdout.reconfigure(line_buffering=True)
@@ -86,7 +89,7 @@ def enhance_data():
                 print(f"Error processing element {element.get('element_id')}: {e}")
         elif e_type == "table":
             try:
-                enriched_data.append(process_table_element(model, element, full_context))
+                enriched_data.extend(process_table_element(model, element, full_context))
             except Exception as e:
                 print(f"Error processing table {element.get('element_id')}: {e}")
     save_results(enriched_data, ENRICHED_FILE)
@@ -113,15 +116,32 @@ def build_index():
     build_faiss_index()
     return True
 
-def run_pipeline():
+def build_symptoms():
+    print("\n" + "=" * 50)
+    print("Step 5: Building Symptom Index")
+    print("=" * 50)
+    build_symptom_index()
+    return True
+
+def run_stage(stage, profile=False):
+    """Run one pipeline stage, optionally under the sampling profiler."""
+    if not profile:
+        return stage()
+    with profiled(f"pipeline-{stage.__name__}") as info:
+        result = stage()
+    print(f"Profile of {stage.__name__} written to {info['path']}")
+    return result
+
+def run_pipeline(profile=False):
     """Execute the full data processing pipeline."""
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
         
-    if parse_pdf():
-        if enhance_data():
-            if generate_embeddings():
-                build_index()
+    if run_stage(parse_pdf, profile):
+        if run_stage(enhance_data, profile):
+            if run_stage(generate_embeddings, profile):
+                run_stage(build_index, profile)
+                run_stage(build_symptoms, profile)
                 return True
     return False
 
@@ -140,7 +160,30 @@ def run_command(command):
         print(f"Error starting {command}: {e}")
         return None
 
-def start_services():
+def prepare_artifacts():
+    """Build the metadata store and migrate the databases once, before the workers start.
+
+    Every worker would otherwise run the same migrations at the same moment
+    and queue up behind one another's VACUUM.
+    """
+    from src.embeddings.metadata_store import open_metadata
+    from src.database.db_manager import db_manager
+    from src.database.job_queue import job_queue
+    from src.tools.patient_data import patient_tool
+    open_metadata(os.path.join(DATA_DIR, "metadata.json"))
+    db_manager.initialize()
+    patient_tool.load()
+    job_queue.initialize()
+
+
+def api_command(port, workers, dev):
+    if dev:
+        # Auto-reload only works with a single worker
+        return f"uvicorn src.api.main:app --host 0.0.0.0 --port {port} --reload"
+    return f"uvicorn src.api.main:app --host 0.0.0.0 --port {port} --workers {workers}"
+
+
+def start_services(workers=API_WORKERS, dev=False):
     """Start the API and UI services."""
     print("\n" + "=" * 50)
     print(" STARTING NG12 AGENT SERVICES")
@@ -156,8 +199,14 @@ def start_services():
     api_host_url =  f"http://localhost:{api_port}"
     ui_host_url =  f"http://localhost:{ui_port}"
 
-    print(f"[1/2] Starting API (FastAPI) on port {api_port}...")
-    api_proc = run_command(f"uvicorn src.api.main:app --host 0.0.0.0 --port {api_port} --reload")
+    if dev:
+        print(f"[1/2] Starting API (FastAPI, dev mode with auto-reload) on port {api_port}...")
+    else:
+        prepare_artifacts()
+        print(f"[1/2] Starting API (FastAPI, {workers} workers) on port {api_port}...")
+    # Workers share the per-process rate limit ceilings (see src/tools/rate_limiter.py)
+    os.environ["API_WORKERS"] = "1" if dev else str(workers)
+    api_proc = run_command(api_command(api_port, workers, dev))
     
     print(f"[2/2] Starting UI (Streamlit) on port {api_host_url}...")
     time.sleep(2)
@@ -195,21 +244,27 @@ def main():
     parser = argparse.ArgumentParser(description="NG12 Agent Application")
     parser.add_argument("--pipeline-only", action="store_true", help="Run only the data pipeline")
     parser.add_argument("--app-only", action="store_true", help="Run only the application services")
+    parser.add_argument("--workers", type=int, default=API_WORKERS,
+                        help=f"API worker processes (default: API_WORKERS or CPU count, here {API_WORKERS})")
+    parser.add_argument("--dev", action="store_true", help="Single API process with auto-reload")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a sampling profile of each pipeline stage to PROFILE_DIR")
     args = parser.parse_args()
+    workers = max(1, args.workers)
 
     if args.pipeline_only:
-        run_pipeline()
+        run_pipeline(args.profile)
     elif args.app_only:
-        start_services()
+        start_services(workers, args.dev)
     else:
 
         if not os.path.exists(INDEX_PATH):
             print("Search index not found. Running data pipeline first...")
-            if run_pipeline():
-                start_services()
+            if run_pipeline(args.profile):
+                start_services(workers, args.dev)
         else:
             print("Data pipeline appears complete.")
-            start_services()
+            start_services(workers, args.dev)
 
 if __name__ == "__main__":
     main()
@@ -1,27 +1,64 @@
 import os
+import re
 import json
 import asyncio
-from typing import List, Optional
+import hashlib
+from typing import AsyncIterator, List, Optional
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent, RunContext, UsageLimits
-from pydantic_ai.models.gemini import GeminiModel
-from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_core import from_json
+from pydantic_ai import Agent, AgentRunResultEvent, RunContext, UsageLimits
+from pydantic_ai.exceptions import AgentRunError
+from pydantic_ai.usage import RunUsage
+from pydantic_ai.messages import (
+    FunctionToolCallEvent, FunctionToolResultEvent, ModelMessage, PartDeltaEvent, PartStartEvent,
+    RetryPromptPart, ToolCallPart, ToolCallPartDelta
+)
+from src.agent.compression import COMPRESS_PASSAGES, PASSAGE_TOKEN_BUDGET, compress_results
+from src.agent.memory import ConversationMemory, MemoryContext, format_turns
+from src.agent.models import build_model
+from src.agent.router import FAST_MODEL_NAME, PATIENT_ID_PATTERN, Route, route_request
+from src.database.db_manager import db_manager
+from src.tools import deadline
+from src.tools.single_flight import SingleFlight
 from src.tools.patient_data import patient_tool
+from src.tools.rate_limiter import current_priority
 from src.tools.rag_search import rag_tool
+from src.tools.telemetry import Counter, get_logger, registry, span
 from dotenv import load_dotenv
 
 
 load_dotenv()
 
+log = get_logger("agent")
+
 MODEL_NAME = os.getenv("MODEL_NAME")
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
 
+# Fast tier of the model cascade (see src/agent/router.py); a capped run so a
+# struggling fast model escalates quickly instead of burning requests
+FAST_REQUEST_LIMIT = int(os.getenv("FAST_REQUEST_LIMIT", "6"))
+FAST_MAX_OUTPUT_TOKENS = int(os.getenv("FAST_MAX_OUTPUT_TOKENS", "1024"))
+
 
 class ReferralCitation(BaseModel):
     source: str = Field(..., description="Source document")
     page: Optional[int] = Field(None, description="Page number")
     excerpt: str = Field(..., description="Relevant excerpt")
+    chunk_id: Optional[str] = Field(None, description="Guideline passage ID")
+
+
+# What the model writes. Citations are passage IDs only; page and excerpt are
+# filled in from the chunk store (resolve_citations), which keeps output
+# tokens and structured-output retries down.
+class AgentAnswer(BaseModel):
+    summary: str = Field(..., description="Brief summary")
+    assessment: str = Field(..., description="URGENT REFERRAL, URGENT INVESTIGATION, ROUTINE, or SAFETY NETTING")
+    reasoning: str = Field(..., description="Why this decision was made")
+    citation_ids: List[str] = Field(
+        default_factory=list,
+        description="IDs of the guideline passages relied on, exactly as labelled in the tool results (e.g. page_9_seq_2#1)",
+    )
 
 
 class ClinicalAssessment(BaseModel):
@@ -29,107 +66,484 @@ class ClinicalAssessment(BaseModel):
     assessment: str = Field(..., description="URGENT REFERRAL, URGENT INVESTIGATION, ROUTINE, or SAFETY NETTING")
     reasoning: str = Field(..., description="Why this decision was made")
     citations: List[ReferralCitation] = Field(default_factory=list, description="Supporting evidence")
+    partial: bool = Field(False, description="The request deadline cut the agent run short")
+
 
+PAGE_PATTERN = re.compile(r"Page (\d+)\]")
+OUTPUT_TOOL_NAME = "final_result"  # pydantic-ai's default structured output tool
+ASSESSMENTS = ("URGENT REFERRAL", "URGENT INVESTIGATION", "ROUTINE", "SAFETY NETTING")
+
+output_retries = registry.register(Counter(
+    "clinical_agent_output_retries_total", "Structured-output retries the model was asked to make"
+))
+routes = registry.register(Counter(
+    "clinical_agent_routes_total", "Agent runs by model tier chosen by the router", ("tier", "reason")
+))
+escalations = registry.register(Counter(
+    "clinical_agent_escalations_total", "Fast-tier runs escalated to the full model", ("reason",)
+))
+deadline_hits = registry.register(Counter(
+    "clinical_deadline_exceeded_total", "Turns cut short by their request deadline", ("mode",)
+))
 
 # Load system prompt
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), "PROMPTS.md")
 with open(PROMPT_PATH, "r", encoding="utf-8") as f:
     SYSTEM_PROMPT = f.read()
 
-# Initialize agent
-model = GeminiModel(MODEL_NAME, provider='google-vertex')
+_model = None
+_fast_model = None
+
+
+def get_model():
+    """The agent model, built on first use so importing needs no credentials.
+
+    Requests go through the shared rate limiter.
+    """
+    global _model
+    if _model is None:
+        _model = build_model(MODEL_NAME)
+    return _model
+
+
+def get_fast_model():
+    """The cascade's fast model (``FAST_MODEL_NAME``), or the agent model when unset."""
+    global _fast_model
+    if not FAST_MODEL_NAME:
+        return get_model()
+    if _fast_model is None:
+        _fast_model = build_model(FAST_MODEL_NAME)
+    return _fast_model
+
+
+def load_models():
+    get_model()
+    get_fast_model()
+
+
+# The model is passed per run (see get_model)
 clinical_agent = Agent(
-    model,
-    output_type=ClinicalAssessment,
-    system_prompt=SYSTEM_PROMPT,
+    output_type=AgentAnswer,
+    instructions=SYSTEM_PROMPT,
     deps_type=str,
     retries=3
 )
 
+summary_agent = Agent(
+    output_type=str,
+    instructions=(
+        "Condense the conversation into a short factual summary for a clinician. "
+        "Keep patient IDs, symptoms, assessments given and open questions. "
+        "Do not add anything that was not said."
+    ),
+)
+
+
+def _format_results(results: List[dict]) -> str:
+    formatted = []
+    for r in results:
+        excerpt = r.get("excerpt", "").replace("\n", " ").strip()
+        page = r.get('page', 'N/A')
+        formatted.append(f"[{r.get('chunk_id', '?')} | Page {page}] {excerpt}")
+    return "\n\n---\n\n".join(formatted)
+
 
 @clinical_agent.tool
-def get_patient_data(ctx: RunContext[str], patient_id: str) -> str:
+async def get_patient_data(ctx: RunContext[str], patient_id: str) -> str:
     """Get patient data by ID."""
-    print(f"[TOOL] get_patient_data({patient_id})")
-    data = patient_tool.get_patient_data(patient_id)
-    if data:
-        return json.dumps(data, indent=2)
-    return f"Patient {patient_id} not found."
+    with span("tool.get_patient_data"):
+        return await _get_patient_data(patient_id)
+
+
+async def _get_patient_data(patient_id: str) -> str:
+    log.debug("Tool call", tool="get_patient_data", patient_id=patient_id)
+    data = await patient_tool.get_patient_data(patient_id)
+    if not data:
+        return f"Patient {patient_id} not found."
+
+    # Resolve known symptoms from the precomputed index so the agent can
+    # skip a search round trip for them.
+    sections = []
+    for symptom in data.get("symptoms", []):
+        results = rag_tool.lookup_symptom(symptom, k=2)
+        if results and COMPRESS_PASSAGES:
+            with span("compression"):
+                results = compress_results(symptom, results, PASSAGE_TOKEN_BUDGET // 2)
+        if results:
+            sections.append(f"### {symptom}\n\n{_format_results(results)}")
+
+    output = json.dumps(data, indent=2)
+    if sections:
+        output += "\n\nNG12 guideline passages for the recorded symptoms:\n\n" + "\n\n".join(sections)
+    return output
 
 
 @clinical_agent.tool
 async def search_guidelines(ctx: RunContext[str], query: str) -> str:
     """Search NG12 guidelines."""
-    print(f"[TOOL] search_guidelines('{query}')")
-    results = await rag_tool.search(query, k=4)
-    
+    log.debug("Tool call", tool="search_guidelines", query=query)
+    deadline.check("search_guidelines")
+    with span("tool.search_guidelines"):
+        results = rag_tool.lookup_symptom(query, k=4)
+        if results is None:
+            results = await rag_tool.search(query, k=4)
+
     if not results:
         return "No relevant guidelines found."
     
     if results[0].get("score", 0) < 0.4:
         return "Insufficient evidence found in guidelines for this query."
-    
-    formatted = []
-    for r in results:
-        excerpt = r.get("excerpt", "").replace("\n", " ").strip()
-        page = r.get('page', 'N/A')
-        formatted.append(f"[Page {page}] {excerpt}")
-    
-    return "\n\n---\n\n".join(formatted)
 
+    if COMPRESS_PASSAGES:
+        # Only the sentences that bear on the query; they are re-sent every request
+        with span("compression"):
+            results = compress_results(query, results)
+    return _format_results(results)
 
-async def run_chat(session_id: str, message: str) -> ClinicalAssessment:
-    """Run a chat session with the clinical agent."""
-    from src.database.db_manager import DatabaseManager
-    
-    print(f"\n[AGENT] Session: {session_id}")
-    print(f"[AGENT] Message: {message}")
-    
-    # Get conversation history
-    db = DatabaseManager()
-    history = await db.get_history(session_id)
+
+async def summarize_turns(previous_summary: str, messages: List[dict]) -> str:
+    """Fold older turns into the rolling conversation summary."""
+    prompt = f"Existing summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{format_turns(messages)}"
+    # Summaries are simple enough for the fast tier
+    result = await summary_agent.run(prompt, model=get_fast_model(), usage_limits=UsageLimits(request_limit=1))
+    return result.output
+
+
+def resolve_citations(answer: AgentAnswer) -> ClinicalAssessment:
+    """Turn the model's passage IDs into citations with page and verbatim excerpt."""
+    citations = [
+        ReferralCitation(source=c["source"], page=c["page"], excerpt=c["excerpt"], chunk_id=c["chunk_id"])
+        for c in rag_tool.resolve_chunks(answer.citation_ids)
+    ]
+    return ClinicalAssessment(
+        summary=answer.summary, assessment=answer.assessment, reasoning=answer.reasoning, citations=citations
+    )
+
+
+def _count_output_retries(result) -> int:
+    return sum(
+        1 for m in result.new_messages() for part in m.parts
+        if isinstance(part, RetryPromptPart) and part.tool_name in (OUTPUT_TOOL_NAME, None)
+    )
+
+
+def format_answer(result: ClinicalAssessment) -> str:
+    answer = f"**Assessment:** {result.assessment}\n\n**Reasoning:** {result.reasoning}"
+    if result.partial:
+        answer += "\n\n*Incomplete: the time budget ran out before the assessment was finished.*"
+    return answer
+
+
+def _deadline_passed(e: BaseException) -> bool:
+    """Whether ``e`` is the request deadline running out (not some other timeout)."""
+    return isinstance(e, deadline.DeadlineExceeded) or (
+        isinstance(e, TimeoutError) and not deadline.can_finish(0)
+    )
+
+
+async def partial_assessment(message: str) -> ClinicalAssessment:
+    """Best answer available without the agent, for a turn its deadline cut short.
+
+    A single patient the NG12 decision table settles gets the rule decision;
+    anything else is reported as INCOMPLETE.
+    """
+    from src.agent.rules import to_assessment, triage
+
+    summary = "The agent did not finish within the request's time budget."
+    patient_ids = {p.upper() for p in PATIENT_ID_PATTERN.findall(message)}
+    if len(patient_ids) == 1:
+        record = await patient_tool.get_patient_data(patient_ids.pop())
+        if record:
+            decision = triage([record]).iloc[0]
+            if decision["assessment"] is not None:
+                output = to_assessment(record, decision["assessment"], decision["rules"])
+                return output.model_copy(update={"partial": True})
+            summary = (f"{record.get('age')}-year-old {str(record.get('gender', '')).lower()} with "
+                       f"{', '.join(record.get('symptoms') or []) or 'no recorded symptoms'}.")
+    return ClinicalAssessment(
+        summary=summary,
+        assessment="INCOMPLETE",
+        reasoning="The time budget ran out before the guideline assessment was finished. "
+                  "Ask again with a longer deadline or a narrower question.",
+        partial=True,
+    )
+
+
+async def _finish_partial(
+    db, session_id: str, output: ClinicalAssessment, mode: str, turn_id: Optional[str] = None
+) -> ClinicalAssessment:
+    if db is not None:
+        await db.add_message(session_id, "assistant", format_answer(output), turn_id)
+    deadline_hits.inc(mode=mode)
+    log.warning("Turn cut short by deadline", session_id=session_id, mode=mode, assessment=output.assessment)
+    return output
+
+
+# Coalesces concurrent duplicate agent runs (see run_chat)
+agent_flights = SingleFlight("agent")
+
+
+def _run_key(message: str, history: List[ModelMessage]) -> str:
+    """Key for coalescing: normalized message plus the conversation it follows.
+
+    Only part contents are used, so timestamps and the session id do not
+    prevent two fresh sessions asking the same question from sharing a run.
+    The tools do not depend on the session, so sharing is safe. The caller's
+    priority is part of the key, so a batch run never carries an interactive
+    request's model calls at batch priority (or the reverse).
+    """
+    digest = hashlib.sha256(f"{current_priority.get().name}\x00".encode())
+    digest.update(" ".join(message.lower().split()).encode())
+    for m in history:
+        for part in m.parts:
+            digest.update(f"\x00{part.part_kind}:{getattr(part, 'content', '')}".encode())
+    return digest.hexdigest()
+
+
+async def _shared_run(session_id: str, message: str, context):
+    """_run_agent for agent_flights, free of the leader's request deadline.
+
+    The task would otherwise inherit the deadline of whichever caller
+    started it, and a follower with more time left would get that caller's
+    cut-off. Each caller bounds its own wait instead; the run is cancelled
+    once every caller has given up on it.
+    """
+    deadline.current_deadline.set(None)  # only this task's context copy
+    return await _run_agent(session_id, message, context)
+
+
+async def _start_turn(session_id: str, message: str, turn_id: Optional[str] = None, persist: bool = True):
+    """Load memory for the session and persist the user message.
+
+    Without ``persist`` the turn starts from an empty history and nothing is
+    stored; the returned db is None.
+    """
+    log.info("Turn started", session_id=session_id, message_chars=len(message), persist=persist)
+    if not persist:
+        return None, MemoryContext()
+
+    # Build token-budgeted history (recent turns + rolling summary)
+    db = db_manager
+    memory = ConversationMemory(db, summarizer=summarize_turns)
+    with span("memory_load"):
+        context = await memory.load(session_id)
     
     # Save user message to database
-    await db.add_message(session_id, "user", message)
-    
-    # Build context from last 3 exchanges
-    if history:
-        recent = history[-6:]
-        context = "\n".join([f"{'User' if m['role']=='user' else 'Assistant'}: {m['content']}" for m in recent])
-        full_message = f"Previous conversation (for context):\n{context}\n\nCurrent user question: {message}"
-    else:
-        full_message = message
+    await db.add_message(session_id, "user", message, turn_id)
+    return db, context
+
+
+async def _finish_turn(
+    db, session_id: str, result, context, tier: str = "full", turn_id: Optional[str] = None
+) -> ClinicalAssessment:
+    output = resolve_citations(result.output)
+    # Save assistant message to database
+    if db is not None:
+        await db.add_message(session_id, "assistant", format_answer(output), turn_id)
+
+    usage = result.usage()
+    retries = _count_output_retries(result)
+    output_retries.inc(retries)
+    log.info(
+        "Turn finished", session_id=session_id, tier=tier, assessment=output.assessment,
+        requests=usage.requests, input_tokens=usage.input_tokens, output_tokens=usage.output_tokens,
+        output_retries=retries, history_tokens=context.history_tokens,
+        citations=len(output.citations), citation_ids=len(result.output.citation_ids),
+    )
+    return output
+
+
+def _escalation_reason(result, route: Route) -> Optional[str]:
+    """Why a fast-tier answer is not good enough to return, or None if it is."""
+    answer = result.output
+    if not any(a in answer.assessment.upper() for a in ASSESSMENTS):
+        return "no_assessment"
+    # An unknown patient has nothing to cite; anything else must be grounded
+    if route.reason != "unknown_patient" and not rag_tool.resolve_chunks(answer.citation_ids):
+        return "no_citations"
+    return None
+
+
+async def _run_agent(session_id: str, message: str, context):
+    """Run the cascade for one turn; returns (result, tier, usage of a discarded fast run)."""
+    with span("routing"):
+        route = await route_request(message)
+    routes.inc(tier=route.tier, reason=route.reason)
+    log.info(
+        "Routed", session_id=session_id, tier=route.tier, reason=route.reason,
+        patients=route.patients, symptoms=route.symptoms,
+        score=round(route.score, 3) if route.score is not None else None,
+    )
+
+    wasted = None
+    if route.tier == "fast":
+        try:
+            with span("agent_tier.fast"):
+                result = await clinical_agent.run(
+                    message,
+                    model=get_fast_model(),
+                    message_history=context.message_history,
+                    deps=session_id,
+                    usage_limits=UsageLimits(request_limit=FAST_REQUEST_LIMIT),
+                    model_settings={"max_tokens": FAST_MAX_OUTPUT_TOKENS},
+                )
+        except AgentRunError as e:
+            # Invalid output after all retries, or the request cap was hit
+            reason, result = type(e).__name__, None
+        else:
+            reason = _escalation_reason(result, route)
+            if reason is None:
+                return result, "fast", None
+            wasted = result.usage()
+        escalations.inc(reason=reason)
+        log.info("Escalated", session_id=session_id, reason=reason, route=route.reason)
+
+    with span("agent_tier.full"):
+        result = await clinical_agent.run(
+            message,
+            model=get_model(),
+            message_history=context.message_history,
+            deps=session_id,
+            usage_limits=UsageLimits(request_limit=25)
+        )
+    return result, "full", wasted
+
+
+async def run_chat(
+    session_id: str, message: str, usage: Optional[RunUsage] = None, turn_id: Optional[str] = None,
+    persist: bool = True,
+) -> ClinicalAssessment:
+    """Run a chat session with the clinical agent.
+
+    If ``usage`` is given, the run's request and token counts are added to it,
+    and its ``details["output_retries"]`` counts structured-output retries.
+    With ``FAST_MODEL_NAME`` set, simple requests are tried on the fast model
+    first (see _run_agent); an escalated fast run's usage is counted too.
+    Under a request deadline (src.tools.deadline) a run that overruns it is
+    abandoned and partial_assessment() is returned instead.
+    A ``turn_id`` makes the persisted turn idempotent: running the same turn
+    again (a retried job) does not store its messages a second time.
+    With ``persist=False`` the turn is stateless: no history is loaded and
+    neither message is saved (batch assessments).
+    """
+    db, context = await _start_turn(session_id, message, turn_id, persist)
     
-    # Retry logic for rate limits
-    max_retries = 3
-    base_delay = 2
+    # Identical concurrent requests (same question, same conversation state)
+    # share one agent run. Rate limits are retried per model request by the
+    # shared limiter.
+    try:
+        with span("agent_run"):
+            # Leaving early only detaches this caller from a shared run
+            async with asyncio.timeout_at(deadline.current_deadline.get()):
+                result, tier, wasted = await agent_flights.do(
+                    _run_key(message, context.message_history),
+                    lambda: _shared_run(session_id, message, context),
+                )
+    except Exception as e:
+        if not _deadline_passed(e):
+            raise
+        return await _finish_partial(db, session_id, await partial_assessment(message), "chat", turn_id)
+    if usage is not None:
+        usage.incr(result.usage())
+        if wasted is not None:
+            usage.incr(wasted)
+        usage.details["output_retries"] = usage.details.get("output_retries", 0) + _count_output_retries(result)
     
-    for attempt in range(max_retries):
-        try:
-            # Run agent
-            result = await clinical_agent.run(
-                full_message,
-                deps=session_id,
-                usage_limits=UsageLimits(request_limit=25)
-            )
-            
-            # Save assistant message to database
-            await db.add_message(session_id, "assistant", result.output.summary)
-            
-            break
-        except ModelHTTPError as e:
-            if e.status_code == 429:
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)  # Exponential backoff: 2s, 4s, 8s...
-                    print(f"\n[AGENT] Rate limited (429). Retrying in {delay}s...")
-                    await asyncio.sleep(delay)
-                    continue
+    return await _finish_turn(db, session_id, result, context, tier, turn_id)
+
+
+def _parse_partial_output(args) -> Optional[dict]:
+    """Parse possibly incomplete output tool arguments."""
+    if isinstance(args, dict):
+        return args
+    if not args:
+        return None
+    try:
+        parsed = from_json(args, allow_partial=True)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+async def stream_chat(session_id: str, message: str) -> AsyncIterator[dict]:
+    """Run a chat turn and yield progress events as they happen.
+
+    Yields dicts with an ``event`` name and a ``data`` payload: ``tool_call``,
+    ``tool_result``, ``partial`` (assessment fields produced so far) and
+    finally ``result`` whose data is the ClinicalAssessment. Always runs
+    the full model: a fast-tier answer already streamed could not be escalated.
+    When the request deadline passes, the fields streamed so far (or
+    partial_assessment()) are returned flagged ``partial``.
+    """
+    db, context = await _start_turn(session_id, message)
+
+    output_args = {}  # part index -> accumulated output tool arguments
+    last_partial = None
+    result = None
+    events = clinical_agent.run_stream_events(
+        message,
+        model=get_model(),
+        message_history=context.message_history,
+        deps=session_id,
+        usage_limits=UsageLimits(request_limit=25)
+    )
+    try:
+        while True:
+            # Only the wait for the next event is bounded: a timeout must not
+            # fire while the consumer holds control between events
+            try:
+                async with asyncio.timeout_at(deadline.current_deadline.get()):
+                    event = await anext(events)
+            except StopAsyncIteration:
+                break
+            if isinstance(event, FunctionToolCallEvent):
+                yield {"event": "tool_call", "data": {
+                    "tool": event.part.tool_name, "args": event.part.args_as_dict()}}
+            elif isinstance(event, FunctionToolResultEvent):
+                content = event.result.model_response_str() if isinstance(event.result, RetryPromptPart) \
+                    else str(event.result.content)
+                yield {"event": "tool_result", "data": {
+                    "tool": event.result.tool_name,
+                    "pages": sorted({int(p) for p in PAGE_PATTERN.findall(content)})}}
+            elif isinstance(event, PartStartEvent):
+                # Part indexes restart with every model response
+                if isinstance(event.part, ToolCallPart) and event.part.tool_name == OUTPUT_TOOL_NAME:
+                    output_args[event.index] = event.part.args or ""
                 else:
-                    print(f"\n[AGENT] Max retries exceeded for rate limit.")
-                    raise
-            else:
-                raise
-    
-    print(f"\n[AGENT] Result:")
-    print(json.dumps(result.output.model_dump(), indent=2))
-    return result.output
+                    output_args.pop(event.index, None)
+            elif isinstance(event, PartDeltaEvent) and isinstance(event.delta, ToolCallPartDelta) \
+                    and event.index in output_args:
+                delta = event.delta.args_delta
+                if isinstance(delta, dict):
+                    output_args[event.index] = {**(output_args[event.index] or {}), **delta}
+                elif delta:
+                    output_args[event.index] = (output_args[event.index] or "") + delta
+            elif isinstance(event, AgentRunResultEvent):
+                result = event.result
+
+            if isinstance(event, (PartStartEvent, PartDeltaEvent)) and event.index in output_args:
+                partial = _parse_partial_output(output_args[event.index])
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    yield {"event": "partial", "data": {
+                        k: v for k, v in partial.items() if k in ("summary", "assessment", "reasoning")}}
+    except Exception as e:
+        if not _deadline_passed(e):
+            raise
+        await events.aclose()
+        if last_partial and last_partial.get("assessment") in ASSESSMENTS:
+            # The model had already committed to an assessment
+            output = resolve_citations(AgentAnswer(
+                summary=last_partial.get("summary") or "",
+                assessment=last_partial["assessment"],
+                reasoning=last_partial.get("reasoning") or "",
+                citation_ids=[c for c in last_partial.get("citation_ids") or [] if isinstance(c, str)],
+            )).model_copy(update={"partial": True})
+        else:
+            output = await partial_assessment(message)
+        output = await _finish_partial(db, session_id, output, "stream")
+        yield {"event": "result", "data": output}
+        return
+
+    output = await _finish_turn(db, session_id, result, context)
+    yield {"event": "result", "data": output}
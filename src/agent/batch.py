@@ -0,0 +1,144 @@
+"""Bulk patient assessment with bounded concurrency."""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+from src.agent.agent import run_chat
+from src.agent.rules import load_rules, to_assessment, triage
+from src.tools.patient_data import patient_tool
+from src.tools.rag_search import rag_tool
+from src.tools.rate_limiter import Priority, current_priority
+from src.tools.telemetry import get_logger, span
+
+log = get_logger("batch")
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+MAX_BATCH_CONCURRENCY = int(os.getenv("MAX_BATCH_CONCURRENCY", "16"))
+# Decide clear-cut patients with the NG12 decision table before calling the agent
+RULES_PRE_TRIAGE = os.getenv("RULES_PRE_TRIAGE", "1") == "1"
+
+ASSESS_PROMPT = "Assess patient {patient_id} for cancer referral"
+
+
+async def _assess_one(batch_id: str, patient_id: str, semaphore: asyncio.Semaphore, persist: bool = False) -> Dict:
+    # Runs in its own task, so this only lowers the priority of this assessment
+    current_priority.set(Priority.BATCH)
+    async with semaphore:
+        start = time.perf_counter()
+        item = {"patient_id": patient_id}
+        try:
+            if await patient_tool.get_patient_data(patient_id) is None:
+                item.update(status="not_found", error=f"Patient {patient_id} not found")
+            else:
+                result = await run_chat(
+                    f"batch-{batch_id}-{patient_id}", ASSESS_PROMPT.format(patient_id=patient_id), persist=persist
+                )
+                item.update(status="ok", source="agent", assessment=result.model_dump())
+        except Exception as e:
+            log.warning("Assessment failed", batch_id=batch_id, patient_id=patient_id, error=f"{type(e).__name__}: {e}")
+            item.update(status="error", error=f"{type(e).__name__}: {e}")
+        item["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return item
+
+
+async def _pre_triage(patient_ids: List[str]) -> List[Dict]:
+    """Rule-decided results for the clear-cut patients; the rest need the agent."""
+    records = await patient_tool.get_patients(patient_ids)
+    if not records:
+        return []
+    with span("rules.triage", patients=len(records)):
+        start = time.perf_counter()
+        table = load_rules()
+        frame = await asyncio.to_thread(triage, records.values(), table)
+        decided = frame[frame["assessment"].notna()]
+        latency_ms = round((time.perf_counter() - start) * 1000 / len(frame), 3)
+        return [{
+            "patient_id": row.patient_id,
+            "status": "ok",
+            "source": "rules",
+            "rules_version": table.version,
+            "rules": row.rules,
+            "assessment": to_assessment(records[row.patient_id], row.assessment, row.rules, table).model_dump(),
+            "latency_ms": latency_ms,
+        } for row in decided.itertuples(index=False)]
+
+
+async def _pages(patient_ids: Union[List[str], AsyncIterator[List[str]]]) -> AsyncIterator[List[str]]:
+    if isinstance(patient_ids, list):
+        # Preserve order but skip duplicates; one assessment per patient
+        yield list(dict.fromkeys(patient_ids))
+        return
+    async for page in patient_ids:
+        yield page
+
+
+async def assess_patients(
+    patient_ids: Union[List[str], AsyncIterator[List[str]]],
+    concurrency: Optional[int] = None,
+    batch_id: Optional[str] = None,
+    pre_triage: Optional[bool] = None,
+    persist: bool = False,
+) -> AsyncIterator[Dict]:
+    """Assess patients concurrently, yielding each result as it finishes.
+
+    ``patient_ids`` is a list, or an async iterator of pages of ids (such as
+    ``patient_tool.iter_patient_ids()`` for the whole registry); pages are
+    assessed one after the other, so memory is bounded by the page size
+    however many patients there are.
+
+    All assessments share the process-wide embedding and retrieval caches of
+    ``rag_tool``, so repeated guideline searches across the batch are only
+    embedded once. A final summary item (``"type": "summary"``) closes the
+    stream.
+
+    With ``pre_triage`` (default ``RULES_PRE_TRIAGE``) the NG12 decision table
+    settles the clear-cut patients of each page first (``"source": "rules"``);
+    only the ambiguous ones are sent to the agent.
+
+    Agent assessments are not saved to the chat history unless ``persist``
+    is set, in which case each patient gets a ``batch-<batch_id>-<patient_id>``
+    session; a cohort run would otherwise add a session per patient.
+    """
+    batch_id = batch_id or uuid.uuid4().hex[:8]
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, MAX_BATCH_CONCURRENCY))
+    log.info("Batch started", batch_id=batch_id, concurrency=concurrency, persist=persist)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    total = 0
+    counts = {"ok": 0, "not_found": 0, "error": 0, "rules": 0}
+    use_rules = RULES_PRE_TRIAGE if pre_triage is None else pre_triage
+    async for page in _pages(patient_ids):
+        total += len(page)
+        decided = await _pre_triage(page) if use_rules else []
+        for item in decided:
+            counts["ok"] += 1
+            counts["rules"] += 1
+            yield {"type": "result", "batch_id": batch_id, **item}
+        if decided:
+            log.info("Pre-triage decided patients", batch_id=batch_id, decided=len(decided), ambiguous=len(page) - len(decided))
+        settled = {item["patient_id"] for item in decided}
+        remaining = [pid for pid in page if pid not in settled]
+
+        tasks = [asyncio.create_task(_assess_one(batch_id, pid, semaphore, persist)) for pid in remaining]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                counts[item["status"]] += 1
+                yield {"type": "result", "batch_id": batch_id, **item}
+        finally:
+            # Client went away or the consumer stopped early
+            for task in tasks:
+                task.cancel()
+
+    yield {
+        "type": "summary",
+        "batch_id": batch_id,
+        "total": total,
+        **counts,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "cache": rag_tool.cache_stats(),
+    }
@@ -0,0 +1,150 @@
+"""Query-focused compression of retrieved guideline passages.
+
+Tool results are re-sent as input tokens on every following model request
+of a turn, so instead of whole chunks (plus their generated "contextual
+meaning") the agent gets only the sentences that bear on the query. Each
+segment of the retrieved chunks (a numbered recommendation, a sentence or a
+table) is scored by BM25 against the query, with IDF taken from the whole
+guideline, plus a small prior from the chunk's retrieval score. The best
+sentences are kept until ``PASSAGE_TOKEN_BUDGET`` is spent, then re-emitted
+in document order under their chunk's ``[page_9_seq_2#1 | Page 9]`` label,
+so page provenance and citation IDs survive.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from src.tools.tokens import estimate_tokens
+
+load_dotenv()
+
+COMPRESS_PASSAGES = os.getenv("COMPRESS_PASSAGES", "1") == "1"
+PASSAGE_TOKEN_BUDGET = int(os.getenv("PASSAGE_TOKEN_BUDGET", "600"))
+
+# BM25 parameters; sentences are short, so length normalization is mild
+BM25_K1 = 1.2
+BM25_B = 0.3
+# Weight of the chunk's retrieval score next to the sentence's lexical score
+CHUNK_PRIOR = 0.5
+# Sentences shorter than this carry no content on their own (headings, page furniture)
+MIN_SENTENCE_CHARS = 25
+# Descriptions the enrichment step appended to chunks; they paraphrase, never add facts
+GENERATED_PARAGRAPH = re.compile(r"^\s*(This (chunk|section|table|text|passage)\b|\|?\s*Title:)")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+# Chunk text keeps the PDF's line wrapping, so single newlines are not
+# boundaries. Paragraphs split at numbered recommendations and headings
+# ("1.2.7 Refer...") and at sentence ends; tables have neither and stay whole.
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+SENTENCE_SPLIT = re.compile(r"\n(?=\d+\.\d+(?:\.\d+)? )|(?<=[.!?])\s+(?=[A-Z])")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the their them they this to "
+    "was were which who will with people person patient patients aged if".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for paragraph in PARAGRAPH_SPLIT.split(text):
+        if GENERATED_PARAGRAPH.match(paragraph):
+            continue
+        for part in SENTENCE_SPLIT.split(paragraph):
+            part = " ".join(part.split())
+            if len(part) >= MIN_SENTENCE_CHARS:
+                sentences.append(part)
+    return sentences
+
+
+class SentenceScorer:
+    """BM25 over sentences, with document frequencies from a reference corpus."""
+
+    def __init__(self, corpus: Sequence[str] = ()):
+        self.df: Counter = Counter()
+        self.docs = 0
+        for text in corpus:
+            self.df.update(set(tokenize(text)))
+            self.docs += 1
+
+    def idf(self, term: str) -> float:
+        n = self.docs or 1
+        return math.log(1 + (n - self.df.get(term, 0) + 0.5) / (self.df.get(term, 0) + 0.5))
+
+    def scores(self, query: str, sentences: List[str]) -> List[float]:
+        terms = set(tokenize(query))
+        tokenized = [tokenize(s) for s in sentences]
+        avg_len = sum(map(len, tokenized)) / len(tokenized) if tokenized else 1.0
+        out = []
+        for tokens in tokenized:
+            tf = Counter(tokens)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / (avg_len or 1.0))
+            out.append(sum(
+                self.idf(t) * tf[t] * (BM25_K1 + 1) / (tf[t] + norm) for t in terms if t in tf
+            ))
+        return out
+
+
+_scorer: Optional[SentenceScorer] = None
+
+
+def get_scorer() -> SentenceScorer:
+    """Scorer with IDF over every guideline chunk, built on first use."""
+    global _scorer
+    if _scorer is None:
+        from src.tools.rag_search import rag_tool
+
+        rag_tool.load()
+        _scorer = SentenceScorer(m.get("content", m.get("raw_text", "")) for m in rag_tool.metadata)
+    return _scorer
+
+
+def compress_results(
+    query: str,
+    results: List[Dict],
+    token_budget: int = PASSAGE_TOKEN_BUDGET,
+    scorer: Optional[SentenceScorer] = None,
+) -> List[Dict]:
+    """Results with ``excerpt`` cut down to the query's best sentences within ``token_budget``.
+
+    Chunks left with no selected sentence are dropped. Expects the ``text``
+    field of ``RAGSearchTool`` results (the chunk without its context).
+    """
+    scorer = scorer or get_scorer()
+    candidates = []  # (lexical score, score, result index, sentence index, sentence)
+    for i, r in enumerate(results):
+        sentences = split_sentences(r.get("text", r.get("excerpt", "")))
+        for j, (sentence, score) in enumerate(zip(sentences, scorer.scores(query, sentences))):
+            candidates.append((score, score + CHUNK_PRIOR * r.get("score", 0.0), i, j, sentence))
+    # Sentences sharing no term with the query only fill the budget with noise,
+    # unless no sentence matches at all (e.g. a paraphrased question)
+    if any(c[0] > 0 for c in candidates):
+        candidates = [c for c in candidates if c[0] > 0]
+
+    kept: Dict[int, List] = {}
+    used = 0
+    for _, score, i, j, sentence in sorted(candidates, key=lambda c: -c[1]):
+        cost = estimate_tokens(sentence) + 1
+        if used + cost > token_budget:
+            continue
+        kept.setdefault(i, []).append((j, sentence))
+        used += cost
+
+    compressed = []
+    for i, r in enumerate(results):
+        if i in kept:
+            # Back in document order, with gaps marked
+            picked = sorted(kept[i])
+            parts = [picked[0][1]]
+            for (prev, _), (j, sentence) in zip(picked, picked[1:]):
+                parts.append(("... " if j > prev + 1 else "") + sentence)
+            compressed.append({**r, "excerpt": " ".join(parts)})
+    # Nothing fit (e.g. one huge table row): better the full passages than none
+    return compressed or results
@@ -0,0 +1,164 @@
+"""Worker pool for queued agent runs.
+
+``POST /jobs/chat`` only enqueues; these workers pull jobs from the
+persistent ``job_queue`` and run them in the background, so a long agent run
+(retries and all) outlives the HTTP request that asked for it. Each API
+process runs ``JOB_CONCURRENCY`` workers; the queue's leases keep them from
+taking the same job twice. Workers wake immediately for jobs submitted in
+their own process and poll for the rest.
+
+Delivery is at-least-once: a job whose worker died, or whose lease lapsed
+because heartbeats could not be written, is run again by another worker
+(up to ``JOB_MAX_ATTEMPTS``). A worker that finds its lease gone cancels
+its run rather than finishing it next to the new owner. Handlers must
+therefore be safe to repeat; the chat handler persists its turn under the
+job id, so a retried turn appears in the session history once.
+"""
+
+import asyncio
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.agent.agent import run_chat
+from src.database.job_queue import JobQueue, job_queue
+from src.tools.telemetry import get_logger, span
+
+load_dotenv()
+
+log = get_logger("jobs")
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+# A worker renews its lease every third of this; a job whose lease lapses is re-queued
+JOB_LEASE_S = float(os.getenv("JOB_LEASE_S", "60"))
+JOB_POLL_INTERVAL_S = float(os.getenv("JOB_POLL_INTERVAL_S", "1"))
+# A failed heartbeat (e.g. "database is locked") is retried after this long
+JOB_HEARTBEAT_RETRY_S = 1.0
+
+
+async def _chat_job(job_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    # run_chat persists both sides of the turn, like /chat; keyed by the job
+    # so a retried job does not add the turn twice
+    result = await run_chat(payload["session_id"], payload["message"], turn_id=job_id)
+    return result.model_dump()
+
+
+# Handlers take (job_id, payload) and may run more than once per job
+HANDLERS: Dict[str, Callable[[str, Dict[str, Any]], Awaitable[Any]]] = {
+    "chat": _chat_job,
+}
+
+
+class JobWorkers:
+    def __init__(self, queue: JobQueue = job_queue, concurrency: int = JOB_CONCURRENCY):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self.counts = {"done": 0, "failed": 0, "released": 0, "lease_lost": 0}
+        self.running = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        job_id = await self.queue.enqueue(kind, payload)
+        if self._wake is not None:
+            self._wake.set()
+        return job_id
+
+    def start(self):
+        if self._tasks or self.concurrency <= 0:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(f"{self.name}-{i}")) for i in range(self.concurrency)]
+        log.info("Job workers started", workers=self.concurrency, lease_s=JOB_LEASE_S)
+
+    async def stop(self):
+        """Stop the workers; jobs they were running go back to the queue."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _work(self, worker: str):
+        while True:
+            # Cleared before claiming so a submit during the claim still wakes us
+            self._wake.clear()
+            try:
+                job = await self.queue.claim(worker, JOB_LEASE_S)
+            except Exception as e:
+                log.warning("Job claim failed", worker=worker, error=f"{type(e).__name__}: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(worker, job)
+
+    async def _heartbeat(self, worker: str, job_id: str, work: asyncio.Task):
+        """Renew the lease while ``work`` runs; cancel it if the lease is lost."""
+        delay = JOB_LEASE_S / 3
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                renewed = await self.queue.heartbeat(job_id, worker, JOB_LEASE_S)
+            except Exception as e:
+                # Retry well before the lease runs out
+                log.warning("Job heartbeat failed", worker=worker, job_id=job_id, error=f"{type(e).__name__}: {e}")
+                delay = min(JOB_HEARTBEAT_RETRY_S, JOB_LEASE_S / 3)
+                continue
+            if not renewed:
+                # Re-queued (or taken by another worker): stop, the new owner runs it
+                log.warning("Job lease lost, cancelling run", worker=worker, job_id=job_id)
+                work.cancel()
+                return
+            delay = JOB_LEASE_S / 3
+
+    async def _run(self, worker: str, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        log.info("Job started", worker=worker, job_id=job_id, kind=job["kind"], attempt=job["attempts"])
+        work = asyncio.create_task(self._execute(job))
+        heartbeat = asyncio.create_task(self._heartbeat(worker, job_id, work))
+        self.running += 1
+        try:
+            result = await work
+            await self.queue.complete(job_id, worker, result)
+            self.counts["done"] += 1
+            log.info("Job done", worker=worker, job_id=job_id)
+        except asyncio.CancelledError:
+            if not asyncio.current_task().cancelling():
+                # The heartbeat cancelled the run: the job is no longer ours
+                self.counts["lease_lost"] += 1
+                return
+            # Shutting down: let the next worker (or the next start) pick it up
+            work.cancel()
+            await asyncio.shield(self.queue.release(job_id, worker))
+            self.counts["released"] += 1
+            log.info("Job released", worker=worker, job_id=job_id)
+            raise
+        except Exception as e:
+            # The agent already retried transient errors; don't run it again
+            error = f"{type(e).__name__}: {e}"
+            await self.queue.fail(job_id, worker, error)
+            self.counts["failed"] += 1
+            log.warning("Job failed", worker=worker, job_id=job_id, error=error)
+        finally:
+            self.running -= 1
+            heartbeat.cancel()
+
+    @staticmethod
+    async def _execute(job: Dict[str, Any]) -> Any:
+        with span(f"job.{job['kind']}", job_id=job["job_id"]):
+            return await HANDLERS[job["kind"]](job["job_id"], job["payload"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._tasks), "running": self.running, **self.counts, **self.queue.stats()}
+
+
+# Singleton instance
+job_workers = JobWorkers()
@@ -0,0 +1,135 @@
+"""Token-budgeted conversation memory.
+
+Recent turns are passed to the agent verbatim as pydantic-ai message history;
+turns that no longer fit the budget are folded into a rolling summary that is
+stored per session and updated incrementally.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pydantic_ai.messages import (
+    ModelMessage, ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+)
+from src.database.db_manager import DatabaseManager
+from src.tools.telemetry import get_logger
+from src.tools.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+log = get_logger("memory")
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+# Upper bound on unsummarized messages read per turn. Each turn folds evicted
+# messages into the summary, so this is only reached after summaries failed
+# to save; reads stay bounded however long the session runs.
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "50"))
+
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if keep_end:
+        return "..." + text[-max_chars:].split(" ", 1)[-1]
+    return text[:max_chars].rsplit(" ", 1)[0] + "..."
+
+
+def format_turns(messages: List[Dict]) -> str:
+    return "\n".join(
+        f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+    )
+
+
+async def fallback_summarizer(previous: str, messages: List[Dict]) -> str:
+    """Extractive summary used when the LLM summarizer is unavailable."""
+    lines = [previous] if previous else []
+    for m in messages:
+        first_line = m["content"].strip().split("\n")[0]
+        lines.append(f"{'User' if m['role'] == 'user' else 'Assistant'}: {truncate_to_tokens(first_line, 40)}")
+    return "\n".join(lines)
+
+
+@dataclass
+class MemoryContext:
+    """History handed to the agent plus token accounting for the turn."""
+    message_history: List[ModelMessage] = field(default_factory=list)
+    summary: str = ""
+    recent_messages: int = 0
+    summarized_messages: int = 0
+    history_tokens: int = 0
+
+
+class ConversationMemory:
+    def __init__(
+        self,
+        db: DatabaseManager,
+        summarizer: Optional[Summarizer] = None,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        summary_budget: int = SUMMARY_TOKEN_BUDGET,
+    ):
+        self.db = db
+        self.summarizer = summarizer or fallback_summarizer
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+
+    async def load(self, session_id: str) -> MemoryContext:
+        """Build the message history for the next turn of a session."""
+        summary, summarized_upto = await self.db.get_summary(session_id)
+        pending = await self.db.get_history(session_id, after_id=summarized_upto, limit=MEMORY_MAX_MESSAGES)
+
+        # Keep the newest turns that fit in the budget left after reserving
+        # room for the summary.
+        budget = self.token_budget - self.summary_budget
+        recent: List[Dict] = []
+        used = 0
+        for m in reversed(pending):
+            cost = estimate_tokens(m["content"])
+            if used + cost > budget:
+                break
+            recent.insert(0, m)
+            used += cost
+
+        evicted = pending[:len(pending) - len(recent)]
+        if evicted:
+            summary = await self._summarize(summary, evicted)
+            await self.db.save_summary(session_id, summary, evicted[-1]["id"])
+
+        context = MemoryContext(
+            message_history=self._to_model_messages(summary, recent),
+            summary=summary,
+            recent_messages=len(recent),
+            summarized_messages=len(evicted),
+            history_tokens=estimate_tokens(summary) + used,
+        )
+        log.debug("Memory loaded", session_id=session_id, recent_messages=context.recent_messages,
+                  summarized_messages=context.summarized_messages, history_tokens=context.history_tokens)
+        return context
+
+    async def _summarize(self, previous: str, messages: List[Dict]) -> str:
+        try:
+            summary = await self.summarizer(previous, messages)
+        except Exception as e:
+            log.warning("Summarizer failed, using extractive summary", error=type(e).__name__)
+            summary = await fallback_summarizer(previous, messages)
+        # The newest information matters most if the summary overflows.
+        return truncate_to_tokens(summary, self.summary_budget, keep_end=True)
+
+    @staticmethod
+    def _to_model_messages(summary: str, messages: List[Dict]) -> List[ModelMessage]:
+        history: List[ModelMessage] = []
+        for m in messages:
+            if m["role"] == "user":
+                history.append(ModelRequest(parts=[UserPromptPart(content=m["content"])]))
+            else:
+                history.append(ModelResponse(parts=[TextPart(content=m["content"])]))
+
+        if summary:
+            summary_part = SystemPromptPart(content=f"Summary of the earlier conversation:\n{summary}")
+            if history and isinstance(history[0], ModelRequest):
+                history[0].parts.insert(0, summary_part)
+            else:
+                history.insert(0, ModelRequest(parts=[summary_part]))
+        return history
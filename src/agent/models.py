@@ -0,0 +1,178 @@
+"""Model construction for the clinical agent.
+
+``build_model`` honours ``VERTEX_MODE`` (see ``src.tools.replay``): live
+Gemini, Gemini with every exchange recorded to disk, or an offline replay of
+recorded exchanges. All three go through the shared rate limiter.
+"""
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+from pydantic_ai.models.wrapper import WrapperModel
+from src.tools.rate_limiter import rate_limiter
+from src.tools.telemetry import get_logger, span
+from src.tools.replay import (
+    REPLAY_STRICT, VERTEX_MODE, RecordingStore, ReplayMiss, fingerprint, replay_delay
+)
+
+log = get_logger("models")
+
+
+class RateLimitedModel(WrapperModel):
+    """Route every model request through the shared rate limiter.
+
+    Rate-limit errors are retried per request, so a 429 late in a run no
+    longer restarts the whole agent run.
+    """
+
+    async def request(self, messages, model_settings, model_request_parameters: ModelRequestParameters):
+        with span("llm_request"):
+            return await rate_limiter.call(
+                self.model_name, "generate",
+                lambda: self.wrapped.request(messages, model_settings, model_request_parameters),
+            )
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages, model_settings, model_request_parameters: ModelRequestParameters, run_context: Any = None
+    ) -> AsyncIterator[StreamedResponse]:
+        # Only opening the stream is retried; once events have been
+        # forwarded a failure has to propagate.
+        async def open_stream():
+            context = self.wrapped.request_stream(messages, model_settings, model_request_parameters, run_context)
+            return context, await context.__aenter__()
+
+        with span("llm_request"):
+            context, stream = await rate_limiter.call(self.model_name, "generate", open_stream)
+            try:
+                yield stream
+            except BaseException as e:
+                if not await context.__aexit__(type(e), e, e.__traceback__):
+                    raise
+            else:
+                await context.__aexit__(None, None, None)
+
+
+def request_key(messages: List[ModelMessage]) -> str:
+    """Fingerprint of a model request, ignoring timestamps and tool call IDs."""
+    payload = []
+    for m in messages:
+        for part in m.parts:
+            payload.append([
+                m.kind, part.part_kind, getattr(part, "tool_name", None),
+                getattr(part, "content", None) if not hasattr(part, "args") else part.args_as_dict(),
+            ])
+    return fingerprint(payload)
+
+
+def _dump_response(response: ModelResponse) -> Any:
+    return json.loads(ModelMessagesTypeAdapter.dump_json([response]))[0]
+
+
+def _load_response(data: Any) -> ModelResponse:
+    return ModelMessagesTypeAdapter.validate_python([data])[0]
+
+
+class RecordingModel(WrapperModel):
+    """Pass requests to the wrapped model and record each exchange."""
+
+    def __init__(self, wrapped: Model, store: RecordingStore):
+        super().__init__(wrapped)
+        self.store = store
+
+    def _record(self, messages, response: ModelResponse, start: float):
+        self.store.append(request_key(messages), {
+            "response": _dump_response(response),
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        })
+
+    async def request(self, messages, model_settings, model_request_parameters: ModelRequestParameters):
+        start = time.perf_counter()
+        response = await self.wrapped.request(messages, model_settings, model_request_parameters)
+        self._record(messages, response, start)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages, model_settings, model_request_parameters: ModelRequestParameters, run_context: Any = None
+    ) -> AsyncIterator[StreamedResponse]:
+        start = time.perf_counter()
+        async with self.wrapped.request_stream(
+            messages, model_settings, model_request_parameters, run_context
+        ) as stream:
+            yield stream
+        self._record(messages, stream.get(), start)
+
+
+def _placeholder_args(schema: dict) -> dict:
+    """Minimal arguments that satisfy an output tool's JSON schema."""
+    defaults = {"string": "Replay placeholder", "integer": 0, "number": 0, "boolean": False,
+                "array": [], "object": {}}
+    properties = schema.get("properties", {})
+    return {
+        name: defaults.get(properties.get(name, {}).get("type"), None)
+        for name in schema.get("required", [])
+    }
+
+
+class ReplayModel(FunctionModel):
+    """Serve recorded responses offline after a synthetic delay."""
+
+    def __init__(self, model_name: str, store: RecordingStore):
+        self.store = store
+        super().__init__(self._respond, stream_function=self._respond_stream, model_name=model_name)
+
+    def _lookup(self, messages: List[ModelMessage], info: AgentInfo):
+        entry = self.store.get(request_key(messages))
+        if entry is not None:
+            return _load_response(entry["response"]), entry.get("latency_ms")
+        if REPLAY_STRICT:
+            raise ReplayMiss("No recorded model response for this request")
+        if info.output_tools:
+            tool = info.output_tools[0]
+            return ModelResponse(parts=[ToolCallPart(tool.name, _placeholder_args(tool.parameters_json_schema))]), None
+        return ModelResponse(parts=[TextPart("Replay placeholder")]), None
+
+    async def _respond(self, messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+        response, latency = self._lookup(messages, info)
+        await asyncio.sleep(replay_delay(latency))
+        return response
+
+    async def _respond_stream(self, messages: List[ModelMessage], info: AgentInfo):
+        response, latency = self._lookup(messages, info)
+        await asyncio.sleep(replay_delay(latency))
+        text = "".join(p.content for p in response.parts if isinstance(p, TextPart))
+        tool_calls = [p for p in response.parts if isinstance(p, ToolCallPart)]
+        if tool_calls:
+            yield {i: DeltaToolCall(name=p.tool_name, json_args=p.args_as_json_str()) for i, p in enumerate(tool_calls)}
+        elif text:
+            yield text
+
+
+_model_store = None
+
+
+def model_store() -> RecordingStore:
+    global _model_store
+    if _model_store is None:
+        _model_store = RecordingStore("model")
+    return _model_store
+
+
+def build_model(model_name: str) -> Model:
+    if VERTEX_MODE == "replay":
+        log.info("Serving model responses from recordings", model=model_name)
+        return RateLimitedModel(ReplayModel(model_name, model_store()))
+
+    from pydantic_ai.models.gemini import GeminiModel
+    model: Model = GeminiModel(model_name, provider='google-vertex')
+    if VERTEX_MODE == "record":
+        log.info("Recording model exchanges", model=model_name)
+        model = RecordingModel(model, model_store())
+    return RateLimitedModel(model)
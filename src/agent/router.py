@@ -0,0 +1,93 @@
+"""Local routing for the model cascade.
+
+Decides, without calling a model, whether a request is simple enough for
+the fast tier (``FAST_MODEL_NAME``) or needs the full model from the start:
+
+- several patients in one message, a patient with more than
+  ``ROUTE_MAX_SYMPTOMS`` symptoms, or a symptom the precomputed symptom
+  index doesn't know go to the full model;
+- otherwise the retrieval confidence decides: the top FAISS cosine score of
+  the patient's weakest symptom, or of the question itself, must reach
+  ``ROUTE_MIN_SCORE`` (the same scale as the agent's insufficient-evidence
+  cut-off of 0.4).
+
+The fast tier's answer can still be escalated afterwards (see
+``agent._run_agent``).
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from src.tools.patient_data import patient_tool
+from src.tools.rag_search import rag_tool
+
+load_dotenv()
+
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME", "")
+ROUTE_MIN_SCORE = float(os.getenv("ROUTE_MIN_SCORE", "0.6"))
+ROUTE_MAX_SYMPTOMS = int(os.getenv("ROUTE_MAX_SYMPTOMS", "2"))
+# Same k as search_guidelines, so a search the agent repeats hits the result cache
+ROUTE_SEARCH_K = 4
+
+PATIENT_ID_PATTERN = re.compile(r"\bPT-[A-Za-z0-9]+\b", re.IGNORECASE)
+
+
+@dataclass
+class Route:
+    tier: str  # "fast" or "full"
+    reason: str
+    patients: int = 0
+    symptoms: int = 0
+    score: Optional[float] = None
+
+
+async def route_request(message: str) -> Route:
+    if not FAST_MODEL_NAME:
+        return Route("full", "no_fast_model")
+
+    patient_ids = {p.upper() for p in PATIENT_ID_PATTERN.findall(message)}
+    if len(patient_ids) > 1:
+        return Route("full", "multiple_patients", patients=len(patient_ids))
+    if patient_ids:
+        record = await patient_tool.get_patient_data(patient_ids.pop())
+        if record is None:
+            # The agent only has to say so
+            return Route("fast", "unknown_patient", patients=1)
+        symptoms = record.get("symptoms") or []
+        if len(symptoms) > ROUTE_MAX_SYMPTOMS:
+            return Route("full", "many_symptoms", patients=1, symptoms=len(symptoms))
+        if any(rag_tool.resolve_symptom(symptom) is None for symptom in symptoms):
+            return Route("full", "unknown_symptom", patients=1, symptoms=len(symptoms))
+        scores = []
+        for symptom in symptoms:
+            score = await _top_score(symptom)
+            if score is None:
+                return Route("full", "retrieval_failed", patients=1, symptoms=len(symptoms))
+            scores.append(score)
+        score = min(scores) if scores else None
+        if score is None or score < ROUTE_MIN_SCORE:
+            return Route("full", "low_confidence", patients=1, symptoms=len(symptoms), score=score)
+        return Route("fast", "simple_patient", patients=1, symptoms=len(symptoms), score=score)
+
+    # General question: how well does the guideline cover it? This costs one
+    # query embedding; the agent usually searches rephrased queries, which are
+    # embedded separately.
+    score = await _top_score(message)
+    if score is None:
+        return Route("full", "retrieval_failed")
+    if score < ROUTE_MIN_SCORE:
+        return Route("full", "low_confidence", score=score)
+    return Route("fast", "simple_question", score=score)
+
+
+async def _top_score(query: str) -> Optional[float]:
+    """Cosine similarity of the best passage for ``query``; None if the search failed."""
+    try:
+        results = await rag_tool.search(query, k=ROUTE_SEARCH_K)
+    except Exception:
+        return None
+    return results[0]["score"] if results else 0.0
@@ -0,0 +1,329 @@
+"""Vectorized NG12 pre-triage without the LLM.
+
+The referral criteria that only depend on structured patient fields (age,
+sex, smoking history, symptoms, symptom duration) are encoded as a versioned
+decision table in ``data/rules/ng12_rules.json``. A whole cohort is encoded
+once into NumPy arrays (one boolean column per symptom the table mentions)
+and every rule becomes a handful of vectorized masks, so triage costs a few
+microseconds per patient instead of an agent run.
+
+Symptoms are matched strictly: the table keeps NG12's qualifiers
+("unexplained visible haematuria", "iron-deficiency anaemia") and accepts
+only the spellings it lists, not the symptom index's broader aliases. A
+symptom the broad aliases would map onto a rule symptom but the table does
+not accept (plain "haematuria", "fatigue" without "unexplained") is a near
+miss that only a clinician-grade reading can settle.
+
+A patient is decided by the rules when a rule matches and nothing about
+them could change the outcome: either the match is already the most urgent
+category, or there are no near misses and every symptom they report is
+covered by the table. Everyone else (no match, or a near miss or an
+unrecognized symptom next to a lesser match) is ambiguous and goes to the
+agent::
+
+    python -m src.agent.rules                      # triage the patient registry
+    python -m src.agent.rules --synthetic 1000000  # throughput on a synthetic cohort
+    python -m src.agent.rules --check              # regression check against the golden set
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from src.agent.agent import ClinicalAssessment, ReferralCitation
+from src.embeddings.symptom_index import build_alias_map, normalize_symptom
+
+load_dotenv()
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(PROJECT_ROOT, "data", "rules", "ng12_rules.json"))
+
+# Most urgent first; a patient gets the most urgent category any rule assigns
+SEVERITY = ["URGENT REFERRAL", "URGENT INVESTIGATION", "ROUTINE", "SAFETY NETTING"]
+TRIAGE_PAGE_SIZE = 10_000
+
+
+# Encoded by min_duration_days rather than by the symptom's name
+DURATION_QUALIFIERS = {"persistent"}
+UNEXPLAINED = "unexplained "
+
+
+def rule_key(symptom: str) -> str:
+    """Lowercase and tidy punctuation, keeping qualifiers ("unexplained", "visible")."""
+    tokens = re.sub(r"[^a-z0-9\- ]+", " ", str(symptom).lower()).split()
+    return " ".join(t for t in tokens if t not in DURATION_QUALIFIERS)
+
+
+@dataclass
+class RuleTable:
+    version: str
+    source: str
+    rules: List[Dict]
+    # Base symptom -> spellings the table accepts for it
+    aliases: Dict[str, List[str]] = field(default_factory=dict)
+    # Canonical symptom -> column of the symptom matrix
+    columns: Dict[str, int] = field(default_factory=dict)
+    _aliases: Dict[str, str] = field(default_factory=dict, repr=False)
+    # The symptom index's aliases, and its canonicals of the rule symptoms, to spot near misses
+    _broad_aliases: Dict[str, str] = field(default_factory=build_alias_map, repr=False)
+    _broad: set = field(default_factory=set, repr=False)
+    _keys: Dict[str, Tuple[Tuple[int, ...], bool]] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        for canonical, spellings in self.aliases.items():
+            for spelling in [canonical, *spellings]:
+                self._aliases[rule_key(spelling)] = rule_key(canonical)
+        for rule in self.rules:
+            rule["all_of"] = [self.canonical(s) for s in rule.get("all_of", [])]
+            rule["any_of"] = [self.canonical(s) for s in rule.get("any_of", [])]
+            for symptom in rule["all_of"] + rule["any_of"]:
+                self.columns.setdefault(symptom, len(self.columns))
+        for term in [*self.columns, *self._aliases]:
+            self._broad.add(self.broad_canonical(term))
+        self.ranks = np.array([SEVERITY.index(r["assessment"]) for r in self.rules])
+        self.by_id = {r["id"]: r for r in self.rules}
+
+    def broad_canonical(self, symptom: str) -> str:
+        key = normalize_symptom(str(symptom))
+        return self._broad_aliases.get(key, key)
+
+    def canonical(self, symptom: str) -> str:
+        key = rule_key(symptom)
+        if key.startswith(UNEXPLAINED):
+            base = key[len(UNEXPLAINED):]
+            return UNEXPLAINED + self._aliases.get(base, base)
+        return self._aliases.get(key, key)
+
+    def lookup(self, symptom: str) -> Tuple[Tuple[int, ...], bool]:
+        """Columns the symptom sets, and whether it is a near miss.
+
+        "unexplained X" also sets the column of plain "X". A symptom that sets
+        no column is a near miss when the symptom index's aliases would have
+        matched it to a rule symptom.
+        """
+        # Memoized: cohorts repeat a small vocabulary millions of times
+        try:
+            return self._keys[symptom]
+        except KeyError:
+            pass
+        canonical = self.canonical(symptom)
+        names = [canonical]
+        if canonical.startswith(UNEXPLAINED):
+            names.append(canonical[len(UNEXPLAINED):])
+        cols = tuple(self.columns[n] for n in names if n in self.columns)
+        near_miss = False
+        if not cols:
+            near_miss = self.broad_canonical(symptom) in self._broad
+        result = self._keys[symptom] = (cols, near_miss)
+        return result
+
+
+@lru_cache(maxsize=None)
+def load_rules(path: str = RULES_PATH) -> RuleTable:
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    return RuleTable(version=table["version"], source=table["source"], rules=table["rules"],
+                     aliases=table.get("aliases", {}))
+
+
+def _symptom_matrix(records: List[Dict], table: RuleTable):
+    """Multi-hot symptom matrix, plus per-patient counts of symptoms no rule
+    covers and of near misses."""
+    rows, cols = [], []
+    unknown = np.zeros(len(records), dtype=np.int32)
+    near_misses = np.zeros(len(records), dtype=np.int32)
+    lookup = table.lookup
+    for i, record in enumerate(records):
+        symptoms = record.get("symptoms") or []
+        for symptom in [symptoms] if isinstance(symptoms, str) else symptoms:
+            columns, near_miss = lookup(symptom)
+            if columns:
+                rows.extend([i] * len(columns))
+                cols.extend(columns)
+            elif near_miss:
+                near_misses[i] += 1
+            else:
+                unknown[i] += 1
+    matrix = np.zeros((len(records), len(table.columns)), dtype=bool)
+    matrix[rows, cols] = True
+    return matrix, unknown, near_misses
+
+
+def evaluate(records: List[Dict], table: RuleTable) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Boolean (patients x rules) match matrix, plus per-patient unknown symptom
+    and near-miss counts."""
+    frame = pd.DataFrame.from_records(
+        records, columns=["age", "gender", "smoking_history", "symptom_duration_days"])
+    age = pd.to_numeric(frame["age"], errors="coerce").to_numpy(dtype=float)
+    duration = pd.to_numeric(frame["symptom_duration_days"], errors="coerce").to_numpy(dtype=float)
+    sex = frame["gender"].fillna("").astype(str).str.strip().str.lower().str[:1].to_numpy()
+    smoking = frame["smoking_history"].fillna("").astype(str).str.lower()
+    never = smoking.str.contains("never|non", regex=True).to_numpy()
+    ever = smoking.str.contains("smok").to_numpy() & ~never
+    symptoms, unknown, near_misses = _symptom_matrix(records, table)
+
+    # Missing values compare False, so a rule never matches on a field it cannot see
+    matches = np.ones((len(records), len(table.rules)), dtype=bool)
+    for j, rule in enumerate(table.rules):
+        m = matches[:, j]
+        if "min_age" in rule:
+            m &= age >= rule["min_age"]
+        if "max_age" in rule:
+            m &= age <= rule["max_age"]
+        if "sex" in rule:
+            m &= sex == rule["sex"][0]
+        if rule.get("smoking") == "ever":
+            m &= ever
+        elif rule.get("smoking") == "never":
+            m &= never
+        if "min_duration_days" in rule:
+            m &= duration >= rule["min_duration_days"]
+        if rule["all_of"]:
+            m &= symptoms[:, [table.columns[s] for s in rule["all_of"]]].all(axis=1)
+        if rule["any_of"]:
+            hits = symptoms[:, [table.columns[s] for s in rule["any_of"]]].sum(axis=1)
+            m &= hits >= rule.get("min_count", 1)
+    return matches, unknown, near_misses
+
+
+def triage(records: Iterable[Dict], table: Optional[RuleTable] = None) -> pd.DataFrame:
+    """Triage a cohort: one row per record with ``patient_id``, ``assessment``
+    (None when ambiguous, i.e. the agent should decide) and the matched ``rules``.
+    """
+    table = table or load_rules()
+    records = list(records)
+    if not records:
+        return pd.DataFrame(columns=["patient_id", "assessment", "rules"])
+    matches, unknown, near_misses = evaluate(records, table)
+
+    best = np.where(matches, table.ranks, len(SEVERITY)).min(axis=1)
+    # A near miss or an unknown symptom could only make the category more
+    # urgent, so neither matters once the match is already the most urgent
+    decided = (best < len(SEVERITY)) & ((best == 0) | ((near_misses == 0) & (unknown == 0)))
+    rule_ids = np.array([r["id"] for r in table.rules])
+    rows, cols = np.nonzero(matches)
+    per_patient = np.split(rule_ids[cols], np.searchsorted(rows, np.arange(1, len(records))))
+    labels = np.array(SEVERITY + [None], dtype=object)[best]
+    return pd.DataFrame({
+        "patient_id": [r.get("patient_id") for r in records],
+        "assessment": pd.Series(np.where(decided, labels, None), dtype=object),
+        "rules": [list(ids) for ids in per_patient],
+    })
+
+
+def to_assessment(record: Dict, assessment: str, rules: List[str], table: Optional[RuleTable] = None) -> ClinicalAssessment:
+    """Render a rule decision in the same shape as an agent assessment."""
+    table = table or load_rules()
+    applied = [table.by_id[r] for r in rules if table.by_id[r]["assessment"] == assessment]
+    symptoms = ", ".join(record.get("symptoms") or []) or "no recorded symptoms"
+    return ClinicalAssessment(
+        summary=f"{record.get('age')}-year-old {str(record.get('gender', '')).lower()} "
+                f"({record.get('smoking_history', 'smoking history unknown')}) with {symptoms}.",
+        assessment=assessment,
+        reasoning=" ".join(
+            f"Meets NG12 {r['recommendation']} ({r['cancer']} cancer): {r['text']}" for r in applied
+        ) + f" [rules {table.version}]",
+        citations=[ReferralCitation(source=table.source, page=r["page"], excerpt=r["text"]) for r in applied],
+    )
+
+
+async def _registry_records(page_size: int = TRIAGE_PAGE_SIZE):
+    from src.tools.patient_data import patient_tool
+
+    after_id = None
+    try:
+        while True:
+            page = await patient_tool.find_patients(limit=page_size, after_id=after_id)
+            if not page:
+                return
+            yield page
+            after_id = page[-1]["patient_id"]
+    finally:
+        await patient_tool.store.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Pre-triage a cohort with the NG12 decision table")
+    parser.add_argument("--synthetic", type=int, help="Triage N synthetic patients instead of the registry")
+    parser.add_argument("--rules", default=RULES_PATH, help="Decision table (JSON)")
+    parser.add_argument("--output", help="Write per-patient results to this CSV file")
+    parser.add_argument("--check", action="store_true",
+                        help="Check the registry's decisions against the golden set; exit 1 on a mismatch")
+    args = parser.parse_args()
+
+    table = load_rules(args.rules)
+    if args.synthetic:
+        from src.evaluation.patient_benchmark import synthetic_patient
+
+        rng = random.Random(0)
+        cohort = [synthetic_patient(i, rng) for i in range(args.synthetic)]
+
+        async def pages():
+            for i in range(0, len(cohort), TRIAGE_PAGE_SIZE):
+                yield cohort[i:i + TRIAGE_PAGE_SIZE]
+    else:
+        pages = _registry_records
+
+    frames, elapsed = [], 0.0
+    async for page in pages():
+        start = time.perf_counter()
+        frames.append(triage(page, table))
+        elapsed += time.perf_counter() - start
+    results = pd.concat(frames, ignore_index=True) if frames else triage([], table)
+
+    counts = results["assessment"].fillna("AMBIGUOUS").value_counts().to_dict()
+    print(json.dumps({
+        "rules_version": table.version,
+        "patients": len(results),
+        **counts,
+        "triage_s": round(elapsed, 3),
+        "patients_per_s": round(len(results) / elapsed) if elapsed else None,
+    }))
+    if args.output:
+        results.assign(rules=results["rules"].str.join(";")).to_csv(args.output, index=False)
+        print(f"Results saved to {args.output}")
+    if args.check and not args.synthetic:
+        failures = check_golden(results)
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if failures:
+            raise SystemExit(1)
+        print("Golden set check passed")
+
+
+def check_golden(results: pd.DataFrame) -> List[str]:
+    """Compare rule decisions with the golden set's patient cases.
+
+    A patient the rules decide must get one of the case's
+    ``expected_assessment``; a case with ``rules_assessment`` must be
+    decided by the rules, with that category.
+    """
+    from src.evaluation.evaluate import load_golden
+
+    decided = dict(zip(results["patient_id"], results["assessment"]))
+    failures = []
+    for case in load_golden():
+        pid = case.get("patient_id")
+        if pid not in decided:
+            continue
+        got, required = decided[pid], case.get("rules_assessment")
+        if required and got != required:
+            failures.append(f"{case['id']}: rules gave {got or 'AMBIGUOUS'}, expected {required}")
+        elif got and got not in case["expected_assessment"]:
+            failures.append(f"{case['id']}: rules gave {got}, expected one of {case['expected_assessment']}")
+    return failures
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
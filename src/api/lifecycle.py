@@ -0,0 +1,128 @@
+"""Startup, warm-up and readiness of the API's shared resources.
+
+Importing the API loads nothing. The lifespan hook loads each component
+(chat database, patient records, guideline index, agent model, job queue)
+and records whether it is ready, how long it took and why it failed, then
+starts the job workers and the chat history maintenance task. With
+``WARMUP=1`` a background task then pre-touches the mapped index pages and
+opens the embedding and database connections, so the first real request
+doesn't pay for them. ``/ready`` reports all of this; ``/health`` only says
+the process is up.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.agent.agent import load_models
+from src.agent.jobs import job_workers
+from src.database.db_manager import db_manager
+from src.database.job_queue import job_queue
+from src.database.maintenance import history_maintenance
+from src.tools.patient_data import patient_tool
+from src.tools.rag_search import rag_tool
+from src.tools.telemetry import get_logger
+
+load_dotenv()
+
+log = get_logger("lifecycle")
+
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_QUERY = "suspected cancer referral criteria"
+
+# Components that must load for the API to report ready
+COMPONENTS = {
+    "database": db_manager.initialize,
+    "patients": patient_tool.load,
+    "index": rag_tool.load,
+    "model": load_models,
+    "jobs": job_queue.initialize,
+}
+
+
+class Lifecycle:
+    def __init__(self):
+        self.components: Dict[str, Dict[str, Any]] = {
+            name: {"ready": False, "load_ms": None, "error": None} for name in COMPONENTS
+        }
+        self.warmup: Dict[str, Any] = {"enabled": WARMUP, "done": False, "ms": None, "errors": []}
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def _load(self, name: str, loader: Callable):
+        status = self.components[name]
+        start = time.perf_counter()
+        try:
+            loader()
+            status.update(ready=True, error=None)
+        except Exception as e:
+            # Fail soft: the API still starts and /ready says what is missing
+            status.update(ready=False, error=f"{type(e).__name__}: {e}")
+            log.error("Component failed to load", component=name, error=status["error"])
+        status["load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def startup(self):
+        for name, loader in COMPONENTS.items():
+            # Index and patient loads read files; keep the event loop free
+            await asyncio.to_thread(self._load, name, loader)
+            log.info("Component loaded", component=name, **self.components[name])
+        if self.components["jobs"]["ready"]:
+            job_workers.start()
+        if self.components["database"]["ready"]:
+            history_maintenance.start()
+        if WARMUP:
+            self._warmup_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self):
+        start = time.perf_counter()
+        steps = {
+            "index_pages": lambda: asyncio.to_thread(rag_tool.touch_pages),
+            "embedding_client": lambda: rag_tool._embed_query(WARMUP_QUERY),
+            "database_pool": lambda: db_manager.get_recent("__warmup__", 1),
+        }
+        for step, run in steps.items():
+            try:
+                await run()
+            except Exception as e:
+                self.warmup["errors"].append(f"{step}: {type(e).__name__}: {e}")
+                log.warning("Warm-up step failed", step=step, error=str(e))
+        self.warmup.update(done=True, ms=round((time.perf_counter() - start) * 1000, 1))
+        log.info("Warm-up finished", ms=self.warmup["ms"], errors=len(self.warmup["errors"]))
+
+    def readiness(self) -> Dict[str, Any]:
+        return {
+            "ready": all(c["ready"] for c in self.components.values()),
+            "components": self.components,
+            "warmup": self.warmup,
+        }
+
+    async def shutdown(self):
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+            try:
+                await self._warmup_task
+            except asyncio.CancelledError:
+                pass
+        # Running jobs go back to the queue for the next start
+        await job_workers.stop()
+        await job_queue.close()
+        await history_maintenance.stop()
+        # Commit any queued chat messages before the process exits
+        await db_manager.close()
+        await patient_tool.store.close()
+
+
+lifecycle = Lifecycle()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await lifecycle.startup()
+    in_docker = os.path.exists('/.dockerenv')
+    url = "http://localhost:8001" if in_docker else "http://localhost:8000"
+    log.info("API is up", docs=f"{url}/docs", ready=f"{url}/ready")
+    yield
+    await lifecycle.shutdown()
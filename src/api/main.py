@@ -1,25 +1,53 @@
+import time
 from fastapi import FastAPI
 import uvicorn
 from dotenv import load_dotenv
+from src.api.lifecycle import lifespan
 from src.api.routes import router
+from src.tools.telemetry import http_in_flight, http_seconds
 
 load_dotenv()
 
 app = FastAPI(
     title="Clinical Decision Agent",
     version="1.0.0",
-    description="Clinical Decision Support System"
+    description="Clinical Decision Support System",
+    lifespan=lifespan,
 )
 
-@app.on_event("startup")
-async def startup_event():
-    import os
-    in_docker = os.path.exists('/.dockerenv')
-    url = "http://localhost:8001" if in_docker else "http://localhost:8000"
-    print("\n" + "="*50)
-    print(f"API is ready! Access Docs at: {url}/docs")
-    print("="*50 + "\n")
 
+class MetricsMiddleware:
+    """Per-route latency histogram and in-flight gauge.
+
+    Plain ASGI, so streamed responses are timed until their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            # The matched route template keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_seconds.observe(time.perf_counter() - start, method=scope["method"], route=route, status=status)
+
+
+app.add_middleware(MetricsMiddleware)
 app.include_router(router)
 
 if __name__ == "__main__":
@@ -1,86 +1,276 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic_ai.exceptions import UsageLimitExceeded
-from src.api.schemas import ChatRequest, ChatResponse, Citation, HistoryResponse, Message
-from src.database.db_manager import DatabaseManager
-from src.agent.agent import run_chat, ClinicalAssessment
+from src.api.schemas import BatchAssessRequest, ChatRequest, ChatResponse, Citation, CohortResponse, HistoryResponse, JobResponse, Message, ProfileRequest
+from src.database.db_manager import HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE, db_manager
+from src.database.job_queue import job_queue
+from src.database.maintenance import history_maintenance
+from src.database.patient_store import MAX_COHORT_PAGE
+from src.agent.agent import agent_flights, run_chat, stream_chat, format_answer, ClinicalAssessment
+from src.agent.batch import assess_patients
+from src.agent.jobs import job_workers
+from src.api.lifecycle import lifecycle
+from src.tools.patient_data import patient_tool
+from src.tools.rag_search import rag_tool
+from src.tools.deadline import budget_from_header, request_deadline
+from src.tools.profiler import ADMIN_TOKEN_HEADER, FORMATS, PROFILE_DIR, admin_allowed, profile_trigger
+from src.tools.rate_limiter import rate_limiter
+from src.tools.telemetry import Counter, get_logger, registry, render
 
 router = APIRouter()
-db = DatabaseManager()
+db = db_manager
+log = get_logger("api")
+
+# How often a running /chat checks whether its client is still there
+DISCONNECT_POLL_S = 0.5
+# nginx's "client closed request"; nobody is left to read it
+CLIENT_CLOSED_STATUS = 499
+
+disconnects = registry.register(Counter(
+    "clinical_client_disconnects_total", "Requests whose work was cancelled because the client went away"
+))
+
+
+async def _cancel_on_disconnect(http_request: Request, work, session_id: str):
+    """Await ``work``, cancelling it if the client disconnects first.
+
+    Returns None when the client went away.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                disconnects.inc()
+                log.info("Client disconnected, cancelling", session_id=session_id)
+                return None
+    finally:
+        task.cancel()
+
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    """Process a user message using the PydanticAI agent."""
-    print("\n" + "*"*70)
-    print(f"[API] Received POST /chat request")
-    print(f"[API] Session ID: {request.session_id}")
-    print(f"[API] Message: {request.message}")
-    print("*"*70)
-    
+async def chat_endpoint(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    x_request_timeout: Optional[str] = Header(None, description="Time budget in seconds (default REQUEST_DEADLINE_S)"),
+    x_profile: Optional[str] = Header(None, description="Set to 1 to write a sampling profile of this request"),
+):
+    """Process a user message using the PydanticAI agent.
+
+    The turn is cut short at the request deadline (``partial`` in the
+    response) and abandoned if the client disconnects. Profiled requests
+    name their profile file in the ``X-Profile-File`` response header.
+    """
     try:
-        print(f"[API] Saving user message to database...")
-        await db.add_message(request.session_id, "user", request.message)
-        
-        print(f"[API] Calling agent.run_chat()...")
-        result: ClinicalAssessment = await run_chat(request.session_id, request.message)
-        print(f"[API] Agent returned result successfully")
-        
-        answer = f"**Assessment:** {result.assessment}\n\n**Reasoning:** {result.reasoning}"
-        
-        citations = [
-            Citation(source=c.source, page=c.page, excerpt=c.excerpt)
-            for c in result.citations
-        ]
-        print(f"[API] Formatted {len(citations)} citations")
-        
-        print(f"[API] Saving assistant response to database...")
-        await db.add_message(request.session_id, "assistant", answer)
-        
-        print(f"[API] Preparing response...")
-        response = ChatResponse(
-            session_id=request.session_id,
-            answer=answer,
-            assessment=result.assessment,
-            reasoning=result.reasoning,
-            citations=citations
-        )
-        
-        print("*"*70)
-        print(f"[API] Returning successful response")
-        print("*"*70 + "\n")
-        return response
-        
+        with profile_trigger.maybe(f"chat-{request.session_id}", x_profile) as profile, \
+                request_deadline(budget_from_header(x_request_timeout)):
+            # run_chat persists both sides of the turn
+            result: Optional[ClinicalAssessment] = await _cancel_on_disconnect(
+                http_request, run_chat(request.session_id, request.message), request.session_id
+            )
+        if profile and profile["path"]:
+            response.headers["X-Profile-File"] = os.path.basename(profile["path"])
+        if result is None:
+            return Response(status_code=CLIENT_CLOSED_STATUS)
+        return _build_response(request.session_id, result)
     except Exception as e:
-        
-        print("\n" + "!"*70)
-        print(f"[API ERROR] Exception occurred: {type(e).__name__}")
-        print(f"[API ERROR] Message: {str(e)}")
-        
-        if isinstance(e, UsageLimitExceeded):
-            print("[API ERROR] DIAGNOSIS: Agent made too many LLM requests")
-            print("[API ERROR] This indicates the model is struggling with:")
-            print("[API ERROR]   - Structured output format (ClinicalAssessment)")
-            print("[API ERROR]   - Or making excessive tool calls")
-            print("[API ERROR] Consider simplifying the query or output format")
-            error_msg = "The agent made too many requests while processing your query. Please try a simpler question or contact support."
-        else:
-            error_msg = str(e)
-            
-        print("!"*70)
-        import traceback
-        traceback.print_exc()
-        print("!"*70 + "\n")
-        raise HTTPException(status_code=500, detail=error_msg)
+        raise HTTPException(status_code=500, detail=_describe_error(e, request.session_id))
+
+
+def _build_response(session_id: str, result: ClinicalAssessment) -> ChatResponse:
+    citations = [
+        Citation(source=c.source, page=c.page, excerpt=c.excerpt, chunk_id=c.chunk_id)
+        for c in result.citations
+    ]
+    return ChatResponse(
+        session_id=session_id,
+        answer=format_answer(result),
+        assessment=result.assessment,
+        reasoning=result.reasoning,
+        citations=citations,
+        partial=result.partial,
+    )
+
+
+def _describe_error(e: Exception, session_id: str) -> str:
+    if isinstance(e, UsageLimitExceeded):
+        # The model is struggling with the structured output format
+        # (AgentAnswer) or making excessive tool calls.
+        log.error("Agent exceeded its request limit", session_id=session_id, error=str(e))
+        return "The agent made too many requests while processing your query. Please try a simpler question or contact support."
+    log.error("Chat request failed", session_id=session_id, error=f"{type(e).__name__}: {e}", exc_info=e)
+    return str(e)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    x_request_timeout: Optional[str] = Header(None, description="Time budget in seconds (default REQUEST_DEADLINE_S)"),
+    x_profile: Optional[str] = Header(None, description="Set to 1 to write a sampling profile of this request"),
+):
+    """Stream agent progress as server-sent events.
+
+    Emits ``start``, ``tool_call``, ``tool_result`` and ``partial`` events
+    while the agent runs; the final event is ``result`` (a ChatResponse)
+    or ``error``. The response stops (and the run with it) when the client
+    disconnects.
+    """
+    budget = budget_from_header(x_request_timeout)
+
+    async def event_stream():
+        yield _sse("start", {"session_id": request.session_id})
+        # Set here: the stream runs after the endpoint has returned
+        with profile_trigger.maybe(f"chat-stream-{request.session_id}", x_profile), request_deadline(budget):
+            try:
+                async for event in stream_chat(request.session_id, request.message):
+                    if event["event"] == "result":
+                        response = _build_response(request.session_id, event["data"])
+                        yield _sse("result", response.model_dump())
+                    else:
+                        yield _sse(event["event"], event["data"])
+            except Exception as e:
+                yield _sse("error", {"detail": _describe_error(e, request.session_id)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Longest a GET /jobs/{job_id} waits for the job to finish before answering
+MAX_JOB_WAIT_S = 30
+JOB_WAIT_POLL_S = 0.25
+
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    result = None
+    if job["status"] == "done" and job["kind"] == "chat":
+        result = _build_response(job["payload"]["session_id"], ClinicalAssessment(**job["result"]))
+    return JobResponse(
+        job_id=job["job_id"],
+        kind=job["kind"],
+        status=job["status"],
+        attempts=job["attempts"],
+        position=job["position"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"],
+        result=result,
+        error=job["error"],
+    )
+
+
+@router.post("/jobs/chat", response_model=JobResponse, status_code=202)
+async def submit_chat_job(request: ChatRequest):
+    """Queue an agent run and return its job id at once; poll ``GET /jobs/{job_id}``.
+
+    The job is persisted, so it survives client disconnects and API restarts.
+    """
+    job_id = await job_workers.submit("chat", {"session_id": request.session_id, "message": request.message})
+    return _job_response(await job_queue.get(job_id))
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=MAX_JOB_WAIT_S, description="Seconds to wait for the job to finish"),
+):
+    """Job status, with the ChatResponse once done or the error once failed."""
+    deadline = time.monotonic() + wait
+    while True:
+        job = await job_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        if job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+            return _job_response(job)
+        await asyncio.sleep(JOB_WAIT_POLL_S)
+
+
+@router.post("/assess/batch")
+async def assess_batch(request: BatchAssessRequest):
+    """Assess many patients concurrently, streaming NDJSON as each finishes.
+
+    Each line is a result (patient_id, status, source, latency_ms and the
+    assessment or error); the last line is a summary for the whole batch.
+    Patients the NG12 rule table can decide are streamed first with
+    ``"source": "rules"``.
+    """
+    if request.all_patients:
+        # Paged through the registry as the batch runs, never loaded whole
+        patient_ids = patient_tool.iter_patient_ids()
+    else:
+        patient_ids = list(request.patient_ids or [])
+        patient_ids += [p["patient_id"] for p in request.patients or [] if "patient_id" in p]
+        if not patient_ids:
+            raise HTTPException(status_code=400, detail="No patients given")
+
+    async def lines():
+        async for item in assess_patients(
+            patient_ids, concurrency=request.concurrency, pre_triage=request.pre_triage, persist=request.persist
+        ):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/patients", response_model=CohortResponse)
+async def find_patients(
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    gender: Optional[str] = None,
+    smoking_history: Optional[str] = None,
+    symptom: Optional[str] = Query(None, description="Recorded symptom, matched through the symptom vocabulary's aliases"),
+    after_id: Optional[str] = Query(None, description="Only patients after this id"),
+    limit: int = Query(100, ge=1, le=MAX_COHORT_PAGE),
+):
+    """Cohort query over the patient registry, ordered by patient_id."""
+    filters = {"min_age": min_age, "max_age": max_age, "gender": gender,
+               "smoking_history": smoking_history, "symptom": symptom}
+    patients = await patient_tool.find_patients(limit=limit + 1, after_id=after_id, **filters)
+    has_more = len(patients) > limit
+    patients = patients[:limit]
+    return CohortResponse(
+        total=await patient_tool.count_patients(**filters),
+        patients=patients,
+        next_after_id=patients[-1]["patient_id"] if has_more else None,
+    )
+
 
 @router.get("/chat/{session_id}/history", response_model=HistoryResponse)
-async def get_history(session_id: str):
-    """Retrieve conversation history for a session."""
-    history = await db.get_history(session_id)
+async def get_history(
+    session_id: str,
+    before_id: Optional[int] = Query(None, description="Only messages older than this id"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+):
+    """Retrieve conversation history for a session, newest page first.
+
+    Messages within a page are in chronological order. Follow
+    ``next_before_id`` to page back through older messages.
+    """
+    # One extra row tells us whether an older page exists
+    history = await db.get_history(session_id, before_id=before_id, limit=limit + 1)
+    has_more = len(history) > limit
+    history = history[-limit:]
     return HistoryResponse(
         session_id=session_id,
         history=[
-            Message(role=m["role"], content=m["content"], timestamp=str(m["timestamp"]))
+            Message(id=m["id"], role=m["role"], content=m["content"], timestamp=str(m["timestamp"]))
             for m in history
-        ]
+        ],
+        next_before_id=history[0]["id"] if has_more else None,
     )
 
 @router.delete("/chat/{session_id}")
@@ -91,5 +281,107 @@ async def clear_history(session_id: str):
 
 @router.get("/health")
 def health_check():
-    """Health check endpoint."""
+    """Liveness: the process is up and serving requests."""
     return {"status": "healthy"}
+
+@router.get("/ready")
+def readiness_check():
+    """Readiness: every component loaded (503 otherwise), with load times and warm-up state."""
+    report = lifecycle.readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@registry.collector
+def _runtime_metrics():
+    """Cache, coalescing, database and rate limiter state, read at scrape time."""
+    caches = rag_tool.cache_stats()
+    yield ("clinical_cache_hits_total", "counter", "Cache hits",
+           [({"cache": name}, c["hits"]) for name, c in caches.items()])
+    yield ("clinical_cache_misses_total", "counter", "Cache misses",
+           [({"cache": name}, c["misses"]) for name, c in caches.items()])
+    yield ("clinical_cache_entries", "gauge", "Entries currently cached",
+           [({"cache": name}, c["size"]) for name, c in caches.items()])
+    flights = {"agent": agent_flights.stats(), "search": rag_tool.flights.stats()}
+    yield ("clinical_coalesced_total", "counter", "Calls that joined an identical in-flight call",
+           [({"flight": name}, f["coalesced"]) for name, f in flights.items()])
+    yield ("clinical_flights_in_flight", "gauge", "Distinct calls in flight",
+           [({"flight": name}, f["in_flight"]) for name, f in flights.items()])
+    database = db.stats()
+    yield ("clinical_db_pool_connections", "gauge", "Open pooled SQLite connections",
+           [({"state": "open"}, database["pool"]["open"]), ({"state": "idle"}, database["pool"]["idle"])])
+    yield ("clinical_db_journal_pending", "gauge", "Chat messages queued for group commit",
+           [({}, database["journal"]["pending"])])
+    yield ("clinical_db_journal_written_total", "counter", "Chat messages group-committed",
+           [({}, database["journal"]["written"])])
+    maintenance = history_maintenance.stats()
+    yield ("clinical_db_maintenance_runs_total", "counter", "Chat history maintenance runs",
+           [({}, maintenance["runs"])])
+    yield ("clinical_db_archived_total", "counter", "Chat history archived by maintenance",
+           [({"kind": "sessions"}, maintenance["sessions_archived"]),
+            ({"kind": "trimmed_messages"}, maintenance["messages_trimmed"])])
+    yield ("clinical_db_reclaimed_bytes_total", "counter", "Database and WAL bytes reclaimed by maintenance",
+           [({}, maintenance["bytes_reclaimed"])])
+    jobs = job_workers.stats()
+    yield ("clinical_jobs_total", "counter", "Jobs finished by this process's workers",
+           [({"outcome": outcome}, jobs[outcome]) for outcome in ("done", "failed", "released", "lease_lost")])
+    yield ("clinical_jobs_running", "gauge", "Jobs running in this process", [({}, jobs["running"])])
+    limits = rate_limiter.stats()
+    yield ("clinical_rate_limit_rps", "gauge", "Current adaptive request rate",
+           [({"bucket": key}, b["rate"]) for key, b in limits.items()])
+    yield ("clinical_rate_limit_throttled_total", "counter", "Rate-limit errors from Vertex AI",
+           [({"bucket": key}, b["throttled"]) for key, b in limits.items()])
+
+def _require_admin(http_request: Request):
+    token = http_request.headers.get(ADMIN_TOKEN_HEADER)
+    if not admin_allowed(http_request.client.host if http_request.client else None, token):
+        raise HTTPException(status_code=403, detail="Admin routes need X-Admin-Token or a local client")
+
+
+@router.post("/admin/profile")
+def arm_profiling(request: ProfileRequest, http_request: Request):
+    """Profile the next ``requests`` chat requests of this worker process."""
+    _require_admin(http_request)
+    if request.format is not None and request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    if request.hz is not None and not 0 < request.hz <= 1000:
+        raise HTTPException(status_code=400, detail="hz must be in (0, 1000]")
+    if request.sample_rate is not None and not 0 <= request.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be in [0, 1]")
+    profile_trigger.arm(request.requests, request.hz, request.format, request.sample_rate)
+    log.info("Profiling armed", requests=request.requests, hz=profile_trigger.hz, format=profile_trigger.fmt,
+             sample_rate=profile_trigger.sample_rate)
+    return profile_trigger.stats()
+
+
+@router.get("/admin/profiles")
+def list_profiles(http_request: Request, limit: int = Query(20, ge=1, le=200)):
+    """Most recent profile files, newest first."""
+    _require_admin(http_request)
+    if not os.path.isdir(PROFILE_DIR):
+        return {"profiles": [], **profile_trigger.stats()}
+    entries = sorted((e for e in os.scandir(PROFILE_DIR) if e.is_file()),
+                     key=lambda e: e.stat().st_mtime, reverse=True)[:limit]
+    return {
+        "profiles": [{"file": e.name, "bytes": e.stat().st_size, "created_at": e.stat().st_mtime} for e in entries],
+        **profile_trigger.stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics for this worker process."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/stats")
+async def stats():
+    """Runtime statistics: rate limiter state, caches, request coalescing, the database and jobs."""
+    return {
+        "jobs": {**job_workers.stats(), "queue": await job_queue.counts()},
+        "rate_limits": rate_limiter.stats(),
+        "database": {**db.stats(), "maintenance": history_maintenance.stats()},
+        "patients": patient_tool.store.stats(),
+        "cache": rag_tool.cache_stats(),
+        "coalescing": {
+            "agent": agent_flights.stats(),
+            "search": rag_tool.flights.stats(),
+        },
+    }
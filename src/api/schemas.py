@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class ChatRequest(BaseModel):
     session_id: str
@@ -10,6 +10,8 @@ class Citation(BaseModel):
     source: str
     page: Optional[int]
     excerpt: str
+    # Guideline passage the excerpt comes from (None for rule-based citations)
+    chunk_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     session_id: str
@@ -17,8 +19,11 @@ class ChatResponse(BaseModel):
     assessment: str
     reasoning: str
     citations: List[Citation]
+    # True when the request deadline cut the agent run short
+    partial: bool = False
 
 class Message(BaseModel):
+    id: Optional[int] = None
     role: str
     content: str
     timestamp: str
@@ -26,3 +31,45 @@ class Message(BaseModel):
 class HistoryResponse(BaseModel):
     session_id: str
     history: List[Message]
+    # Pass as before_id to fetch the previous page; None when there is none
+    next_before_id: Optional[int] = None
+
+class CohortResponse(BaseModel):
+    total: int
+    patients: List[Dict[str, Any]]
+    # Pass as after_id to fetch the next page; None when there is none
+    next_after_id: Optional[str] = None
+
+class BatchAssessRequest(BaseModel):
+    patient_ids: Optional[List[str]] = None
+    # Alternatively, a patients.json-style list of records (only patient_id is used)
+    patients: Optional[List[Dict[str, Any]]] = None
+    # Assess every patient in the registry
+    all_patients: bool = False
+    concurrency: Optional[int] = None
+    # Settle clear-cut patients with the NG12 rule table first (default: RULES_PRE_TRIAGE)
+    pre_triage: Optional[bool] = None
+    # Save each agent assessment as a chat session (batch-<batch_id>-<patient_id>)
+    persist: bool = False
+
+class ProfileRequest(BaseModel):
+    # Profile this many of the next /chat and /chat/stream requests (0 disarms)
+    requests: int = 1
+    hz: Optional[float] = None
+    format: Optional[str] = None
+    # Also profile this fraction of all later requests (0 stops sampling)
+    sample_rate: Optional[float] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    # queued, running, done or failed
+    status: str
+    attempts: int = 0
+    # Jobs ahead of this one while it is queued
+    position: Optional[int] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[ChatResponse] = None
+    error: Optional[str] = None
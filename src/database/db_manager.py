@@ -1,18 +1,77 @@
+import os
 import sqlite3
-import aiosqlite
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
+from dotenv import load_dotenv
 
+from src.database.journal import MessageJournal
+from src.database.pool import ConnectionPool
+from src.tools.telemetry import get_logger, span
+
+load_dotenv()
+
+log = get_logger("db")
 
 DB_PATH = "chat_history.db"
 
+# sync:  every message is committed by its own transaction before returning
+# group: messages are queued and group-committed; callers still wait for the commit
+# async: callers return once the message is queued (reads flush the queue first)
+DB_DURABILITY = os.getenv("DB_DURABILITY", "group").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "64"))
+DB_FLUSH_INTERVAL_MS = float(os.getenv("DB_FLUSH_INTERVAL_MS", "5"))
+
+DURABILITY_MODES = ("sync", "group", "async")
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new steps; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: history reads seek by session and walk message ids
+    ["CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages (session_id, id)"],
+    # 2: let history maintenance hand freed pages back (PRAGMA incremental_vacuum);
+    #    switching an existing database over takes one full VACUUM
+    ["PRAGMA auto_vacuum = INCREMENTAL", "VACUUM"],
+    # 3: a retried job persists its turn once (messages keyed by the job's turn_id)
+    [
+        "ALTER TABLE messages ADD COLUMN turn_id TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_turn ON messages (session_id, turn_id, role) "
+        "WHERE turn_id IS NOT NULL",
+    ],
+]
+
+# How long schema setup waits for another process holding the write lock
+# (a migration's VACUUM can take a while on a large history)
+MIGRATION_BUSY_TIMEOUT_S = 60
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+
+
 class DatabaseManager:
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, durability: str = DB_DURABILITY, pool_size: int = DB_POOL_SIZE):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"DB_DURABILITY must be one of {DURABILITY_MODES}, got {durability!r}")
         self.db_path = db_path
-        self._init_db_sync()
+        self.durability = durability
+        self.initialized = False
+        # Queued writes only lose data on power loss with synchronous=NORMAL,
+        # which is the trade-off async mode opts into.
+        self.pool = ConnectionPool(db_path, pool_size, synchronous="NORMAL" if durability == "async" else "FULL")
+        self.journal = MessageJournal(self.pool, DB_BATCH_SIZE, DB_FLUSH_INTERVAL_MS / 1000)
+
+    def initialize(self):
+        """Create the schema and apply migrations; runs once, on first use."""
+        if not self.initialized:
+            self._init_db_sync()
+            self.initialized = True
+
+    def _connection(self):
+        self.initialize()
+        return self.pool.connection()
 
     def _init_db_sync(self):
         """Initialize headers synchronously to ensure tables exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=MIGRATION_BUSY_TIMEOUT_S) as conn:
             # Enable WAL mode for better concurrency
             conn.execute("PRAGMA journal_mode=WAL;")
             
@@ -33,50 +92,175 @@ class DatabaseManager:
                     FOREIGN KEY (session_id) REFERENCES sessions (session_id)
                 )
             """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS session_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT,
+                    summarized_upto INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (session_id) REFERENCES sessions (session_id)
+                )
+            """)
             conn.commit()
+            self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Apply pending MIGRATIONS, each exactly once across processes.
+
+        Every step takes the write lock (waiting out another process's step)
+        and re-reads user_version under it, so workers starting together do
+        not apply a step twice. VACUUM cannot run inside a transaction: it
+        runs after its step has committed, and if it cannot get the database
+        the step's other changes stand and only the space reclaim is missed.
+        """
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(MIGRATIONS):
+                    conn.rollback()
+                    return
+                statements = MIGRATIONS[version]
+                log.info("Applying schema migration", version=version + 1)
+                for statement in statements:
+                    if statement != "VACUUM":
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            if "VACUUM" in statements:
+                try:
+                    conn.execute("VACUUM")
+                except sqlite3.OperationalError as e:
+                    log.warning("Migration VACUUM skipped; run VACUUM on the database to apply it",
+                                version=version + 1, error=str(e))
 
     async def create_session(self, session_id: str):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
             await db.commit()
 
-    async def add_message(self, session_id: str, role: str, content: str):
-        # ensure session exists
-        await self.create_session(session_id)
-        
-        print(f"[DB] Adding message ({role}) for session {session_id}...")
+    async def add_message(self, session_id: str, role: str, content: str, turn_id: Optional[str] = None):
+        """Persist a message. With a ``turn_id``, a second message of the same
+        role for that turn is ignored, so a retried turn is stored once."""
+        self.initialize()
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
-                    (session_id, role, content)
-                )
-                await db.commit()
-            print(f"[DB] Message added successfully.")
+            with span("db.add_message"):
+                if self.durability == "sync":
+                    async with self._connection() as db:
+                        # ensure session exists
+                        await db.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+                        await db.execute(
+                            "INSERT OR IGNORE INTO messages (session_id, role, content, turn_id) VALUES (?, ?, ?, ?)",
+                            (session_id, role, content, turn_id)
+                        )
+                        await db.commit()
+                else:
+                    committed = self.journal.append(session_id, role, content, turn_id)
+                    if self.durability == "async":
+                        # Failures are logged by the journal
+                        committed.add_done_callback(lambda f: f.cancelled() or f.exception())
+                        return
+                    await committed
         except Exception as e:
-            print(f"[DB ERROR] Failed to add message: {e}")
+            log.error("Failed to add message", session_id=session_id, role=role, error=str(e))
             raise
 
-    async def get_history(self, session_id: str) -> List[Dict]:
-        print(f"[DB] Fetching history for session {session_id}...")
+    async def _before_read(self):
+        # Read-your-writes for messages still sitting in the journal
+        if self.durability == "async":
+            await self.journal.flush()
+
+    async def get_history(
+        self,
+        session_id: str,
+        after_id: int = 0,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Messages of a session in chronological order.
+
+        ``after_id`` / ``before_id`` bound the message ids (keyset
+        pagination). With a ``limit`` the newest matching messages are
+        returned, so a page costs the same however long the session is.
+        """
+        query = "SELECT id, role, content, timestamp FROM messages WHERE session_id = ? AND id > ?"
+        params: list = [session_id, after_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        if limit is not None:
+            query += " ORDER BY id DESC LIMIT ?"
+            params.append(limit)
+        else:
+            query += " ORDER BY id ASC"
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
+            with span("db.get_history"):
+                await self._before_read()
+                async with self._connection() as db:
+                    async with db.execute(query, params) as cursor:
+                        rows = await cursor.fetchall()
+            if limit is not None:
+                rows.reverse()
+            history = [{"id": row[0], "role": row[1], "content": row[2], "timestamp": row[3]} for row in rows]
+            return history
+        except Exception as e:
+            log.error("Failed to fetch history", session_id=session_id, error=str(e))
+            return []
+
+    async def get_recent(self, session_id: str, n: int) -> List[Dict]:
+        """The last ``n`` messages of a session, oldest first."""
+        return await self.get_history(session_id, limit=n)
+
+    async def get_summary(self, session_id: str) -> Tuple[str, int]:
+        """Return the rolling summary and the last message id it covers."""
+        with span("db.get_summary"):
+            async with self._connection() as db:
                 async with db.execute(
-                    "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY timestamp ASC",
+                    "SELECT summary, summarized_upto FROM session_summaries WHERE session_id = ?",
                     (session_id,)
                 ) as cursor:
-                    rows = await cursor.fetchall()
-                    history = [{"role": row["role"], "content": row["content"], "timestamp": row["timestamp"]} for row in rows]
-                    print(f"[DB] Fetched {len(history)} messages.")
-                    return history
-        except Exception as e:
-            print(f"[DB ERROR] Failed to fetch history: {e}")
-            return []
+                    row = await cursor.fetchone()
+        if row is None:
+            return "", 0
+        return row[0] or "", row[1] or 0
+
+    async def save_summary(self, session_id: str, summary: str, summarized_upto: int):
+        with span("db.save_summary"):
+            async with self._connection() as db:
+                await db.execute(
+                    """INSERT INTO session_summaries (session_id, summary, summarized_upto, updated_at)
+                       VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT(session_id) DO UPDATE SET
+                           summary = excluded.summary,
+                           summarized_upto = excluded.summarized_upto,
+                           updated_at = excluded.updated_at""",
+                    (session_id, summary, summarized_upto)
+                )
+                await db.commit()
 
     async def clear_history(self, session_id: str):
-        print(f"[DB] Clearing history for session {session_id}...")
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-            await db.commit()
-        print(f"[DB] History cleared.")
+        with span("db.clear_history"):
+            # Queued messages must land before the delete, not after it
+            await self.journal.flush()
+            async with self._connection() as db:
+                await db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                await db.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
+                await db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                await db.commit()
+        log.info("History cleared", session_id=session_id)
+
+    async def close(self):
+        """Commit queued messages and close pooled connections."""
+        await self.journal.close()
+        await self.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"durability": self.durability, "pool": self.pool.stats(), "journal": self.journal.stats()}
+
+
+# Singleton shared by the API, the agent and the evaluation tools
+db_manager = DatabaseManager()
@@ -0,0 +1,197 @@
+"""Persistent SQLite job queue.
+
+Jobs survive API restarts and reloads: a job is a row in ``JOBS_DB`` (default
+``data/jobs.db``) that moves ``queued -> running -> done | failed``. Workers
+claim the oldest queued job in one atomic ``UPDATE ... RETURNING``, so any
+number of workers across API processes can share the queue, and hold it
+under a lease they renew while the job runs. A job whose worker died (crash,
+kill, reload) is re-queued once its lease lapses, up to ``JOB_MAX_ATTEMPTS``
+attempts in total.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.database.pool import ConnectionPool
+from src.tools.telemetry import get_logger
+
+load_dotenv()
+
+log = get_logger("jobs")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(PROJECT_ROOT, "data", "jobs.db"))
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished jobs are kept this long for clients to collect their results
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+STATUSES = ("queued", "running", "done", "failed")
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        lease_until REAL
+    )""",
+    # Claims take the oldest queued job; lease checks scan the running ones
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)",
+]
+
+COLUMNS = "job_id, kind, payload, status, attempts, worker, result, error, created_at, started_at, finished_at"
+
+
+def _row(row) -> Dict[str, Any]:
+    job = dict(zip((c.strip() for c in COLUMNS.split(",")), row))
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+class JobQueue:
+    def __init__(self, db_path: str = JOBS_DB, pool_size: int = 2, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.initialized = False
+        self.pool = ConnectionPool(db_path, pool_size, synchronous="FULL")
+
+    def initialize(self):
+        """Create the schema and drop expired finished jobs; runs once, on first use."""
+        if self.initialized:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            purged = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - JOB_RETENTION_HOURS * 3600,),
+            ).rowcount
+        if purged:
+            log.info("Purged finished jobs", jobs=purged, retention_hours=JOB_RETENTION_HOURS)
+        self.initialized = True
+
+    def _connection(self):
+        self.initialize()
+        return self.pool.connection()
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        async with self._connection() as db:
+            await db.execute(
+                "INSERT INTO jobs (job_id, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), time.time()),
+            )
+            await db.commit()
+        return job_id
+
+    async def claim(self, worker: str, lease_s: float) -> Optional[Dict[str, Any]]:
+        """Take the oldest runnable job for ``worker``, or None when the queue is empty."""
+        now = time.time()
+        async with self._connection() as db:
+            # Jobs whose worker stopped renewing its lease go back to the queue
+            await db.execute(
+                """UPDATE jobs SET
+                       status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                       error = CASE WHEN attempts >= ? THEN 'Worker lost ' || attempts || ' times' END,
+                       finished_at = CASE WHEN attempts >= ? THEN ? END,
+                       worker = NULL, lease_until = NULL
+                   WHERE status = 'running' AND lease_until < ?""",
+                (self.max_attempts, self.max_attempts, self.max_attempts, now, now),
+            )
+            async with db.execute(
+                f"""UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+                       started_at = ?, lease_until = ?
+                   WHERE job_id = (SELECT job_id FROM jobs WHERE status = 'queued'
+                                   ORDER BY created_at LIMIT 1)
+                   RETURNING {COLUMNS}""",
+                (worker, now, now + lease_s),
+            ) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+        return _row(row) if row else None
+
+    async def heartbeat(self, job_id: str, worker: str, lease_s: float) -> bool:
+        """Extend the lease; False if the job was taken away from ``worker``."""
+        async with self._connection() as db:
+            cursor = await db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_s, job_id, worker),
+            )
+            await db.commit()
+            return cursor.rowcount == 1
+
+    async def _finish(self, job_id: str, worker: str, status: str, result=None, error: Optional[str] = None):
+        async with self._connection() as db:
+            await db.execute(
+                """UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL
+                   WHERE job_id = ? AND worker = ? AND status = 'running'""",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, worker),
+            )
+            await db.commit()
+
+    async def complete(self, job_id: str, worker: str, result: Any):
+        await self._finish(job_id, worker, "done", result=result)
+
+    async def fail(self, job_id: str, worker: str, error: str):
+        await self._finish(job_id, worker, "failed", error=error)
+
+    async def release(self, job_id: str, worker: str):
+        """Hand an interrupted job back to the queue without counting the attempt."""
+        async with self._connection() as db:
+            await db.execute(
+                """UPDATE jobs SET status = 'queued', attempts = attempts - 1, worker = NULL, lease_until = NULL
+                   WHERE job_id = ? AND worker = ? AND status = 'running'""",
+                (job_id, worker),
+            )
+            await db.commit()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job, with its ``position`` in the queue while it waits (0 = next)."""
+        async with self._connection() as db:
+            async with db.execute(f"SELECT {COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            job = _row(row)
+            job["position"] = None
+            if job["status"] == "queued":
+                async with db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job["created_at"],)
+                ) as cursor:
+                    job["position"] = (await cursor.fetchone())[0]
+        return job
+
+    async def counts(self) -> Dict[str, int]:
+        async with self._connection() as db:
+            async with db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status") as cursor:
+                found = dict(await cursor.fetchall())
+        return {status: found.get(status, 0) for status in STATUSES}
+
+    async def close(self):
+        await self.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pool": self.pool.stats()}
+
+
+# Singleton instance
+job_queue = JobQueue()
@@ -0,0 +1,112 @@
+"""Write-behind journal that group-commits chat message inserts."""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.database.pool import ConnectionPool
+from src.tools.telemetry import get_logger, span
+
+log = get_logger("db")
+
+
+class MessageJournal:
+    """Queue message inserts and commit them in batches.
+
+    ``append`` returns a future that resolves once the message is committed.
+    A background writer drains the queue whenever it reaches ``max_batch``
+    entries or ``flush_interval`` seconds after the first pending entry,
+    writing every queued message (and its session row) in one transaction.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_batch: int = 64, flush_interval: float = 0.005):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self._pending: List[Tuple[Tuple[str, str, str, Optional[str]], asyncio.Future]] = []
+        self._committing: List[asyncio.Future] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._writer is None or self._writer.done():
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._writer = loop.create_task(self._run())
+            if self._pending:
+                # Left over from a previous event loop
+                self._wake.set()
+
+    def append(self, session_id: str, role: str, content: str, turn_id: Optional[str] = None) -> asyncio.Future:
+        self._ensure_writer()
+        future = self._loop.create_future()
+        self._pending.append(((session_id, role, content, turn_id), future))
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+        elif len(self._pending) == 1:
+            self._loop.call_later(self.flush_interval, self._wake.set)
+        return future
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                self._committing = [future for _, future in batch]
+                await self._commit(batch)
+                self._committing = []
+
+    async def _commit(self, batch: List[Tuple[Tuple[str, str, str, Optional[str]], asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        sessions = [(sid,) for sid in dict.fromkeys(row[0] for row in rows)]
+        start = time.perf_counter()
+        try:
+            with span("db.group_commit"):
+                async with self.pool.connection() as conn:
+                    await conn.executemany("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", sessions)
+                    await conn.executemany(
+                        "INSERT OR IGNORE INTO messages (session_id, role, content, turn_id) VALUES (?, ?, ?, ?)", rows
+                    )
+                    await conn.commit()
+        except Exception as e:
+            self.failed += len(batch)
+            log.error("Group commit failed", messages=len(batch), error=str(e))
+            for _, future in batch:
+                if not future.done() and not future.get_loop().is_closed():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.written += len(batch)
+        log.debug("Group commit", messages=len(batch), ms=round((time.perf_counter() - start) * 1000, 1))
+        for _, future in batch:
+            if not future.done() and not future.get_loop().is_closed():
+                future.set_result(None)
+
+    async def flush(self):
+        """Wait until everything queued so far is committed."""
+        futures = self._committing + [future for _, future in self._pending]
+        if not futures:
+            return
+        self._wake.set()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "mean_batch": round(self.written / self.batches, 2) if self.batches else 0.0,
+        }
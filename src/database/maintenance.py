@@ -0,0 +1,306 @@
+"""Retention, archival and compaction of the chat history database.
+
+A background task (started by the API lifespan) runs every
+``MAINTENANCE_INTERVAL_S``:
+
+1. Sessions with no activity for ``HISTORY_RETENTION_DAYS`` are written, with
+   their messages and summary, to a gzip-compressed NDJSON file in
+   ``HISTORY_ARCHIVE_DIR`` (one line per session, one file per run) and then
+   deleted, ``MAINTENANCE_BATCH`` sessions per transaction.
+2. Sessions longer than ``HISTORY_MAX_MESSAGES`` have their oldest messages
+   archived the same way and trimmed to the cap. Only messages already
+   folded into the session's rolling summary (``summarized_upto``) are
+   trimmed, so conversation memory never loses a turn.
+3. ``PRAGMA incremental_vacuum`` returns the freed pages to the filesystem
+   and ``wal_checkpoint(TRUNCATE)`` folds the WAL back into the database.
+
+Archive lines are written and flushed before the rows are deleted, so a
+crash in between archives a session twice rather than losing it. The
+delete re-checks expiry in its own write transaction and only removes
+messages up to the last archived id, so a message written in the meantime
+(a returning user, the group-commit journal) keeps its session alive
+instead of being deleted unarchived. With several API workers, a file lock
+lets only one of them run at a time.
+
+Run it once by hand with::
+
+    python -m src.database.maintenance
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from src.database.db_manager import DatabaseManager, db_manager
+from src.tools.telemetry import get_logger, span
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock
+    fcntl = None
+
+load_dotenv()
+
+log = get_logger("db")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 0 disables the corresponding step
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "1000"))
+MAINTENANCE_INTERVAL_S = float(os.getenv("MAINTENANCE_INTERVAL_S", "3600"))
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", os.path.join(PROJECT_ROOT, "data", "archive"))
+MAINTENANCE_BATCH = int(os.getenv("MAINTENANCE_BATCH", "500"))
+# The first run waits for startup and warm-up to settle
+FIRST_RUN_DELAY_S = 60
+
+EXPIRED = """
+    s.created_at < :cutoff
+    AND COALESCE(
+        (SELECT m.timestamp FROM messages m WHERE m.session_id = s.session_id ORDER BY m.id DESC LIMIT 1),
+        s.created_at
+    ) < :cutoff
+"""
+EXPIRED_SESSIONS = f"SELECT s.session_id FROM sessions s WHERE {EXPIRED} LIMIT :batch"
+STILL_EXPIRED = f"SELECT 1 FROM sessions s WHERE s.session_id = :session_id AND {EXPIRED}"
+OVERSIZED_SESSIONS = "SELECT session_id FROM messages GROUP BY session_id HAVING COUNT(*) > ?"
+# What a history read costs; compared before and after each run
+SCAN_QUERY = "SELECT COUNT(*), SUM(LENGTH(content)) FROM messages"
+
+
+def _db_bytes(db_path: str) -> int:
+    return sum(os.path.getsize(p) for p in (db_path, f"{db_path}-wal") if os.path.exists(p))
+
+
+def _scan_ms(conn: sqlite3.Connection) -> float:
+    start = time.perf_counter()
+    conn.execute(SCAN_QUERY).fetchone()
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _messages(conn: sqlite3.Connection, session_id: str, before_id: Optional[int] = None) -> List[Dict]:
+    query = "SELECT id, role, content, timestamp FROM messages WHERE session_id = ?"
+    params: list = [session_id]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    rows = conn.execute(query + " ORDER BY id", params).fetchall()
+    return [{"id": r[0], "role": r[1], "content": r[2], "timestamp": r[3]} for r in rows]
+
+
+class _Archive:
+    """The gzip NDJSON file of one run, created on the first record."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._raw = None
+        self._gzip: Optional[gzip.GzipFile] = None
+
+    def write(self, record: Dict):
+        if self._gzip is None:
+            self.path = os.path.join(self.directory, f"chat-history-{time.strftime('%Y%m%d-%H%M%S')}.ndjson.gz")
+            self._raw = open(self.path, "ab")
+            self._gzip = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._gzip.write((json.dumps(record) + "\n").encode("utf-8"))
+
+    def sync(self):
+        """Make everything written so far durable; rows are deleted only after this."""
+        if self._gzip is not None:
+            self._gzip.flush()
+            self._raw.flush()
+            os.fsync(self._raw.fileno())
+
+    def close(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+
+
+class HistoryMaintenance:
+    def __init__(
+        self,
+        db: DatabaseManager = db_manager,
+        retention_days: float = HISTORY_RETENTION_DAYS,
+        max_messages: int = HISTORY_MAX_MESSAGES,
+        archive_dir: str = HISTORY_ARCHIVE_DIR,
+        batch: int = MAINTENANCE_BATCH,
+    ):
+        self.db = db
+        self.retention_days = retention_days
+        self.max_messages = max_messages
+        self.archive_dir = archive_dir
+        self.batch = batch
+        self.runs = 0
+        self.totals = {"sessions_archived": 0, "messages_trimmed": 0, "bytes_reclaimed": 0}
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[bool]:
+        """Yields False when another process is already running maintenance."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.archive_dir, ".maintenance.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        """One maintenance pass (blocking); None if another process holds the lock."""
+        self.db.initialize()
+        with self._exclusive() as acquired:
+            if not acquired:
+                log.info("History maintenance already running elsewhere")
+                return None
+            return self._run()
+
+    def _run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        stats: Dict[str, Any] = {"sessions_archived": 0, "messages_trimmed": 0}
+        archive = _Archive(self.archive_dir)
+        with closing(sqlite3.connect(self.db.db_path, timeout=5)) as conn:
+            stats["bytes_before"] = _db_bytes(self.db.db_path)
+            stats["scan_ms_before"] = _scan_ms(conn)
+            try:
+                if self.retention_days > 0:
+                    stats["sessions_archived"] = self._expire(conn, archive)
+                if self.max_messages > 0:
+                    stats["messages_trimmed"] = self._trim(conn, archive)
+            finally:
+                archive.close()
+
+            # Hand freed pages back to the filesystem, then fold the WAL in
+            # (each step of the statement frees one page, so run it to completion)
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            stats["bytes_after"] = _db_bytes(self.db.db_path)
+            stats["scan_ms_after"] = _scan_ms(conn)
+
+        stats["archive"] = archive.path
+        stats["bytes_reclaimed"] = max(0, stats["bytes_before"] - stats["bytes_after"])
+        stats["duration_s"] = round(time.perf_counter() - start, 3)
+        stats["finished_at"] = time.time()
+        self.runs += 1
+        for key in self.totals:
+            self.totals[key] += stats[key]
+        self.last_run = stats
+        log.info("History maintenance finished", **{k: v for k, v in stats.items() if k != "finished_at"})
+        return stats
+
+    def _expire(self, conn: sqlite3.Connection, archive: "_Archive") -> int:
+        cutoff = conn.execute(
+            "SELECT datetime('now', ?)", (f"-{self.retention_days * 86400:.0f} seconds",)
+        ).fetchone()[0]
+        archived = 0
+        while True:
+            ids = [r[0] for r in conn.execute(EXPIRED_SESSIONS, {"cutoff": cutoff, "batch": self.batch})]
+            if not ids:
+                return archived
+            # Last archived message id per session
+            last_ids = {}
+            for session_id in ids:
+                created_at = conn.execute(
+                    "SELECT created_at FROM sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+                summary = conn.execute(
+                    "SELECT summary FROM session_summaries WHERE session_id = ?", (session_id,)).fetchone()
+                messages = _messages(conn, session_id)
+                archive.write({
+                    "session_id": session_id,
+                    "created_at": created_at,
+                    "summary": summary[0] if summary else None,
+                    "messages": messages,
+                })
+                last_ids[session_id] = messages[-1]["id"] if messages else 0
+            archive.sync()
+            # Writers wait for this transaction, so nothing lands between the check and the delete
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = 0
+                for session_id, last_id in last_ids.items():
+                    params = {"cutoff": cutoff, "session_id": session_id}
+                    if conn.execute(STILL_EXPIRED, params).fetchone() is None:
+                        # Written to since it was archived: it stays (and is archived again once it expires)
+                        continue
+                    conn.execute("DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, last_id))
+                    conn.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
+                    conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                    deleted += 1
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            archived += deleted
+
+    def _trim(self, conn: sqlite3.Connection, archive: "_Archive") -> int:
+        trimmed = 0
+        for (session_id,) in conn.execute(OVERSIZED_SESSIONS, (self.max_messages,)).fetchall():
+            # Oldest id that stays
+            keep_from = conn.execute(
+                "SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                (session_id, self.max_messages - 1),
+            ).fetchone()[0]
+            # Messages not yet folded into the summary are still conversation memory
+            row = conn.execute(
+                "SELECT summarized_upto FROM session_summaries WHERE session_id = ?", (session_id,)).fetchone()
+            summarized_upto = (row[0] or 0) if row else 0
+            before_id = min(keep_from, summarized_upto + 1)
+            # Ids only grow, so no message written from here on falls below before_id
+            messages = _messages(conn, session_id, before_id=before_id)
+            if not messages:
+                continue
+            archive.write({"session_id": session_id, "trimmed": True, "messages": messages})
+            archive.sync()
+            with conn:
+                conn.execute("DELETE FROM messages WHERE session_id = ? AND id < ?", (session_id, before_id))
+            trimmed += len(messages)
+        return trimmed
+
+    def start(self):
+        if self._task is None and MAINTENANCE_INTERVAL_S > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _loop(self):
+        await asyncio.sleep(min(FIRST_RUN_DELAY_S, MAINTENANCE_INTERVAL_S))
+        while True:
+            try:
+                with span("db.maintenance"):
+                    await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                log.error("History maintenance failed", error=f"{type(e).__name__}: {e}")
+            await asyncio.sleep(MAINTENANCE_INTERVAL_S)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retention_days": self.retention_days,
+            "max_messages": self.max_messages,
+            "runs": self.runs,
+            **self.totals,
+            "last_run": self.last_run,
+        }
+
+
+# Singleton run by the API lifespan
+history_maintenance = HistoryMaintenance()
+
+
+if __name__ == "__main__":
+    print(json.dumps(history_maintenance.run_once(), indent=2))
@@ -0,0 +1,461 @@
+"""Indexed SQLite patient registry.
+
+Patients live in ``PATIENTS_DB`` (default ``data/patients.db``) instead of an
+in-memory dict, so memory stays flat however large the registry is. Each
+patient is one row holding the full record as JSON plus the columns used for
+cohort queries (age, gender, smoking history); symptoms are normalized into
+``patient_symptoms`` so "everyone with haemoptysis aged 40-60" is an index
+seek rather than a scan. Symptoms are keyed with the symptom index's
+normalizer and aliases, so "haemoptysis" also finds "unexplained hemoptysis".
+
+Lookups are async through a small connection pool with an LRU of hot
+records in front. Imports stream JSON arrays, NDJSON or CSV in batches, so a
+registry of millions never has to fit in memory. Re-importing a file
+replaces its patients: records that are no longer in the file are deleted
+(patients imported from other files are left alone)::
+
+    python -m src.database.patient_store import registry.csv
+    python -m src.database.patient_store cohort --min-age 40 --max-age 60 --symptom "weight loss"
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.database.db_manager import MIGRATION_BUSY_TIMEOUT_S
+from src.database.pool import ConnectionPool
+from src.embeddings.symptom_index import build_alias_map, normalize_symptom
+from src.tools.cache import LRUCache
+from src.tools.telemetry import get_logger, span
+
+load_dotenv()
+
+log = get_logger("patients")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+PATIENTS_DB = os.getenv("PATIENTS_DB", os.path.join(PROJECT_ROOT, "data", "patients.db"))
+
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "10000"))
+PATIENT_POOL_SIZE = int(os.getenv("PATIENT_POOL_SIZE", "4"))
+IMPORT_BATCH_SIZE = 10_000
+# Patient ids read per query when walking the whole registry
+ID_PAGE_SIZE = 10_000
+# Largest page the API hands out for a cohort query
+MAX_COHORT_PAGE = 1000
+
+# CSV cells holding several symptoms separate them with this
+CSV_LIST_SEPARATOR = ";"
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS patients (
+        patient_id TEXT PRIMARY KEY,
+        age INTEGER,
+        gender TEXT,
+        smoking_history TEXT,
+        symptom_duration_days INTEGER,
+        record TEXT NOT NULL,
+        source TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS patient_symptoms (
+        symptom TEXT NOT NULL,
+        patient_id TEXT NOT NULL,
+        PRIMARY KEY (symptom, patient_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_patient_symptoms_patient ON patient_symptoms (patient_id)",
+    "CREATE INDEX IF NOT EXISTS idx_patients_cohort ON patients (age, gender, smoking_history)",
+    """CREATE TABLE IF NOT EXISTS imports (
+        source TEXT PRIMARY KEY,
+        mtime REAL,
+        rows INTEGER,
+        imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+]
+
+
+# 1: patients remember the file they were imported from
+# 2: symptoms keyed by symptom_key instead of lowercased text
+SCHEMA_VERSION = 2
+
+_SYMPTOM_ALIASES = build_alias_map()
+
+
+def symptom_key(symptom: str) -> str:
+    """Index key of a symptom: normalized and resolved to its canonical term."""
+    key = normalize_symptom(str(symptom))
+    return _SYMPTOM_ALIASES.get(key, key)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _iter_json_array(f, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+    """Yield the elements of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array of patient records")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = f.read(chunk_size)
+            eof = not more
+            buffer += more
+            continue
+        yield item
+        buffer = buffer[end:]
+        if len(buffer) < chunk_size and not eof:
+            more = f.read(chunk_size)
+            eof = not more
+            buffer += more
+
+
+def _iter_csv(f) -> Iterator[Dict]:
+    for row in csv.DictReader(f):
+        record: Dict[str, Any] = {k: v for k, v in row.items() if k and v not in (None, "")}
+        if "symptoms" in record:
+            record["symptoms"] = [s.strip() for s in record["symptoms"].split(CSV_LIST_SEPARATOR) if s.strip()]
+        for field in ("age", "symptom_duration_days"):
+            if field in record and _as_int(record[field]) is not None:
+                record[field] = _as_int(record[field])
+        yield record
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """Patient records from a ``.json`` array, ``.jsonl``/``.ndjson`` or ``.csv`` file."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="" if ext == ".csv" else None) as f:
+        if ext == ".csv":
+            yield from _iter_csv(f)
+        elif ext in (".jsonl", ".ndjson"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+
+def _rows(record: Dict, source: Optional[str] = None) -> Tuple[Tuple, List[Tuple[str, str]]]:
+    pid = str(record["patient_id"])
+    row = (
+        pid,
+        _as_int(record.get("age")),
+        record.get("gender"),
+        record.get("smoking_history"),
+        _as_int(record.get("symptom_duration_days")),
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")),
+        source,
+    )
+    return row, [(s, pid) for s in _symptom_keys(record)]
+
+
+def _symptom_keys(record: Dict) -> set:
+    symptoms = record.get("symptoms") or []
+    if isinstance(symptoms, str):
+        symptoms = [symptoms]
+    return {key for key in map(symptom_key, symptoms) if key}
+
+
+def _cohort_where(
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    gender: Optional[str] = None,
+    smoking_history: Optional[str] = None,
+    symptom: Optional[str] = None,
+) -> Tuple[str, str, str, List[Any]]:
+    """FROM clause, ordering key, WHERE clause and parameters for a cohort filter.
+
+    With a symptom the rows come from the (symptom, patient_id) key, already
+    in patient_id order, so a page stops after ``limit`` matches instead of
+    sorting the whole cohort.
+    """
+    source, key = "patients p", "p.patient_id"
+    clauses, params = [], []
+    if symptom:
+        source = "patient_symptoms s JOIN patients p ON p.patient_id = s.patient_id"
+        key = "s.patient_id"
+        clauses.append("s.symptom = ?")
+        params.append(symptom_key(symptom))
+    if min_age is not None:
+        clauses.append("p.age >= ?")
+        params.append(min_age)
+    if max_age is not None:
+        clauses.append("p.age <= ?")
+        params.append(max_age)
+    if gender:
+        clauses.append("p.gender = ? COLLATE NOCASE")
+        params.append(gender)
+    if smoking_history:
+        clauses.append("p.smoking_history = ? COLLATE NOCASE")
+        params.append(smoking_history)
+    return source, key, " AND ".join(clauses) or "1", params
+
+
+class PatientStore:
+    def __init__(self, db_path: str = PATIENTS_DB, cache_size: int = PATIENT_CACHE_SIZE, pool_size: int = PATIENT_POOL_SIZE):
+        self.db_path = db_path
+        self.cache = LRUCache(cache_size)
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.initialized = False
+
+    def initialize(self):
+        """Create the schema; runs once, on first use."""
+        if self.initialized:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(sqlite3.connect(self.db_path, timeout=MIGRATION_BUSY_TIMEOUT_S)) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            for statement in SCHEMA:
+                conn.execute(statement)
+        with closing(sqlite3.connect(self.db_path, timeout=MIGRATION_BUSY_TIMEOUT_S)) as conn:
+            self._migrate(conn)
+        self.initialized = True
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with conn:
+            # Re-read under the write lock: another worker may have just migrated
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+            log.info("Migrating patient registry", from_version=version, to_version=SCHEMA_VERSION)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(patients)")}
+            if "source" not in columns:
+                conn.execute("ALTER TABLE patients ADD COLUMN source TEXT")
+                # Re-import the source files so their rows get a source
+                conn.execute("DELETE FROM imports")
+            if version < 2:
+                conn.execute("DELETE FROM patient_symptoms")
+                rows = conn.execute("SELECT patient_id, record FROM patients")
+                while batch := rows.fetchmany(IMPORT_BATCH_SIZE):
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO patient_symptoms (symptom, patient_id) VALUES (?, ?)",
+                        [(key, pid) for pid, record in batch for key in _symptom_keys(json.loads(record))],
+                    )
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # --- Import ----------------------------------------------------------
+
+    def import_records(
+        self, records: Iterable[Dict], batch_size: int = IMPORT_BATCH_SIZE, source: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Upsert records in batches of ``batch_size``; re-importing a patient replaces it.
+
+        With a ``source``, patients previously imported from that source that
+        are not among ``records`` are deleted, so the registry mirrors it.
+        """
+        self.initialize()
+        imported = skipped = removed = 0
+        start = time.perf_counter()
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            # A crashed import is simply re-run, so skip the fsyncs
+            conn.execute("PRAGMA synchronous=OFF")
+            # Ids seen in this import; a temp table, so memory stays flat
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS imported_ids (patient_id TEXT PRIMARY KEY) WITHOUT ROWID")
+            batch: List[Dict] = []
+            for record in records:
+                if not isinstance(record, dict) or not record.get("patient_id"):
+                    skipped += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    imported += self._write_batch(conn, batch, source)
+                    batch = []
+            if batch:
+                imported += self._write_batch(conn, batch, source)
+            if source is not None:
+                removed = self._remove_missing(conn, source)
+            conn.execute("DROP TABLE temp.imported_ids")
+            # Sampled statistics so the planner picks between the age and symptom indexes
+            conn.execute("PRAGMA analysis_limit=1000")
+            conn.execute("ANALYZE")
+        self.cache.clear()
+        elapsed = time.perf_counter() - start
+        log.info("Imported patients", imported=imported, skipped=skipped, removed=removed, seconds=round(elapsed, 2))
+        return {"imported": imported, "skipped": skipped, "removed": removed,
+                "rows_per_s": round(imported / elapsed) if elapsed else 0}
+
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, batch: List[Dict], source: Optional[str] = None) -> int:
+        rows, symptoms = [], []
+        for record in batch:
+            row, symptom_rows = _rows(record, source)
+            rows.append(row)
+            symptoms.extend(symptom_rows)
+        ids = [(r[0],) for r in rows]
+        with conn:
+            conn.executemany("DELETE FROM patient_symptoms WHERE patient_id = ?", ids)
+            conn.executemany(
+                """INSERT INTO patients (patient_id, age, gender, smoking_history, symptom_duration_days, record, source)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(patient_id) DO UPDATE SET
+                       age = excluded.age,
+                       gender = excluded.gender,
+                       smoking_history = excluded.smoking_history,
+                       symptom_duration_days = excluded.symptom_duration_days,
+                       record = excluded.record,
+                       source = excluded.source""",
+                rows,
+            )
+            conn.executemany("INSERT OR IGNORE INTO patient_symptoms (symptom, patient_id) VALUES (?, ?)", symptoms)
+            conn.executemany("INSERT OR IGNORE INTO temp.imported_ids (patient_id) VALUES (?)", ids)
+        return len(rows)
+
+    @staticmethod
+    def _remove_missing(conn: sqlite3.Connection, source: str) -> int:
+        """Delete the source's patients that this import did not include."""
+        missing = ("SELECT patient_id FROM patients WHERE source = ?"
+                   " AND patient_id NOT IN (SELECT patient_id FROM temp.imported_ids)")
+        with conn:
+            conn.execute(f"DELETE FROM patient_symptoms WHERE patient_id IN ({missing})", (source,))
+            return conn.execute(f"DELETE FROM patients WHERE patient_id IN ({missing})", (source,)).rowcount
+
+    def import_file(self, path: str, batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+        result = self.import_records(iter_records(path), batch_size, source=os.path.abspath(path))
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO imports (source, mtime, rows) VALUES (?, ?, ?)",
+                (os.path.abspath(path), os.path.getmtime(path), result["imported"]),
+            )
+        return result
+
+    def is_current(self, path: str) -> bool:
+        """True if ``path`` was imported and has not changed since."""
+        self.initialize()
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            row = conn.execute("SELECT mtime FROM imports WHERE source = ?", (os.path.abspath(path),)).fetchone()
+        return row is not None and row[0] == os.path.getmtime(path)
+
+    def count_sync(self) -> int:
+        self.initialize()
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            return conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    # --- Lookups ---------------------------------------------------------
+
+    async def get(self, patient_id: str) -> Optional[Dict]:
+        cached = self.cache.get(patient_id)
+        if cached is not None:
+            return cached
+        self.initialize()
+        with span("db.patient_lookup"):
+            async with self.pool.connection() as db:
+                async with db.execute("SELECT record FROM patients WHERE patient_id = ?", (patient_id,)) as cursor:
+                    row = await cursor.fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        self.cache.put(patient_id, record)
+        return record
+
+    async def get_many(self, patient_ids: List[str]) -> Dict[str, Dict]:
+        return {pid: r for pid, r in zip(patient_ids, await asyncio.gather(*map(self.get, patient_ids))) if r}
+
+    async def list_ids(self, limit: int = ID_PAGE_SIZE, after_id: Optional[str] = None) -> List[str]:
+        """One page of patient ids after ``after_id`` (keyset pagination)."""
+        self.initialize()
+        async with self.pool.connection() as db:
+            async with db.execute(
+                "SELECT patient_id FROM patients WHERE patient_id > ? ORDER BY patient_id LIMIT ?",
+                (after_id or "", limit),
+            ) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def iter_ids(self, page_size: int = ID_PAGE_SIZE) -> AsyncIterator[List[str]]:
+        """Every patient id, a page at a time, so the registry is never held in memory."""
+        after_id = None
+        while page := await self.list_ids(page_size, after_id):
+            yield page
+            after_id = page[-1]
+
+    async def find(self, limit: int = 100, after_id: Optional[str] = None, **filters) -> List[Dict]:
+        """Records matching a cohort filter, ordered by patient_id (keyset pagination)."""
+        self.initialize()
+        source, key, where, params = _cohort_where(**filters)
+        if after_id:
+            where += f" AND {key} > ?"
+            params.append(after_id)
+        query = f"SELECT p.record FROM {source} WHERE {where} ORDER BY {key} LIMIT ?"
+        with span("db.patient_cohort"):
+            async with self.pool.connection() as db:
+                async with db.execute(query, [*params, limit]) as cursor:
+                    rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def count(self, **filters) -> int:
+        self.initialize()
+        source, _, where, params = _cohort_where(**filters)
+        async with self.pool.connection() as db:
+            async with db.execute(f"SELECT COUNT(*) FROM {source} WHERE {where}", params) as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def close(self):
+        await self.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache": self.cache.stats(), "pool": self.pool.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the SQLite patient registry")
+    parser.add_argument("--db", default=PATIENTS_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    importer = sub.add_parser("import", help="Import a .json, .jsonl/.ndjson or .csv file")
+    importer.add_argument("path")
+    importer.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    cohort = sub.add_parser("cohort", help="Count and list patients matching a filter")
+    cohort.add_argument("--min-age", type=int)
+    cohort.add_argument("--max-age", type=int)
+    cohort.add_argument("--gender")
+    cohort.add_argument("--smoking-history")
+    cohort.add_argument("--symptom")
+    cohort.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    store = PatientStore(args.db)
+    if args.command == "import":
+        print(json.dumps(store.import_file(args.path, args.batch_size)))
+        return
+
+    filters = {
+        "min_age": args.min_age, "max_age": args.max_age, "gender": args.gender,
+        "smoking_history": args.smoking_history, "symptom": args.symptom,
+    }
+
+    async def run():
+        total = await store.count(**filters)
+        patients = await store.find(limit=args.limit, **filters)
+        await store.close()
+        return total, patients
+
+    total, patients = asyncio.run(run())
+    print(f"{total} patients match")
+    for p in patients:
+        print(json.dumps(p))
+
+
+if __name__ == "__main__":
+    main()
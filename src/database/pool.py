@@ -0,0 +1,74 @@
+"""Long-lived aiosqlite connection pool."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiosqlite
+
+# Applied to every pooled connection. journal_mode=WAL is persistent and set
+# once when the schema is created.
+CONNECTION_PRAGMAS = {
+    "busy_timeout": 5000,
+    "cache_size": -8000,      # 8 MB page cache per connection
+    "temp_store": "MEMORY",
+    "mmap_size": 64 * 2**20,
+}
+
+
+class ConnectionPool:
+    """A bounded set of reusable connections to one SQLite database.
+
+    Connections are opened lazily up to ``size`` and handed out one caller at
+    a time. aiosqlite runs each connection on its own thread, so a connection
+    can be used from any event loop; only the semaphore is per loop.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, synchronous: str = "NORMAL"):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = {**CONNECTION_PRAGMAS, "synchronous": synchronous}
+        self.opened = 0
+        self.checkouts = 0
+        self._idle: List[aiosqlite.Connection] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous loop (e.g. an earlier asyncio.run) is gone
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.size)
+        return self._semaphore
+
+    async def _open(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path)
+        for name, value in self.pragmas.items():
+            await conn.execute(f"PRAGMA {name}={value}")
+        self.opened += 1
+        return conn
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        async with self._slots():
+            conn = self._idle.pop() if self._idle else await self._open()
+            self.checkouts += 1
+            try:
+                yield conn
+            except BaseException:
+                # Leave no half-finished transaction behind for the next caller
+                if conn.in_transaction:
+                    await conn.rollback()
+                raise
+            finally:
+                self._idle.append(conn)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+            self.opened -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "open": self.opened, "idle": len(self._idle), "checkouts": self.checkouts}
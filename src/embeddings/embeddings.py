@@ -2,8 +2,9 @@ import os
 import json
 import numpy as np
 from dotenv import load_dotenv
-from google import genai
 from google.genai.types import EmbedContentConfig
+from src.tools.rate_limiter import Priority, rate_limiter
+from src.tools.replay import make_genai_client
 
 load_dotenv()
 
@@ -18,6 +19,7 @@ DATA_DIR = os.path.join(PROJECT_DIR, "data")
 ENRICHED_FILE = os.path.join(DATA_DIR, "suspected-cancer-recognition-and-referral_enriched.json")
 EMBEDDINGS_FILE = os.path.join(DATA_DIR, "embeddings.npy")
 METADATA_FILE = os.path.join(DATA_DIR, "metadata.json")
+EMBEDDING_MODEL = "text-embedding-004"
 
 # Global client for reuse
 _client = None
@@ -35,8 +37,7 @@ def initialize_vertex_ai():
     global _client
     print("\nInitializing Google GenAI Client...")
     print(f"Project: {PROJECT_ID}, Location: {LOCATION}")
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
-    _client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    _client = make_genai_client(PROJECT_ID, LOCATION, CREDENTIALS_PATH)
 
 
 def create_embeddings(texts: list) -> np.ndarray:
@@ -52,10 +53,14 @@ def create_embeddings(texts: list) -> np.ndarray:
         print(f"Processing batch {i // batch_size + 1}/{(len(texts) - 1) // batch_size + 1}...")
         
         for text in batch:
-            response = _client.models.embed_content(
-                model="text-embedding-004",
-                contents=text,
-                config=EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT"),
+            response = rate_limiter.call_sync(
+                EMBEDDING_MODEL, "embed",
+                lambda: _client.models.embed_content(
+                    model=EMBEDDING_MODEL,
+                    contents=text,
+                    config=EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT"),
+                ),
+                priority=Priority.PIPELINE,
             )
             all_embeddings.append(response.embeddings[0].values)
     
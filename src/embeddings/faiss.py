@@ -1,8 +1,17 @@
 import os
+import sys
+import mmap
+import time
+import argparse
+import resource
 import numpy as np
 import json
 import faiss
 from pathlib import Path
+from dotenv import load_dotenv
+from src.embeddings.metadata_store import write_metadata_store
+
+load_dotenv()
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 DATA_DIR = PROJECT_ROOT / "data"
@@ -27,30 +36,155 @@ def load_metadata():
     return metadata
 
 
-def build_faiss_index():
-    print("Loading embeddings and metadata...")
-    embeddings = load_embeddings()
-    metadata = load_metadata()
+# HNSW parameters
+HNSW_M = 32
+EF_CONSTRUCTION = 200
+EF_SEARCH = 64  # Controls search quality vs speed
+
+# Out-of-core build (build_index_from_file). INDEX_FACTORY takes a faiss
+# index_factory string (e.g. "IVF4096,PQ64") for corpora whose flat vectors
+# do not fit in memory; unset builds the same HNSW index as create_index.
+INDEX_FACTORY = os.getenv("INDEX_FACTORY", "")
+INDEX_BUILD_CHUNK = int(os.getenv("INDEX_BUILD_CHUNK", "65536"))
+INDEX_TRAIN_SAMPLE = int(os.getenv("INDEX_TRAIN_SAMPLE", "100000"))
+INDEX_BUILD_THREADS = int(os.getenv("INDEX_BUILD_THREADS", "0"))  # 0 = all cores
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "32"))
 
+
+def create_index(embeddings: np.ndarray, M: int = HNSW_M, ef_construction: int = EF_CONSTRUCTION,
+                 ef_search: int = EF_SEARCH) -> faiss.Index:
+    """Build an in-memory HNSW cosine index. Normalizes ``embeddings`` in place."""
     dim = embeddings.shape[1]
-    
-    # HNSW parameters
-    M = 32  
-    ef_construction = 200  
 
     print(f"Creating HNSW index (cosine similarity, M={M}, ef_construction={ef_construction})...")
     index = faiss.IndexHNSWFlat(dim, M, faiss.METRIC_INNER_PRODUCT)
     index.hnsw.efConstruction = ef_construction
-    index.hnsw.efSearch = 64  # Controls search quality vs speed
+    index.hnsw.efSearch = ef_search
 
     # Normalize vectors for cosine similarity
     faiss.normalize_L2(embeddings)
 
     index.add(embeddings)
     print(f"Added {index.ntotal} vectors to HNSW index")
+    return index
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def private_rss_mb() -> float:
+    """Resident memory not backed by files: what the build itself holds."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            fields = f.read().split()
+        return (int(fields[1]) - int(fields[2])) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return current_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def empty_index(dim: int, factory: str = INDEX_FACTORY) -> faiss.Index:
+    """An empty cosine (inner product) index: HNSW by default, else ``factory``."""
+    if not factory:
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = EF_CONSTRUCTION
+        index.hnsw.efSearch = EF_SEARCH
+        return index
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    try:
+        # Saved with the index, so search needs no extra configuration
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    except RuntimeError:
+        pass
+    return index
+
+
+def _normalized(block: np.ndarray) -> np.ndarray:
+    # A float32 copy of just this block; the memory map stays untouched
+    block = np.array(block, dtype=np.float32)
+    faiss.normalize_L2(block)
+    return block
+
+
+def _release_pages(embeddings: np.memmap, rows: int):
+    """Drop the already-indexed rows' file pages from this process's resident set.
+
+    They are clean file-backed pages, so the kernel could reclaim them anyway;
+    dropping them keeps RSS flat instead of growing to the file size.
+    """
+    mapping = getattr(embeddings, "_mmap", None)
+    if mapping is None or not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    # np.memmap maps from the allocation-granularity boundary below the data offset
+    start = embeddings.offset % mmap.ALLOCATIONGRANULARITY
+    length = (start + rows * embeddings.strides[0]) // mmap.PAGESIZE * mmap.PAGESIZE
+    if length:
+        mapping.madvise(mmap.MADV_DONTNEED, 0, length)
+
+
+def build_index_from_file(embeddings_path, factory: str = INDEX_FACTORY, chunk_size: int = INDEX_BUILD_CHUNK,
+                          train_sample: int = INDEX_TRAIN_SAMPLE, threads: int = INDEX_BUILD_THREADS):
+    """Build a cosine index from an ``.npy`` file without loading it into memory.
+
+    The embeddings are memory-mapped; a quantizer that needs training is
+    trained on ``train_sample`` random rows, then vectors are normalized and
+    added ``chunk_size`` rows at a time (faiss parallelizes each add over
+    ``threads`` OpenMP threads). Beyond the index itself, memory use stays at
+    one chunk whatever the corpus size. Returns the index and build stats
+    including the peak resident and private (non file-backed) memory seen.
+    """
+    if threads:
+        faiss.omp_set_num_threads(threads)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    n, dim = embeddings.shape
+    print(f"Embeddings: {n} x {dim} ({embeddings.nbytes / 2**20:.0f} MB, memory-mapped)")
+    start = time.perf_counter()
+    peak, peak_private = current_rss_mb(), private_rss_mb()
+    index = empty_index(dim, factory)
+
+    if not index.is_trained:
+        rows = np.sort(np.random.default_rng(0).choice(n, min(n, train_sample), replace=False))
+        print(f"Training {factory} on {len(rows)} sampled vectors...")
+        index.train(_normalized(embeddings[rows]))
+        peak, peak_private = max(peak, current_rss_mb()), max(peak_private, private_rss_mb())
+        _release_pages(embeddings, n)
+
+    for begin in range(0, n, chunk_size):
+        index.add(_normalized(embeddings[begin:begin + chunk_size]))
+        peak, peak_private = max(peak, current_rss_mb()), max(peak_private, private_rss_mb())
+        _release_pages(embeddings, min(n, begin + chunk_size))
+        elapsed = time.perf_counter() - start
+        print(f"  {index.ntotal}/{n} vectors ({index.ntotal / elapsed:.0f}/s), rss {current_rss_mb():.0f} MB")
+
+    stats = {
+        "vectors": index.ntotal,
+        "factory": factory or f"HNSW{HNSW_M}",
+        "build_s": round(time.perf_counter() - start, 2),
+        "peak_rss_mb": round(peak, 1),
+        "peak_private_mb": round(peak_private, 1),
+    }
+    print(f"Built index: {stats}")
+    return index, stats
+
+
+def build_faiss_index():
+    print("Building FAISS index from memory-mapped embeddings...")
+    index, _ = build_index_from_file(EMBEDDINGS_PATH)
+    metadata = load_metadata()
 
     faiss.write_index(index, str(INDEX_PATH))
     print(f"Saved FAISS index to: {INDEX_PATH}")
+    # Memory-mappable copy of the metadata for the API workers
+    write_metadata_store(metadata, str(METADATA_PATH))
 
     return index, metadata
 
@@ -87,3 +221,22 @@ def search(query_embedding: np.ndarray, k: int = 5):
             })
     
     return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a FAISS index out of core from an embeddings .npy file")
+    parser.add_argument("--embeddings", default=str(EMBEDDINGS_PATH))
+    parser.add_argument("--output", default=str(INDEX_PATH))
+    parser.add_argument("--factory", default=INDEX_FACTORY, help='faiss index_factory string, e.g. "IVF4096,PQ64" (default: HNSW)')
+    parser.add_argument("--chunk-size", type=int, default=INDEX_BUILD_CHUNK)
+    parser.add_argument("--train-sample", type=int, default=INDEX_TRAIN_SAMPLE)
+    parser.add_argument("--threads", type=int, default=INDEX_BUILD_THREADS)
+    args = parser.parse_args()
+
+    index, _ = build_index_from_file(args.embeddings, args.factory, args.chunk_size, args.train_sample, args.threads)
+    faiss.write_index(index, args.output)
+    print(f"Saved FAISS index to: {args.output} (peak RSS {peak_rss_mb():.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Memory-mapped, read-only chunk metadata.
+
+``metadata.json`` is converted once into ``metadata.jsonl`` (one entry per
+line) plus ``metadata.offsets.npy`` (byte offset of every line). Readers
+mmap both files and decode only the entries they touch, so API workers share
+one copy through the page cache instead of each holding the parsed JSON on
+its heap. Chunk citation IDs get the same treatment: ``metadata.ids.npy``
+holds every entry's ID in row order and ``metadata.id_order.npy`` the rows
+sorted by ID, so an ID is found by binary search over the mapped files.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from src.preprocess.chunking import make_chunk_id
+
+
+def store_paths(json_path: str):
+    """JSONL, offsets, chunk IDs and ID sort order files of the store."""
+    base, _ = os.path.splitext(json_path)
+    return f"{base}.jsonl", f"{base}.offsets.npy", f"{base}.ids.npy", f"{base}.id_order.npy"
+
+
+def write_metadata_store(metadata: List[Dict], json_path: str):
+    """Write the JSONL, offsets and chunk ID files for ``metadata``.
+
+    Files are written under temporary names and renamed into place, so
+    concurrent workers never see a half-written store.
+    """
+    paths = store_paths(json_path)
+    lines_path, offsets_path, ids_path, order_path = paths
+    tmp = {path: f"{path}.{os.getpid()}.tmp" for path in paths}
+    offsets = np.zeros(len(metadata) + 1, dtype=np.int64)
+    with open(tmp[lines_path], "wb") as f:
+        for i, entry in enumerate(metadata):
+            f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets[i + 1] = f.tell()
+    ids = ChunkIdIndex.from_metadata(metadata)
+    if ids.duplicates:
+        print(f"Warning: {ids.duplicates} duplicate chunk IDs; citations of them resolve to one entry")
+    for path, array in ((offsets_path, offsets), (ids_path, ids.ids), (order_path, ids.order)):
+        with open(tmp[path], "wb") as f:
+            np.save(f, array)
+    for path in paths:
+        os.replace(tmp[path], path)
+    print(f"Saved metadata store ({len(metadata)} entries) to: {lines_path}")
+
+
+class MetadataStore:
+    """Sequence-like view of the metadata that decodes entries on access."""
+
+    def __init__(self, json_path: str):
+        lines_path, offsets_path, ids_path, order_path = store_paths(json_path)
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        with open(lines_path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.chunk_ids = ChunkIdIndex(np.load(ids_path, mmap_mode="r"), np.load(order_path, mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> Dict:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return json.loads(self._data[int(self.offsets[idx]):int(self.offsets[idx + 1])])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def chunk_ids(metadata: Iterable[Dict]) -> List[str]:
+    """Stable citation ID of every entry, in order.
+
+    Entries written before chunks recorded their ``chunk_id`` (or ``part``)
+    get the ID the pipeline would give them now: chunks of an element are
+    numbered in the order they appear.
+    """
+    ids, parts = [], Counter()
+    for entry in metadata:
+        element_id = entry.get("element_id")
+        parts[element_id] += 1
+        ids.append(entry.get("chunk_id") or make_chunk_id(element_id, entry.get("part") or parts[element_id]))
+    return ids
+
+
+class ChunkIdIndex:
+    """Chunk ID of each row, and the row of each ID, over two arrays.
+
+    ``ids`` holds the UTF-8 IDs in row order (fixed-width bytes) and
+    ``order`` the rows sorted by ID. Lookups touch O(log n) elements, so
+    memory-mapped arrays are never read in full.
+    """
+
+    def __init__(self, ids: np.ndarray, order: np.ndarray):
+        self.ids = ids
+        self.order = order
+
+    @classmethod
+    def from_metadata(cls, metadata: Iterable[Dict]) -> "ChunkIdIndex":
+        ids = np.array([cid.encode("utf-8") for cid in chunk_ids(metadata)], dtype=np.bytes_)
+        return cls(ids, np.argsort(ids, kind="stable").astype(np.int64))
+
+    @property
+    def duplicates(self) -> int:
+        ordered = self.ids[self.order]
+        return int((ordered[1:] == ordered[:-1]).sum())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def fingerprint(self) -> str:
+        """Digest of every ID in row order: which chunks, in which rows."""
+        digest = hashlib.sha256(self.ids.dtype.str.encode())
+        # Hashes the mapped pages in place, without a private copy
+        digest.update(np.ascontiguousarray(self.ids))
+        return digest.hexdigest()[:16]
+
+    def chunk_id(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def row(self, chunk_id: str) -> Optional[int]:
+        """Row of ``chunk_id``, or None if no entry has it."""
+        key = chunk_id.encode("utf-8")
+        if not len(self) or len(key) > self.ids.dtype.itemsize:
+            return None
+        i = int(np.searchsorted(self.ids, np.array(key, dtype=self.ids.dtype), sorter=self.order))
+        if i < len(self) and self.ids[self.order[i]] == key:
+            return int(self.order[i])
+        return None
+
+
+def open_metadata(json_path: str) -> MetadataStore:
+    """Open the store for ``json_path``, (re)building it if missing or stale."""
+    paths = store_paths(json_path)
+    stale = not all(os.path.exists(path) for path in paths)
+    if not stale and os.path.exists(json_path):
+        stale = os.path.getmtime(json_path) > min(os.path.getmtime(path) for path in paths)
+    if stale:
+        with open(json_path, "r", encoding="utf-8") as f:
+            write_metadata_store(json.load(f), json_path)
+    return MetadataStore(json_path)
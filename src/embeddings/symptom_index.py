@@ -0,0 +1,165 @@
+"""Precomputed symptom -> ranked guideline chunk index.
+
+Built once at pipeline time from the chunk embeddings and metadata so that
+known symptoms can be resolved with a dictionary lookup instead of an
+embedding call at query time. The index stores row numbers, so it lives next
+to the FAISS index it was built for and records a fingerprint of that
+corpus's chunk IDs; an index for any other corpus is ignored.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import faiss
+
+from src.embeddings.faiss import INDEX_PATH, load_embeddings, load_metadata
+from src.embeddings.metadata_store import ChunkIdIndex
+from src.tools.telemetry import get_logger
+
+log = get_logger("symptom_index")
+
+SYMPTOM_INDEX_VERSION = 3
+
+
+def symptom_index_path(index_path) -> Path:
+    """Where the symptom index of the FAISS index at ``index_path`` lives."""
+    return Path(os.path.dirname(os.path.abspath(index_path))) / "symptom_index.json"
+
+
+SYMPTOM_INDEX_PATH = symptom_index_path(INDEX_PATH)
+
+TOP_K = 6
+LEXICAL_BONUS = 0.1
+
+# NG12 symptom vocabulary: canonical term -> accepted aliases.
+# Canonical terms use the guideline's own (UK) wording. An alias must mean
+# exactly the canonical term: a qualified symptom ("visible haematuria") is
+# its own entry, never the target of the unqualified one.
+SYMPTOM_VOCABULARY: Dict[str, List[str]] = {
+    "haemoptysis": ["hemoptysis", "coughing up blood", "blood in sputum"],
+    "cough": ["chronic cough"],
+    "shortness of breath": ["breathlessness", "dyspnoea", "dyspnea"],
+    "chest pain": [],
+    "fatigue": ["tiredness", "lethargy"],
+    "weight loss": ["losing weight"],
+    "appetite loss": ["loss of appetite", "reduced appetite", "anorexia"],
+    "hoarseness": ["hoarse voice"],
+    "dysphagia": ["difficulty swallowing", "swallowing difficulty"],
+    "dyspepsia": ["indigestion"],
+    "reflux": ["acid reflux", "heartburn"],
+    "nausea": ["nausea or vomiting", "vomiting"],
+    "abdominal pain": ["stomach pain", "tummy pain"],
+    "jaundice": ["yellowing of skin"],
+    "iron-deficiency anaemia": ["iron deficiency anaemia", "iron-deficiency anemia",
+                                "iron deficiency anemia"],
+    "anaemia": ["anemia"],
+    "rectal bleeding": ["blood in stool", "bleeding from the rectum"],
+    "change in bowel habit": ["altered bowel habit", "bowel habit change"],
+    "diarrhoea": ["diarrhea"],
+    "visible haematuria": ["visible hematuria"],
+    "haematuria": ["hematuria", "blood in urine"],
+    "breast lump": ["lump in breast", "lump in the breast"],
+    "lymphadenopathy": ["swollen lymph nodes", "enlarged lymph nodes"],
+    "night sweats": [],
+    "bruising": ["unexplained bruising", "petechiae"],
+    "bone pain": [],
+    "back pain": [],
+    "thrombocytosis": ["raised platelet count", "high platelets"],
+}
+
+# Qualifiers that do not change which recommendations apply.
+GENERIC_TERMS = {
+    "unexplained", "persistent", "new", "recurrent", "ongoing", "refer", "referral",
+    "referrals", "ng12", "nice", "guideline", "guidelines", "symptom", "symptoms",
+    "cancer", "suspected", "recommendation", "recommendations", "for", "with", "of",
+}
+
+
+def normalize_symptom(text: str) -> str:
+    """Lowercase, strip punctuation and generic qualifiers."""
+    text = re.sub(r"[^a-z0-9\- ]+", " ", text.lower())
+    tokens = [t for t in text.replace("-", " - ").split() if t not in GENERIC_TERMS]
+    return " ".join(tokens).replace(" - ", "-")
+
+
+def build_alias_map() -> Dict[str, str]:
+    aliases = {}
+    for canonical, synonyms in SYMPTOM_VOCABULARY.items():
+        for term in [canonical, *synonyms]:
+            aliases[normalize_symptom(term)] = canonical
+    return aliases
+
+
+def _lexical_matches(terms: List[str], metadata: list) -> np.ndarray:
+    mask = np.zeros(len(metadata), dtype=bool)
+    for i, row in enumerate(metadata):
+        text = row.get("raw_text", "").lower()
+        mask[i] = any(term in text for term in terms)
+    return mask
+
+
+def build_symptom_index(top_k: int = TOP_K) -> Dict:
+    """Rank guideline chunks for every symptom in the vocabulary.
+
+    Chunks that mention a symptom (or one of its aliases) seed a centroid in
+    embedding space; every chunk is then ranked by cosine similarity to that
+    centroid, with a bonus for literal mentions. The stored score is the plain
+    cosine similarity, on the same scale as vector search, so thresholds apply
+    to both. Symptoms the guideline never mentions are left out, so they fall
+    back to vector search at runtime.
+    """
+    embeddings = load_embeddings()
+    metadata = load_metadata()
+    faiss.normalize_L2(embeddings)
+
+    symptoms = {}
+    for canonical, synonyms in SYMPTOM_VOCABULARY.items():
+        terms = [canonical.lower(), *(s.lower() for s in synonyms)]
+        mask = _lexical_matches(terms, metadata)
+        if not mask.any():
+            print(f"  {canonical}: not mentioned in guideline, skipping")
+            continue
+
+        centroid = embeddings[mask].mean(axis=0, keepdims=True)
+        faiss.normalize_L2(centroid)
+        scores = embeddings @ centroid[0]
+        # The bonus only orders the chunks; it is not part of the stored score
+        ranked = np.argsort(-(scores + LEXICAL_BONUS * mask))[:top_k]
+        symptoms[canonical] = [[int(i), round(float(scores[i]), 4)] for i in ranked]
+        print(f"  {canonical}: {int(mask.sum())} mentions, top page {metadata[ranked[0]]['page_number']}")
+
+    index = {
+        "version": SYMPTOM_INDEX_VERSION,
+        "num_vectors": len(metadata),
+        "chunks": ChunkIdIndex.from_metadata(metadata).fingerprint(),
+        "aliases": {alias: c for alias, c in build_alias_map().items() if c in symptoms},
+        "symptoms": symptoms,
+    }
+    with open(SYMPTOM_INDEX_PATH, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    print(f"Saved symptom index ({len(symptoms)} symptoms) to: {SYMPTOM_INDEX_PATH}")
+    return index
+
+
+def load_symptom_index(
+    path=SYMPTOM_INDEX_PATH, num_vectors: Optional[int] = None, chunks: Optional[str] = None
+) -> Optional[Dict]:
+    """Load the persisted index, or None if missing, out of date or built for
+    another corpus (``num_vectors`` and the ``chunks`` fingerprint differ)."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != SYMPTOM_INDEX_VERSION:
+        log.warning("Symptom index version mismatch, ignoring it", path=str(path))
+        return None
+    if (num_vectors is not None and index.get("num_vectors") != num_vectors) or \
+            (chunks is not None and index.get("chunks") != chunks):
+        log.warning("Symptom index does not match FAISS index, ignoring it", path=str(path))
+        return None
+    return index
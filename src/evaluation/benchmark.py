@@ -0,0 +1,311 @@
+"""Micro-benchmarks for the ingestion and retrieval hot paths.
+
+Generates synthetic corpora (random unit vectors at the real embedding
+dimension plus metadata shaped like ``data/metadata.json``) at increasing
+sizes and times each stage:
+
+- ``chunking``: ``recursive_chunk_text`` throughput on guideline-like text
+- ``compression``: tool-output tokens for every indexed symptom with and
+  without passage compression, and its latency (real index and metadata)
+- ``build``: HNSW build time and resident memory growth (``create_index``)
+- ``load``: startup time of ``RAGSearchTool`` (index + metadata from disk)
+- ``query``: ``RAGSearchTool.search_by_vector`` latency percentiles
+- ``out_of_core``: ``build_index_from_file`` on an ``.npy`` file of each
+  size, with its peak memory next to the file size (``--out-of-core``,
+  optionally with ``--factory``)
+- ``pdf``: ``process_pdf`` on the real guideline (``--pdf``, slow)
+
+No network calls are made. Results go to a JSON report; ``--compare`` checks
+them against an earlier report and exits non-zero on regressions.
+
+    python -m src.evaluation.benchmark --sizes 270,10000,100000
+    python -m src.evaluation.benchmark --sizes 270,10000,100000,1000000 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from src.embeddings.faiss import build_index_from_file, create_index
+from src.embeddings.metadata_store import store_paths, write_metadata_store
+from src.preprocess.chunking import recursive_chunk_text
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+METADATA_PATH = os.path.join(DATA_DIR, "metadata.json")
+PDF_PATH = os.path.join(DATA_DIR, "suspected-cancer-recognition-and-referral.pdf")
+
+EMBEDDING_DIM = 768
+DEFAULT_SIZES = [270, 10_000, 100_000]
+DEFAULT_QUERIES = 200
+REGRESSION_TOLERANCE = 0.25
+
+# Metrics compared by --compare; all are "lower is better"
+TRACKED_METRICS = ["build_s", "build_rss_mb", "load_s", "query_p50_ms", "query_p95_ms", "query_p99_ms"]
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def private_rss_mb() -> float:
+    """Resident memory not backed by shared file pages (heap, anonymous maps)."""
+    with open("/proc/self/statm", "r") as f:
+        fields = f.read().split()
+    return (int(fields[1]) - int(fields[2])) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 4)
+    return {"query_p50_ms": pick(0.50), "query_p95_ms": pick(0.95), "query_p99_ms": pick(0.99)}
+
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, EMBEDDING_DIM), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def synthetic_metadata(n: int) -> List[Dict]:
+    """Metadata entries shaped like the real ones, cycling through real text."""
+    with open(METADATA_PATH, "r", encoding="utf-8") as f:
+        real = json.load(f)
+    return [
+        {**real[i % len(real)], "element_id": f"synthetic-{i}"}
+        for i in range(n)
+    ]
+
+
+def bench_chunking(repeats: int = 20) -> Dict:
+    with open(METADATA_PATH, "r", encoding="utf-8") as f:
+        text = "\n\n".join(m["raw_text"] for m in json.load(f))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        chunks = recursive_chunk_text(text)
+    elapsed = (time.perf_counter() - start) / repeats
+    return {
+        "stage": "chunking",
+        "chars": len(text),
+        "chunks": len(chunks),
+        "chunk_s": round(elapsed, 4),
+        "mb_per_s": round(len(text) / 2**20 / elapsed, 2),
+    }
+
+
+def bench_compression(k: int = 4) -> Dict:
+    """Tokens the agent receives per guideline lookup, raw vs compressed."""
+    from src.agent.agent import _format_results
+    from src.agent.compression import PASSAGE_TOKEN_BUDGET, compress_results, get_scorer
+    from src.tools.tokens import estimate_tokens
+    from src.tools.rag_search import rag_tool
+
+    get_scorer()
+    before, after, samples = [], [], []
+    for symptom in rag_tool.symptom_index["symptoms"]:
+        results = rag_tool.lookup_symptom(symptom, k=k)
+        start = time.perf_counter()
+        compressed = compress_results(symptom, results)
+        samples.append(time.perf_counter() - start)
+        before.append(estimate_tokens(_format_results(results)))
+        after.append(estimate_tokens(_format_results(compressed)))
+    return {
+        "stage": "compression",
+        "queries": len(samples),
+        "budget_tokens": PASSAGE_TOKEN_BUDGET,
+        "tokens_before": round(sum(before) / len(before), 1),
+        "tokens_after": round(sum(after) / len(after), 1),
+        "reduction": round(1 - sum(after) / sum(before), 3),
+        **{name.replace("query", "compress"): v for name, v in percentiles(samples).items()},
+    }
+
+
+def bench_size(n: int, queries: int, k: int, workdir: str) -> Dict:
+    """Build, persist, load and query a synthetic index of ``n`` chunks."""
+    from src.tools.rag_search import RAGSearchTool
+
+    result = {"stage": "index", "size": n}
+    vectors = random_vectors(n)
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    index = create_index(vectors)
+    result["build_s"] = round(time.perf_counter() - start, 3)
+    result["build_rss_mb"] = round(rss_mb() - rss_before, 1)
+    del vectors
+
+    index_path = os.path.join(workdir, f"bench-{n}.index")
+    metadata_path = os.path.join(workdir, f"bench-{n}.json")
+    faiss.write_index(index, index_path)
+    del index
+    metadata = synthetic_metadata(n)
+    with open(metadata_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+    write_metadata_store(metadata, metadata_path)
+    del metadata
+    store_files = store_paths(metadata_path)
+    lines_path = store_files[0]
+    result["index_mb"] = round(os.path.getsize(index_path) / 2**20, 1)
+    result["metadata_mb"] = round(os.path.getsize(lines_path) / 2**20, 1)
+
+    rss_before = rss_mb()
+    private_before = private_rss_mb() if os.path.exists("/proc/self/statm") else None
+    start = time.perf_counter()
+    tool = RAGSearchTool(index_path, metadata_path)
+    tool.load()
+    result["load_s"] = round(time.perf_counter() - start, 3)
+    result["load_rss_mb"] = round(rss_mb() - rss_before, 1)
+
+    query_vectors = random_vectors(queries, seed=1)
+    tool.search_by_vector(query_vectors[0], k)  # warm up
+    samples = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        tool.search_by_vector(vector, k)
+        samples.append(time.perf_counter() - start)
+    result.update(percentiles(samples))
+    if private_before is not None:
+        # With INDEX_MMAP the index lives in shared page cache, not worker heap
+        result["private_rss_mb"] = round(private_rss_mb() - private_before, 1)
+
+    del tool
+    for path in (index_path, metadata_path, *store_files):
+        os.remove(path)
+    return result
+
+
+def bench_out_of_core(n: int, workdir: str, factory: str = "", chunk_size: int = 65536) -> Dict:
+    """Out-of-core build from a memory-mapped embeddings file of ``n`` vectors."""
+    path = os.path.join(workdir, f"bench-{n}.npy")
+    # Written block by block so the file never has to fit in memory either
+    vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, EMBEDDING_DIM))
+    for begin in range(0, n, chunk_size):
+        vectors[begin:begin + chunk_size] = random_vectors(min(chunk_size, n - begin), seed=begin)
+    vectors.flush()
+    del vectors
+
+    rss_before = rss_mb()
+    private_before = private_rss_mb() if os.path.exists("/proc/self/statm") else None
+    index, stats = build_index_from_file(path, factory=factory, chunk_size=chunk_size)
+    result = {
+        "stage": "out_of_core",
+        "size": n,
+        "factory": stats["factory"],
+        "embeddings_mb": round(os.path.getsize(path) / 2**20, 1),
+        "build_s": stats["build_s"],
+        "build_peak_rss_mb": round(stats["peak_rss_mb"] - rss_before, 1),
+        "build_peak_private_mb": round(stats["peak_private_mb"] - private_before, 1) if private_before is not None else None,
+        "index_mb": round(faiss.serialize_index(index).nbytes / 2**20, 1),
+    }
+    del index
+    os.remove(path)
+    return result
+
+
+def bench_pdf() -> Dict:
+    from src.preprocess.parsed_data import process_pdf
+
+    start = time.perf_counter()
+    pages, elements = process_pdf(PDF_PATH)
+    return {
+        "stage": "pdf",
+        "pages": len(pages),
+        "elements": len(elements),
+        "parse_s": round(time.perf_counter() - start, 2),
+    }
+
+
+def find_regressions(current: List[Dict], previous: List[Dict], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Metrics that grew by more than ``tolerance`` relative to a previous run."""
+    earlier = {r["size"]: r for r in previous if r.get("stage") == "index"}
+    regressions = []
+    for r in current:
+        base = earlier.get(r.get("size"))
+        if r.get("stage") != "index" or base is None:
+            continue
+        for metric in TRACKED_METRICS:
+            now, then = r.get(metric), base.get(metric)
+            # Ignore sub-millisecond / sub-MB noise
+            if now is None or not then or now - then < 1:
+                continue
+            if now > then * (1 + tolerance):
+                regressions.append(f"size {r['size']}: {metric} {now} > {then} + {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and retrieval hot paths")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated corpus sizes (up to 1000000)")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries per size")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pdf", action="store_true", help="Also time process_pdf on the real guideline")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Also build each size out of core from a memory-mapped .npy file")
+    parser.add_argument("--factory", default="", help='Index for --out-of-core, e.g. "IVF1024,PQ64" (default: HNSW)')
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON report")
+    parser.add_argument("--compare", help="Earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = [bench_chunking()]
+    print(json.dumps(results[-1]))
+    results.append(bench_compression())
+    print(json.dumps(results[-1]))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            print(f"\n--- Benchmarking {n} chunks ---")
+            results.append(bench_size(n, args.queries, args.k, workdir))
+            print(json.dumps(results[-1]))
+            if args.out_of_core:
+                results.append(bench_out_of_core(n, workdir, args.factory))
+                print(json.dumps(results[-1]))
+
+    if args.pdf:
+        results.append(bench_pdf())
+        print(json.dumps(results[-1]))
+
+    report = {
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "cpus": os.cpu_count(),
+        "dim": EMBEDDING_DIM,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+        regressions = find_regressions(results, previous, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for r in regressions:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
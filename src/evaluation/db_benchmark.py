@@ -0,0 +1,161 @@
+"""Chat history benchmarks.
+
+Writes: message inserts/sec and per-insert latency with N concurrent
+sessions for each durability mode of ``DatabaseManager``, plus the old
+connection-per-operation pattern for comparison.
+
+Reads (``--history-sizes``): query time and JSON payload size of a full
+history read, ``get_recent`` and one history page for sessions of growing
+length, with and without the ``(session_id, id)`` index.
+
+Everything runs against a temporary database.
+
+    python -m src.evaluation.db_benchmark --sessions 50 --messages 20
+    python -m src.evaluation.db_benchmark --modes "" --history-sizes 1000,10000,100000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import aiosqlite
+
+from src.database.db_manager import DURABILITY_MODES, HISTORY_PAGE_SIZE, DatabaseManager
+
+MODES = ["per-connection", *DURABILITY_MODES]
+
+
+async def _legacy_add_message(db_path: str, session_id: str, role: str, content: str):
+    """The previous write path: one connection and commit per statement."""
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+        await db.commit()
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute(
+            "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", (session_id, role, content)
+        )
+        await db.commit()
+
+
+async def bench_mode(mode: str, sessions: int, messages: int, workdir: str) -> Dict:
+    db_path = os.path.join(workdir, f"bench-{mode}.db")
+    manager = DatabaseManager(db_path, durability="sync" if mode == "per-connection" else mode)
+    manager.initialize()
+    content = "Assess patient PT-101 for cancer referral. " * 10
+    latencies: List[float] = []
+
+    async def session(i: int):
+        for j in range(messages):
+            start = time.perf_counter()
+            if mode == "per-connection":
+                await _legacy_add_message(db_path, f"s{i}", "user", content)
+            else:
+                await manager.add_message(f"s{i}", "user", content)
+            latencies.append(time.perf_counter() - start)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(sessions)))
+        await manager.journal.flush()
+        elapsed = time.perf_counter() - start
+        journal = manager.journal.stats()
+        await manager.close()
+
+    total = sessions * messages
+    ordered = sorted(latencies)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "messages": total,
+        "elapsed_s": round(elapsed, 3),
+        "inserts_per_s": round(total / elapsed, 1),
+        "latency_p50_ms": pick(0.50),
+        "latency_p99_ms": pick(0.99),
+        "mean_batch": journal["mean_batch"],
+    }
+
+
+async def _timed(fn, repeats: int = 5):
+    """Best-of-``repeats`` wall time in ms and the last result."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = await fn()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3), result
+
+
+async def bench_history(size: int, workdir: str, other_sessions: int = 20) -> List[Dict]:
+    """Read costs for one session of ``size`` messages among busy neighbours."""
+    db_path = os.path.join(workdir, f"history-{size}.db")
+    manager = DatabaseManager(db_path, durability="sync")
+    manager.initialize()
+    content = "Assess patient PT-101 for cancer referral. " * 5
+    # Interleave the target session with others, as a shared server would
+    rows = [
+        (f"s{j}" if j else "target", "user" if i % 2 else "assistant", content)
+        for i in range(size) for j in range(other_sessions + 1)
+    ]
+    async with manager.pool.connection() as db:
+        await db.executemany("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", rows)
+        await db.commit()
+
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for indexed in (True, False):
+            if not indexed:
+                async with manager.pool.connection() as db:
+                    await db.execute("DROP INDEX idx_messages_session_id")
+                    await db.commit()
+            full_ms, full = await _timed(lambda: manager.get_history("target"), repeats=3)
+            recent_ms, _ = await _timed(lambda: manager.get_recent("target", 6))
+            middle = full[len(full) // 2]["id"]
+            page_ms, page = await _timed(
+                lambda: manager.get_history("target", before_id=middle, limit=HISTORY_PAGE_SIZE)
+            )
+            results.append({
+                "size": size,
+                "indexed": indexed,
+                "full_ms": full_ms,
+                "full_payload_kb": round(len(json.dumps(full, default=str)) / 1024, 1),
+                "recent_ms": recent_ms,
+                "page_ms": page_ms,
+                "page_payload_kb": round(len(json.dumps(page, default=str)) / 1024, 1),
+            })
+        await manager.close()
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat history writes and reads")
+    parser.add_argument("--sessions", type=int, default=50, help="Concurrent sessions")
+    parser.add_argument("--messages", type=int, default=20, help="Messages per session")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {MODES}")
+    parser.add_argument("--history-sizes", default="", help="Comma-separated session lengths for the read benchmark")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in filter(None, (m.strip() for m in args.modes.split(","))):
+            results.append(await bench_mode(mode, args.sessions, args.messages, workdir))
+            print(json.dumps(results[-1]))
+        for size in filter(None, (s.strip() for s in args.history_sizes.split(","))):
+            for result in await bench_history(int(size), workdir):
+                results.append(result)
+                print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
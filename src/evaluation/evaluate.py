@@ -1,72 +1,260 @@
+"""NG12 agent evaluation suite.
+
+Runs the golden set in ``data/eval/golden.json`` concurrently and measures:
+
+- retrieval recall@k of ``rag_tool.search`` against the labelled pages,
+- citation recall of the pages the agent actually cited,
+- assessment-category accuracy for patient cases,
+- LLM requests, tokens and structured-output retries, and end-to-end latency.
+
+The metrics are written to a JSON report and compared against a stored
+baseline; the run exits non-zero when quality or latency regresses beyond
+the configured thresholds, so it can gate CI or a deploy.
+
+    python -m src.evaluation.evaluate --concurrency 4
+    python -m src.evaluation.evaluate --update-baseline
+"""
+
+import argparse
 import asyncio
 import json
 import os
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from pydantic_ai.usage import RunUsage
 
 from src.agent.agent import run_chat
-from src.tools.rag_search import rag_tool
+from src.database.db_manager import db_manager
 from src.tools.patient_data import patient_tool
+from src.tools.rag_search import rag_tool
+from src.tools.rate_limiter import Priority, current_priority
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+EVAL_DIR = os.path.join(PROJECT_ROOT, "data", "eval")
+GOLDEN_PATH = os.path.join(EVAL_DIR, "golden.json")
+BASELINE_PATH = os.path.join(EVAL_DIR, "baseline.json")
+
+CATEGORIES = ["URGENT REFERRAL", "URGENT INVESTIGATION", "SAFETY NETTING", "ROUTINE"]
+
+# Regression thresholds relative to the baseline
+MAX_QUALITY_DROP = 0.05       # absolute drop in recall / accuracy
+MAX_LATENCY_INCREASE = 0.25   # relative increase in p50 / p95 latency
+MAX_TOKEN_INCREASE = 0.25     # relative increase in tokens per case
+
+QUALITY_METRICS = ["retrieval_recall", "citation_recall", "category_accuracy"]
+LATENCY_METRICS = ["latency_p50_ms", "latency_p95_ms"]
+COST_METRICS = ["tokens_per_case", "output_tokens_per_case"]
+
+
+def load_golden(path: str = GOLDEN_PATH) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+
+def normalize_category(text: str) -> Optional[str]:
+    """Map a free-text assessment to one of the NG12 categories."""
+    upper = (text or "").upper()
+    for category in CATEGORIES:
+        if category in upper:
+            return category
+    return None
+
+
+def recall(found: List[int], relevant: List[int]) -> Optional[float]:
+    """Share of the labelled pages that were found; None for unlabelled cases."""
+    if not relevant:
+        return None
+    return len(set(found) & set(relevant)) / len(set(relevant))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def mean(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 4) if values else None
+
 
-PATIENTS = patient_tool.patients
+async def eval_case(case: Dict, run_id: str, k: int, retrieval_only: bool, semaphore: asyncio.Semaphore) -> Dict:
+    """Evaluate one golden case: retrieval first, then the full agent turn."""
+    current_priority.set(Priority.BATCH)
+    async with semaphore:
+        item = {"id": case["id"], "type": case["type"]}
+        relevant = case.get("relevant_pages", [])
 
-async def eval_patient(patient_id: str, description: str):
-    """Evaluate a single patient case."""
+        start = time.perf_counter()
+        results = await rag_tool.search(case.get("query", case["message"]), k)
+        item["retrieval_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        item["retrieved_pages"] = [r["page"] for r in results]
+        item["retrieval_recall"] = recall(item["retrieved_pages"], relevant)
+        if retrieval_only:
+            return item
+
+        session_id = f"eval-{run_id}-{case['id']}"
+        usage = RunUsage()
+        start = time.perf_counter()
+        try:
+            response = await run_chat(session_id, case["message"], usage=usage)
+        except Exception as e:
+            print(f"[EVAL] {case['id']} failed: {type(e).__name__}: {e}")
+            item["error"] = f"{type(e).__name__}: {e}"
+            return item
+        finally:
+            item["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            item["requests"] = usage.requests
+            item["input_tokens"] = usage.input_tokens
+            item["output_tokens"] = usage.output_tokens
+            item["output_retries"] = usage.details.get("output_retries", 0)
+            await db_manager.clear_history(session_id)
+
+        item["assessment"] = response.assessment
+        item["cited_pages"] = sorted({c.page for c in response.citations if c.page is not None})
+        item["citation_recall"] = recall(item["cited_pages"], relevant)
+        expected = case.get("expected_assessment")
+        if expected:
+            item["category_correct"] = normalize_category(response.assessment) in expected
+        return item
+
+
+def summarize(items: List[Dict]) -> Dict:
+    answered = [i for i in items if "latency_ms" in i and "error" not in i]
+    graded = [i for i in answered if "category_correct" in i]
+    latencies = [i["latency_ms"] for i in answered]
+    tokens = [i["input_tokens"] + i["output_tokens"] for i in answered]
+    return {
+        "cases": len(items),
+        "errors": sum(1 for i in items if "error" in i),
+        "retrieval_recall": mean([i["retrieval_recall"] for i in items]),
+        "citation_recall": mean([i.get("citation_recall") for i in answered]),
+        "category_accuracy": round(sum(i["category_correct"] for i in graded) / len(graded), 4) if graded else None,
+        "requests": sum(i.get("requests", 0) for i in items),
+        "input_tokens": sum(i.get("input_tokens", 0) for i in items),
+        "output_tokens": sum(i.get("output_tokens", 0) for i in items),
+        "tokens_per_case": round(sum(tokens) / len(tokens), 1) if tokens else None,
+        "output_tokens_per_case": round(sum(i["output_tokens"] for i in answered) / len(answered), 1) if answered else None,
+        "output_retries": sum(i.get("output_retries", 0) for i in items),
+        # Share of answered cases where the model had to redo its structured output
+        "retry_rate": round(sum(1 for i in answered if i["output_retries"]) / len(answered), 4) if answered else None,
+        "latency_p50_ms": percentile(latencies, 0.50),
+        "latency_p95_ms": percentile(latencies, 0.95),
+        "retrieval_p50_ms": percentile([i["retrieval_ms"] for i in items], 0.50),
+    }
+
+
+def find_regressions(
+    metrics: Dict,
+    baseline: Dict,
+    max_quality_drop: float = MAX_QUALITY_DROP,
+    max_latency_increase: float = MAX_LATENCY_INCREASE,
+    max_token_increase: float = MAX_TOKEN_INCREASE,
+) -> List[str]:
+    """Compare metrics with the baseline and describe every regression."""
+    regressions = []
+    if metrics["errors"] > baseline.get("errors", 0):
+        regressions.append(f"errors: {metrics['errors']} (baseline {baseline.get('errors', 0)})")
+    for name in QUALITY_METRICS:
+        current, base = metrics.get(name), baseline.get(name)
+        if current is not None and base is not None and current < base - max_quality_drop:
+            regressions.append(f"{name}: {current:.3f} < baseline {base:.3f} - {max_quality_drop}")
+    for names, limit in ((LATENCY_METRICS, max_latency_increase), (COST_METRICS, max_token_increase)):
+        for name in names:
+            current, base = metrics.get(name), baseline.get(name)
+            if current is not None and base and current > base * (1 + limit):
+                regressions.append(f"{name}: {current} > baseline {base} + {limit:.0%}")
+    return regressions
+
+
+async def run_evaluation(cases: List[Dict], k: int = 5, concurrency: int = 4, retrieval_only: bool = False) -> Dict:
+    run_id = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    start = time.perf_counter()
+    items = await asyncio.gather(*(eval_case(c, run_id, k, retrieval_only, semaphore) for c in cases))
+    metrics = summarize(list(items))
+    metrics["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return {"run_id": run_id, "k": k, "concurrency": concurrency, "metrics": metrics, "cases": list(items)}
+
+
+def print_report(report: Dict):
     print(f"\n{'='*60}")
-    print(f"Patient: {patient_id} - {description}")
+    print(f"{'Case':<28}{'Recall@k':>10}{'Cited':>8}{'Category':>10}{'Latency':>10}")
+    print('-'*60)
+    for i in report["cases"]:
+        fmt = lambda v: "-" if v is None else f"{v:.2f}"
+        correct = {True: "ok", False: "WRONG"}.get(i.get("category_correct"), "-")
+        latency = f"{i['latency_ms']:.0f}ms" if "latency_ms" in i else "-"
+        status = " ERROR" if "error" in i else ""
+        print(f"{i['id']:<28}{fmt(i['retrieval_recall']):>10}{fmt(i.get('citation_recall')):>8}{correct:>10}{latency:>10}{status}")
     print('='*60)
-    
-    session_id = f"eval_{patient_id}"
-    prompt = f"Assess patient {patient_id} for cancer referral"
-    
-    try:
-        response = await run_chat(session_id, prompt)
-        
-        print(f"\nAssessment: {response.assessment}")
-        print(f"Reasoning: {response.reasoning[:150]}...")
-        print(f"Citations: {len(response.citations)} found")
-        
-        if response.citations:
-            print("\nCitation samples:")
-            for i, cite in enumerate(response.citations[:2]):
-                print(f"  [{i+1}] {cite.source} p.{cite.page}: {cite.excerpt[:60]}...")
-        
-        return True
-        
-    except Exception as e:
-        print(f"Evaluation failed for {patient_id}: {str(e)[:100]}")
-        return False
+    for name, value in report["metrics"].items():
+        print(f"{name:<20} {value}")
+
 
 async def main():
+    parser = argparse.ArgumentParser(description="Evaluate the NG12 agent against the golden set")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--k", type=int, default=5, help="Passages retrieved for recall@k")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--retrieval-only", action="store_true", help="Skip the agent; measure retrieval only")
+    parser.add_argument("--output", default="eval_report.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run's metrics as the baseline")
+    parser.add_argument("--max-quality-drop", type=float, default=MAX_QUALITY_DROP)
+    parser.add_argument("--max-latency-increase", type=float, default=MAX_LATENCY_INCREASE)
+    parser.add_argument("--max-token-increase", type=float, default=MAX_TOKEN_INCREASE)
+    args = parser.parse_args()
+
     print("="*60)
     print("NG12 Agent Evaluation Suite")
     print("="*60)
-    
+
     # Verify pipeline is loaded
-    if rag_tool.index is None:
-        print("FAILED: FAISS index not loaded. Run 'python main.py' first.")
+    try:
+        rag_tool.load()
+    except FileNotFoundError:
+        print("FAILED: FAISS index not found. Run 'python main.py' first.")
+        sys.exit(1)
+    cases = load_golden(args.golden)
+    missing = [c["id"] for c in cases if c.get("patient_id") and await patient_tool.get_patient_data(c["patient_id"]) is None]
+    if missing:
+        print(f"Warning: golden cases reference unknown patients: {missing}")
+    print(f"Running {len(cases)} cases (k={args.k}, concurrency {args.concurrency})")
+
+    report = await run_evaluation(cases, args.k, args.concurrency, args.retrieval_only)
+    print_report(report)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report["metrics"], f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
         return
-    print("Pipeline loaded (FAISS index ready)")
-    print(f"Patient database loaded ({len(PATIENTS)} patients)")
-    
-    test_cases = [
-        ("PT-101", "Hemoptysis - high risk"),
-        ("PT-108", "Breast lump - urgent referral"),
-        ("PT-107", "Persistent hoarseness - smoker"),
-        ("PT-102", "Low risk case (young, brief symptoms)")
-    ]
-    
-    results = []
-    for pid, desc in test_cases:
-        if pid in PATIENTS:
-            success = await eval_patient(pid, desc)
-            results.append(success)
-        else:
-            print(f"\n✗ Patient {pid} not found in database")
-            results.append(False)
-    
-    # Summary
-    print(f"\n{'='*60}")
-    print(f"Results: {sum(results)}/{len(results)} passed")
-    print('='*60)
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --update-baseline to create one.")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = find_regressions(
+        report["metrics"], baseline, args.max_quality_drop, args.max_latency_increase, args.max_token_increase
+    )
+    if regressions:
+        print("\nREGRESSIONS against baseline:")
+        for r in regressions:
+            print(f"  - {r}")
+        sys.exit(1)
+    print("\nNo regressions against baseline.")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
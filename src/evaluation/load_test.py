@@ -0,0 +1,166 @@
+"""Load generator for the /chat endpoint.
+
+Drives N concurrent sessions against a running API and reports latency
+percentiles, throughput and error rates. With ``--spawn-server`` it starts
+its own API in replay mode (``VERTEX_MODE=replay``), so a full run needs no
+network access or Vertex quota. That API runs with the ``RATE_LIMIT_*``
+ceilings lifted: replayed calls cost no quota, and at the default 5 model
+requests per second the run would measure the limiter's pacing rather than
+the API (``--keep-rate-limits`` keeps them):
+
+    python -m src.evaluation.load_test --spawn-server --sessions 20 --turns 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+DEFAULT_MESSAGES = [
+    "Assess patient PT-101 for cancer referral",
+    "Assess patient PT-108 for cancer referral",
+    "What are the referral criteria for unexplained haemoptysis?",
+    "When should a breast lump be referred urgently?",
+]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def run_session(url: str, index: int, turns: int, messages: List[str], timeout: float) -> List[Dict]:
+    """Run one session's turns sequentially, like a single user would."""
+    session_id = f"load-{uuid.uuid4().hex[:8]}"
+    samples = []
+    with requests.Session() as http:
+        for turn in range(turns):
+            message = messages[(index + turn) % len(messages)]
+            start = time.perf_counter()
+            try:
+                response = http.post(f"{url}/chat", json={"session_id": session_id, "message": message}, timeout=timeout)
+                error = None if response.ok else f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = type(e).__name__
+            samples.append({"latency_ms": (time.perf_counter() - start) * 1000, "error": error})
+        try:
+            http.delete(f"{url}/chat/{session_id}", timeout=timeout)
+        except requests.RequestException:
+            pass
+    return samples
+
+
+def run_load(url: str, sessions: int, turns: int, messages: List[str], timeout: float = 120.0) -> Dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(run_session, url, i, turns, messages, timeout) for i in range(sessions)]
+        samples = [s for f in futures for s in f.result()]
+    elapsed = time.perf_counter() - start
+
+    latencies = [s["latency_ms"] for s in samples if s["error"] is None]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s["error"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    failed = sum(errors.values())
+    return {
+        "url": url,
+        "sessions": sessions,
+        "turns": turns,
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+        "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+    }
+
+
+def wait_until_healthy(url: str, timeout: float = 60.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=2).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+# Rate ceilings for a spawned replay server, far above anything one host drives
+LIFTED_RATE_LIMIT_RPS = "100000"
+
+
+def spawn_server(port: int, keep_rate_limits: bool = False) -> subprocess.Popen:
+    """Start the API in replay mode on the given port, rate limits lifted unless kept."""
+    env = {**os.environ, "VERTEX_MODE": "replay"}
+    if not keep_rate_limits:
+        env.update(RATE_LIMIT_GENERATE_RPS=LIFTED_RATE_LIMIT_RPS, RATE_LIMIT_EMBED_RPS=LIFTED_RATE_LIMIT_RPS)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /chat endpoint")
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Messages per session")
+    parser.add_argument("--messages", help="File with one message per line (defaults to built-in prompts)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--spawn-server", action="store_true",
+                        help="Start a replay-mode API for the run, with the RATE_LIMIT_* ceilings lifted")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="With --spawn-server, keep the configured RATE_LIMIT_* ceilings")
+    parser.add_argument("--port", type=int, default=8099, help="Port for --spawn-server")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    messages = DEFAULT_MESSAGES
+    if args.messages:
+        with open(args.messages, "r", encoding="utf-8") as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    server = None
+    url = args.url.rstrip("/")
+    if args.spawn_server:
+        url = f"http://127.0.0.1:{args.port}"
+        print(f"Starting replay-mode API on {url}...")
+        server = spawn_server(args.port, args.keep_rate_limits)
+
+    try:
+        if not wait_until_healthy(url):
+            print(f"API at {url} is not responding")
+            sys.exit(1)
+        print(f"Running {args.sessions} sessions x {args.turns} turns against {url}...")
+        report = run_load(url, args.sessions, args.turns, messages, args.timeout)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
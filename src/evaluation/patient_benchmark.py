@@ -0,0 +1,140 @@
+"""Patient registry benchmarks.
+
+For synthetic registries of increasing size: bulk import throughput (CSV
+and NDJSON), database size, point lookup latency with a cold and a warm LRU,
+cohort query latency, and resident memory before and after, which should
+stay flat as the registry grows.
+
+Everything runs against a temporary database.
+
+    python -m src.evaluation.patient_benchmark --sizes 10000,100000,1000000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from src.database.patient_store import CSV_LIST_SEPARATOR, PatientStore
+from src.evaluation.benchmark import rss_mb
+
+DEFAULT_SIZES = [10_000, 100_000]
+SYMPTOMS = [
+    "unexplained hemoptysis", "fatigue", "persistent cough", "weight loss", "dysphagia",
+    "rectal bleeding", "abdominal pain", "breast lump", "haematuria", "hoarseness",
+]
+SMOKING = ["Current Smoker", "Ex-Smoker", "Never Smoked"]
+
+
+def synthetic_patient(i: int, rng: random.Random) -> Dict:
+    return {
+        "patient_id": f"PT-{i:08d}",
+        "name": f"Patient {i}",
+        "age": rng.randint(18, 95),
+        "gender": rng.choice(["Male", "Female"]),
+        "smoking_history": rng.choice(SMOKING),
+        "symptoms": rng.sample(SYMPTOMS, rng.randint(1, 3)),
+        "symptom_duration_days": rng.randint(1, 180),
+    }
+
+
+def write_registry(path: str, n: int, seed: int = 0):
+    """Write ``n`` synthetic patients as CSV or NDJSON, streaming."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            writer = csv.writer(f)
+            writer.writerow(["patient_id", "name", "age", "gender", "smoking_history", "symptoms", "symptom_duration_days"])
+            for i in range(n):
+                p = synthetic_patient(i, rng)
+                writer.writerow([*(p[k] for k in ("patient_id", "name", "age", "gender", "smoking_history")),
+                                 CSV_LIST_SEPARATOR.join(p["symptoms"]), p["symptom_duration_days"]])
+        else:
+            for i in range(n):
+                f.write(json.dumps(synthetic_patient(i, rng)) + "\n")
+
+
+def _pick(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+
+async def _latencies(fn, args: List) -> Dict[str, float]:
+    samples = []
+    for a in args:
+        start = time.perf_counter()
+        await fn(a)
+        samples.append(time.perf_counter() - start)
+    return {"p50_ms": _pick(samples, 0.50), "p99_ms": _pick(samples, 0.99)}
+
+
+async def bench_size(n: int, fmt: str, lookups: int, workdir: str) -> Dict:
+    source = os.path.join(workdir, f"registry-{n}.{fmt}")
+    db_path = os.path.join(workdir, f"patients-{n}-{fmt}.db")
+    write_registry(source, n)
+    result = {"size": n, "format": fmt, "source_mb": round(os.path.getsize(source) / 2**20, 1)}
+
+    store = PatientStore(db_path, cache_size=lookups)
+    rss_before = rss_mb()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        imported = store.import_file(source)
+    result["import_s"] = round(n / imported["rows_per_s"], 2) if imported["rows_per_s"] else None
+    result["import_rows_per_s"] = imported["rows_per_s"]
+    result["import_rss_mb"] = round(rss_mb() - rss_before, 1)
+    result["db_mb"] = round(os.path.getsize(db_path) / 2**20, 1)
+
+    rng = random.Random(1)
+    ids = [f"PT-{rng.randrange(n):08d}" for _ in range(lookups)]
+    rss_before = rss_mb()
+    cold = await _latencies(store.get, ids)
+    warm = await _latencies(store.get, ids)
+    result.update({f"lookup_cold_{k}": v for k, v in cold.items()})
+    result.update({f"lookup_warm_{k}": v for k, v in warm.items()})
+
+    cohorts = [
+        {"symptom": "weight loss", "min_age": 40, "max_age": 60},
+        {"min_age": 70, "smoking_history": "Current Smoker"},
+        {"symptom": "dysphagia"},
+    ]
+    cohort = await _latencies(lambda f: store.find(limit=100, **f), cohorts * 10)
+    count = await _latencies(lambda f: store.count(**f), cohorts)
+    result.update({f"cohort_page_{k}": v for k, v in cohort.items()})
+    result["cohort_count_p50_ms"] = count["p50_ms"]
+    result["query_rss_mb"] = round(rss_mb() - rss_before, 1)
+    await store.close()
+
+    for path in (source, db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the patient registry")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated registry sizes")
+    parser.add_argument("--formats", default="csv,jsonl", help="Import formats to time (csv, jsonl)")
+    parser.add_argument("--lookups", type=int, default=2000, help="Point lookups per size")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+            for fmt in filter(None, (f.strip() for f in args.formats.split(","))):
+                results.append(await bench_size(n, fmt, args.lookups, workdir))
+                print(json.dumps(results[-1]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,16 @@
-from typing import List
+from typing import Callable, List, Sequence, Tuple
+
+from src.tools.tokens import estimate_tokens
+
+
+def make_chunk_id(element_id, part: int) -> str:
+    """Citation ID of a chunk: its element plus its 1-based part number.
+
+    Unlike the chunk's row in the index it does not move when other
+    elements are added, removed or re-chunked.
+    """
+    return f"{element_id}#{part}"
+
 
 def recursive_chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
     if not text:
@@ -41,7 +53,13 @@ def recursive_chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100)
                 current_len -= len(removed)
                 if current_chunk:
                     current_len -= len(separator)
-            
+
+            # The overlap alone still leaves no room for this split; drop it,
+            # otherwise the same chunk would be emitted forever
+            if current_chunk and current_len + split_len + len(separator) > chunk_size:
+                current_chunk = []
+                current_len = 0
+
         if split_len > 0:
             current_chunk.append(split)
             current_len += split_len + (len(separator) if len(current_chunk) > 1 else 0)
@@ -50,3 +68,22 @@ def recursive_chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100)
         chunks.append(separator.join(current_chunk))
         
     return chunks
+
+
+def group_table_rows(rows: Sequence, render: Callable[[Sequence], str], max_tokens: int) -> List[Tuple[int, int, str]]:
+    """Split table rows into consecutive groups whose rendering fits ``max_tokens``.
+
+    ``render`` turns a slice of rows into text, header included, so every
+    group is a self-contained table. Returns ``(first_row, last_row, text)``
+    with 1-based, inclusive row numbers. Rows are never split: one that is
+    over the budget on its own becomes a group by itself.
+    """
+    groups = []
+    start = 0
+    while start < len(rows):
+        end = start + 1
+        while end < len(rows) and estimate_tokens(render(rows[start:end + 1])) <= max_tokens:
+            end += 1
+        groups.append((start + 1, end, render(rows[start:end])))
+        start = end
+    return groups
@@ -3,9 +3,11 @@
 import json
 import os
 import time
+import pandas as pd
 from dotenv import load_dotenv
 from google import genai
-from src.preprocess.chunking import recursive_chunk_text
+from src.preprocess.chunking import group_table_rows, make_chunk_id, recursive_chunk_text
+from src.tools.rate_limiter import Priority, is_rate_limit_error, rate_limiter
 
 
 load_dotenv()
@@ -16,6 +18,8 @@ MODEL_NAME = os.getenv("MODEL_NAME")
 CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP"))
+# Table rows per chunk, header and caption included (the summary is added on top)
+TABLE_CHUNK_TOKENS = int(os.getenv("TABLE_CHUNK_TOKENS", "300"))
 
 # Global client for reuse
 _client = None
@@ -38,24 +42,22 @@ def build_document_context(elements: list) -> str:
 
 def _generate_with_retry(model_name: str, prompt: str, retries: int = 6) -> str:
     global _client
-    base_delay = 2
     
     for attempt in range(retries):
         try:
-            response = _client.models.generate_content(model=model_name, contents=prompt)
+            # The shared limiter paces requests and retries rate limits (429)
+            response = rate_limiter.call_sync(
+                model_name, "generate",
+                lambda: _client.models.generate_content(model=model_name, contents=prompt),
+                priority=Priority.PIPELINE,
+            )
             return response.text.strip()
         except Exception as e:
             error_str = str(e)
-            is_rate_limit = "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
             
-            if attempt < retries - 1:
-                if is_rate_limit:
-                    sleep_time = base_delay * (2 ** attempt)
-                    print(f" [Rate Limit: Retrying in {sleep_time}s]", end="")
-                    time.sleep(sleep_time)
-                else:
-                    print(f" [Error: {e}. Retrying...]", end="")
-                    time.sleep(2)
+            if attempt < retries - 1 and not is_rate_limit_error(e):
+                print(f" [Error: {e}. Retrying...]", end="")
+                time.sleep(2)
             else:
                 print(f" [Failed: {e}]")
                 return f"Error: {error_str[:100]}"
@@ -111,15 +113,55 @@ def process_text_element(model_name: str, element: dict, full_context: str) -> l
         
         results.append({
             "element_id": f"{element_id}",
+            "chunk_id": make_chunk_id(element_id, idx + 1),
             "page_number": page,
             "type": "text",
             "raw_text": f"{chunk}\n\n{meaning}",
+            # Chunks of one element share its element_id; part tells them apart
+            "part": idx + 1,
+            "parts": len(chunks),
         })
     
     return results
 
 
-def process_table_element(model_name: str, element: dict, full_context: str) -> dict:
+def _split_caption(table_md: str):
+    """("Table 1 on Page 79", table) for the captioned markdown parse_pdf writes."""
+    caption, sep, table = table_md.partition("\n\n")
+    if sep and not caption.startswith("|"):
+        return caption, table
+    return "", table_md
+
+
+def table_row_groups(element: dict, max_tokens: int = TABLE_CHUNK_TOKENS) -> list:
+    """Row groups of a table element, each with its header row repeated.
+
+    Uses the cells recorded by parse_pdf. Elements parsed before cells were
+    recorded only have markdown, where a multi-line cell spans several lines;
+    those are grouped by markdown line, so a long row may straddle two groups
+    (re-run parse_pdf to get exact row boundaries).
+    """
+    caption, table_md = _split_caption(element.get("markdown", ""))
+    prefix = f"{caption}\n\n" if caption else ""
+    cells = element.get("cells")
+    if cells:
+        header, rows, unit = cells[0], cells[1:], "row"
+        render = lambda part: prefix + pd.DataFrame(part, columns=header).to_markdown(index=False)
+    else:
+        lines = table_md.splitlines()
+        # Header lines run up to the |:---| alignment line
+        split = next((i + 1 for i, line in enumerate(lines) if line.startswith("|:") or line.startswith("|-")), 0)
+        header, rows, unit = lines[:split], lines[split:], "line"
+        render = lambda part: prefix + "\n".join([*header, *part])
+    if not rows:
+        return [{"caption": caption, "rows": (0, 0), "unit": unit, "markdown": element.get("markdown", "")}]
+    return [
+        {"caption": caption, "rows": (first, last), "unit": unit, "markdown": text}
+        for first, last, text in group_table_rows(rows, render, max_tokens)
+    ]
+
+
+def process_table_element(model_name: str, element: dict, full_context: str) -> list:
     element_id = element.get("element_id")
     page = element.get("page_number")
     table_md = element.get("markdown", "")
@@ -127,14 +169,26 @@ def process_table_element(model_name: str, element: dict, full_context: str) ->
     print(f"Getting table summary...", end=" ")
     summary = get_table_summary(model_name, table_md, full_context)
     print("Success" if not summary.startswith("Error") else "Error")
-    
-    return {
-        "element_id": element_id,
-        "page_number": page,
-        "type": "table",
-        "raw_text": f"{table_md}\n\n{summary}",
-        "table_summary": summary
-    }
+
+    # One chunk per row group, so a hit brings the matching rows rather than the whole table
+    groups = table_row_groups(element)
+    print(f"Chunked into {len(groups)} row groups")
+    return [
+        {
+            "element_id": element_id,
+            "chunk_id": make_chunk_id(element_id, i + 1),
+            "page_number": page,
+            "type": "table",
+            "raw_text": f"{group['markdown']}\n\n{summary}",
+            "table_summary": summary,
+            "table": group["caption"] or element_id,
+            "table_rows": list(group["rows"]),
+            "table_row_unit": group["unit"],
+            "part": i + 1,
+            "parts": len(groups),
+        }
+        for i, group in enumerate(groups)
+    ]
 
 
 def save_results(data: list, filepath: str):
@@ -153,7 +207,11 @@ def initialize_vertex_ai():
     _client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
     
     print("Testing connection...", end=" ")
-    _client.models.generate_content(model=MODEL_NAME, contents="Hello")
+    rate_limiter.call_sync(
+        MODEL_NAME, "generate",
+        lambda: _client.models.generate_content(model=MODEL_NAME, contents="Hello"),
+        priority=Priority.PIPELINE,
+    )
     print("Connected!")
     
     return MODEL_NAME
@@ -1,7 +1,7 @@
 # parsed_data.py
 import pdfplumber
 import pandas as pd
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 import os
 import json
@@ -18,6 +18,8 @@ class PageElement(BaseModel):
     element_type: str  
     markdown: str
     raw_text: str
+    # Table cells, header row first, so tables can be chunked by row
+    cells: Optional[List[List[str]]] = None
 
 class PageMarkdown(BaseModel):
 
@@ -103,7 +105,8 @@ def process_pdf(pdf_path: str) -> Tuple[List[PageMarkdown], List[PageElement]]:
                     page_number=page_number,
                     element_type="table",
                     markdown=f"{caption}\n\n{table_md}",
-                    raw_text="\n".join(["\t".join(map(str, row)) for row in table_data])
+                    raw_text="\n".join(["\t".join(map(str, row)) for row in table_data]),
+                    cells=[["" if cell is None else str(cell) for cell in row] for row in table_data]
                 )
                 all_elements.append(table_element)
                 
@@ -0,0 +1,92 @@
+"""Per-request deadlines.
+
+A request's time budget is set once, where it enters the API, and carried
+to everything it calls through a context variable: the agent run, its tools,
+guideline search and the rate limiter's retries all see the same absolute
+deadline. Work that cannot finish before it (a retry whose backoff alone
+would overrun it, a tool call with no time left) is not started, and the
+agent run is cut off when the budget is spent so the caller gets the best
+partial answer instead of waiting on work nobody will read.
+
+The budget is ``REQUEST_DEADLINE_S`` unless the client sends a shorter (or,
+up to ``MAX_REQUEST_DEADLINE_S``, longer) one in the ``X-Request-Timeout``
+header, in seconds.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEADLINE_HEADER = "X-Request-Timeout"
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "120"))
+MAX_REQUEST_DEADLINE_S = float(os.getenv("MAX_REQUEST_DEADLINE_S", "600"))
+
+# Absolute time.monotonic() deadline of the current request, None for no limit
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before ``stage`` could run."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded before {stage}")
+        self.stage = stage
+
+
+def budget_from_header(value: Optional[str]) -> Optional[float]:
+    """Seconds of budget for a request with this header value (None: no limit).
+
+    Only a positive header value counts: ``0``, negative numbers, ``nan`` and
+    garbage get the default, so a client cannot opt out of the deadline.
+    Only ``REQUEST_DEADLINE_S<=0`` in the server's config turns it off.
+    """
+    budget = REQUEST_DEADLINE_S
+    if value:
+        try:
+            asked = float(value)
+        except ValueError:
+            asked = None
+        # nan > 0 is False; inf is capped below
+        if asked is not None and asked > 0:
+            budget = asked
+    if budget <= 0:
+        return None
+    return min(budget, MAX_REQUEST_DEADLINE_S)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """Run the enclosed calls with ``seconds`` of budget; never extends an outer deadline."""
+    deadline = time.monotonic() + seconds if seconds is not None else None
+    outer = current_deadline.get()
+    if outer is not None and (deadline is None or outer < deadline):
+        deadline = outer
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, None when there is none."""
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def can_finish(seconds: float) -> bool:
+    """Whether ``seconds`` more work still fits in the budget."""
+    left = remaining()
+    return left is None or left > seconds
+
+
+def check(stage: str):
+    """Raise DeadlineExceeded if the budget is already spent."""
+    if not can_finish(0):
+        raise DeadlineExceeded(stage)
@@ -1,31 +1,63 @@
-import json
 import os
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Dict, Optional, List
 
-# Path to the actual patient data
+from src.database.patient_store import ID_PAGE_SIZE, PatientStore
+from src.tools.telemetry import get_logger
+
+log = get_logger("patients")
+
+# Path to the actual patient data, imported into the patient store on first use
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
-PATIENTS_FILE = os.path.join(PROJECT_ROOT, "data", "patients.json")
+PATIENTS_FILE = os.getenv("PATIENTS_FILE", os.path.join(PROJECT_ROOT, "data", "patients.json"))
 
 class PatientDataTool:
-    def __init__(self):
-        self.patients = self._load_patients()
-    
-    def _load_patients(self) -> Dict:
-        if not os.path.exists(PATIENTS_FILE):
-            print(f"Warning: Patient data file not found at {PATIENTS_FILE}")
-            return {}
-        
-        with open(PATIENTS_FILE, "r", encoding="utf-8") as f:
-            patients_list = json.load(f)
-        
-        return {p["patient_id"]: p for p in patients_list}
-    
-    def get_patient_data(self, patient_id: str) -> Optional[Dict]:
-        return self.patients.get(patient_id)
-    
-    def list_patients(self) -> List[str]:
-        return list(self.patients.keys())
+    """Patient lookups for the agent, backed by the SQLite ``PatientStore``."""
+
+    def __init__(self, store: Optional[PatientStore] = None, source: str = PATIENTS_FILE):
+        self.store = store or PatientStore()
+        self.source = source
+        self._synced = False
+
+    def _sync(self):
+        # (Re)import the source file if it changed since the last import
+        if self._synced:
+            return
+        if not os.path.exists(self.source):
+            log.warning("Patient data file not found", path=self.source)
+        elif not self.store.is_current(self.source):
+            log.info("Importing patient data", path=self.source)
+            self.store.import_file(self.source)
+        self._synced = True
+
+    def load(self) -> int:
+        """Prepare the store (called by the API lifespan); returns the patient count."""
+        self._sync()
+        return self.store.count_sync()
+
+    async def get_patient_data(self, patient_id: str) -> Optional[Dict]:
+        self._sync()
+        return await self.store.get(patient_id)
+
+    async def get_patients(self, patient_ids: List[str]) -> Dict[str, Dict]:
+        """Records for the patients that exist, keyed by patient_id."""
+        self._sync()
+        return await self.store.get_many(patient_ids)
+
+    async def iter_patient_ids(self, page_size: int = ID_PAGE_SIZE) -> AsyncIterator[List[str]]:
+        """Every patient id in the registry, in pages of ``page_size``."""
+        self._sync()
+        async for page in self.store.iter_ids(page_size):
+            yield page
+
+    async def find_patients(self, limit: int = 100, after_id: Optional[str] = None, **filters) -> List[Dict]:
+        """Cohort query, e.g. ``find_patients(min_age=40, max_age=60, symptom="weight loss")``."""
+        self._sync()
+        return await self.store.find(limit=limit, after_id=after_id, **filters)
+
+    async def count_patients(self, **filters) -> int:
+        self._sync()
+        return await self.store.count(**filters)
 
 # Singleton instance
 patient_tool = PatientDataTool()
@@ -0,0 +1,249 @@
+"""On-demand sampling profiler.
+
+A background thread snapshots every thread's Python stack
+(``sys._current_frames``) ``PROFILE_HZ`` times a second while a profiled
+block runs, and writes the aggregated stacks to ``PROFILE_DIR`` as a
+collapsed-stack file (``flamegraph.pl``, speedscope and most flamegraph
+viewers read it) or a speedscope JSON file. No thread runs unless a block is
+actually profiled; otherwise the cost is one header check per request.
+
+The samples are wall-clock and cover the whole process, so time spent
+waiting (on the model, on SQLite worker threads, in the event loop's select)
+shows up next to CPU work, and so does any request running concurrently.
+Each thread is its own root (``thread:<name>``).
+
+API requests are profiled by arming the next N requests through
+``POST /admin/profile``, by sampling a fraction of them
+(``PROFILE_SAMPLE_RATE``) or, when ``PROFILE_ALLOW_HEADER=1``, with the
+``X-Profile`` header; the pipeline with ``python main.py --pipeline-only
+--profile``. Profiles expose code paths and slow every profiled request, so
+the header is off by default and the admin routes only answer loopback
+clients unless they present ``PROFILE_ADMIN_TOKEN``.
+"""
+
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from src.tools.telemetry import get_logger
+
+load_dotenv()
+
+log = get_logger("profiler")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(PROJECT_ROOT, "data", "profiles"))
+PROFILE_HZ = float(os.getenv("PROFILE_HZ", "100"))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "collapsed")  # or "speedscope"
+# Honour the X-Profile request header; off, so clients can't profile at will
+PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "0") == "1"
+# Fraction of chat requests profiled without being asked (0 disables)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Required in X-Admin-Token by the /admin routes; unset, they only answer loopback clients
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+# Oldest profiles are deleted beyond this many files
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+PROFILE_HEADER = "X-Profile"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+FORMATS = ("collapsed", "speedscope")
+MAX_STACK_DEPTH = 128
+
+
+def _frame_name(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    else:
+        # site-packages/pydantic_ai/agent.py -> pydantic_ai/agent.py
+        filename = "/".join(filename.split(os.sep)[-2:])
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler for the whole process."""
+
+    def __init__(self, hz: float = PROFILE_HZ):
+        self.interval = 1 / hz
+        self.samples: Counter = Counter()
+        self.started = self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Frame names are cached per code object: the same few hundred recur
+        self._names: Dict[object, str] = {}
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    name = self._names.get(code)
+                    if name is None:
+                        name = self._names[code] = _frame_name(code)
+                    stack.append(name)
+                    frame = frame.f_back
+                stack.append(f"thread:{names.get(ident, ident)}")
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """One ``root;...;leaf count`` line per distinct stack."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self, name: str) -> Dict:
+        """Speedscope file: one sampled profile per thread, weights in seconds."""
+        frames: Dict[str, int] = {}
+        threads: Dict[str, List] = {}
+        for stack, count in self.samples.items():
+            indexes = [frames.setdefault(f, len(frames)) for f in stack[1:]]
+            samples, weights = threads.setdefault(stack[0], ([], []))
+            samples.append(indexes)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ng12-agent profiler",
+            "shared": {"frames": [{"name": f} for f in frames]},
+            "profiles": [
+                {
+                    "type": "sampled", "name": thread, "unit": "seconds",
+                    "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+                }
+                for thread, (samples, weights) in sorted(threads.items())
+            ],
+        }
+
+    def write(self, label: str, fmt: str = PROFILE_FORMAT, directory: str = PROFILE_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', label)[:80]}"
+        if fmt == "speedscope":
+            path = os.path.join(directory, f"{name}.speedscope.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.speedscope(name), f)
+        else:
+            path = os.path.join(directory, f"{name}.collapsed.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.collapsed())
+        _prune(directory)
+        return path
+
+
+def _prune(directory: str):
+    profiles = sorted(
+        (e for e in os.scandir(directory) if e.is_file()), key=lambda e: e.stat().st_mtime, reverse=True
+    )
+    for entry in profiles[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profiled(label: str, hz: float = PROFILE_HZ, fmt: str = PROFILE_FORMAT) -> Iterator[Dict]:
+    """Profile the enclosed block; the yielded dict gets the file's ``path`` on exit."""
+    info: Dict = {"path": None}
+    profiler = SamplingProfiler(hz)
+    profiler.start()
+    try:
+        yield info
+    finally:
+        profiler.stop()
+        try:
+            info["path"] = profiler.write(label, fmt)
+            log.info("Profile written", label=label, path=info["path"], seconds=round(profiler.duration, 3),
+                     samples=sum(profiler.samples.values()))
+        except OSError as e:
+            log.warning("Could not write profile", label=label, error=str(e))
+
+
+def admin_allowed(client_host: Optional[str], token: Optional[str]) -> bool:
+    """Whether a caller may use the profiling admin routes.
+
+    With ``PROFILE_ADMIN_TOKEN`` set the token decides; otherwise only
+    loopback clients are let in (behind a reverse proxy every client looks
+    local, so set a token there).
+    """
+    if PROFILE_ADMIN_TOKEN:
+        return bool(token) and hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+    return client_host in LOOPBACK_HOSTS
+
+
+class ProfileTrigger:
+    """Decides which requests get profiled: armed by an admin, sampled, or the header."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.armed = 0
+        self.hz = PROFILE_HZ
+        self.fmt = PROFILE_FORMAT
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.written = 0
+
+    def arm(self, requests: int, hz: Optional[float] = None, fmt: Optional[str] = None,
+            sample_rate: Optional[float] = None):
+        with self._lock:
+            self.armed = max(0, requests)
+            self.hz = hz or PROFILE_HZ
+            self.fmt = fmt or PROFILE_FORMAT
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+
+    def take(self, header: Optional[str]) -> bool:
+        """Whether to profile this request; consumes an armed slot if it is one."""
+        if header and PROFILE_ALLOW_HEADER and header.lower() not in ("0", "false", "no"):
+            return True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if not self.armed:
+            return False
+        with self._lock:
+            if self.armed:
+                self.armed -= 1
+                return True
+        return False
+
+    @contextmanager
+    def maybe(self, label: str, header: Optional[str]) -> Iterator[Optional[Dict]]:
+        """Profile the block if this request should be; yields None otherwise."""
+        if not self.take(header):
+            yield None
+            return
+        try:
+            with profiled(label, self.hz, self.fmt) as info:
+                yield info
+        finally:
+            self.written += 1
+
+    def stats(self) -> Dict:
+        return {"armed": self.armed, "hz": self.hz, "format": self.fmt, "sample_rate": self.sample_rate,
+                "written": self.written, "allow_header": PROFILE_ALLOW_HEADER, "directory": PROFILE_DIR}
+
+
+# Singleton shared by the API routes
+profile_trigger = ProfileTrigger()
@@ -1,14 +1,27 @@
+import asyncio
+import logging
 import os
+import threading
+import time
 import faiss
 import json
 import numpy as np
-from typing import List, Dict
-from google import genai
+from typing import List, Dict, Optional
 from google.genai.types import EmbedContentConfig
 from dotenv import load_dotenv
+from src.embeddings.symptom_index import load_symptom_index, normalize_symptom, symptom_index_path
+from src.tools import deadline
+from src.tools.cache import LRUCache
+from src.tools.rate_limiter import rate_limiter
+from src.embeddings.metadata_store import ChunkIdIndex, open_metadata, store_paths
+from src.tools.replay import make_genai_client
+from src.tools.single_flight import SingleFlight
+from src.tools.telemetry import get_logger, span
 
 load_dotenv()
 
+log = get_logger("rag_search")
+
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
 CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -21,118 +34,235 @@ DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 INDEX_PATH = os.path.join(DATA_DIR, "faiss.index")
 METADATA_PATH = os.path.join(DATA_DIR, "metadata.json")
 
+EMBEDDING_MODEL = "text-embedding-004"
+
+# Process-wide caches, shared by every session and batch assessment
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+# Set INDEX_MMAP=0 to load the index and metadata onto the heap instead
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
 class RAGSearchTool:
-    def __init__(self):
+    """Guideline retrieval over the FAISS index.
+
+    Nothing is loaded on construction: the index and metadata are loaded by
+    ``load()`` (called by the API lifespan, or on first use) and the genai
+    client is created on the first embedding request.
+    """
+
+    def __init__(self, index_path: str = INDEX_PATH, metadata_path: str = METADATA_PATH):
+        self.index_path = index_path
+        self.metadata_path = metadata_path
         self.index = None
         self.metadata = None
-        self.client = None
-        self._initialize()
-
-    def _initialize(self):
-        if not os.path.exists(INDEX_PATH):
-            raise FileNotFoundError(f"FAISS index not found at {INDEX_PATH}")
-        
-        print("Loading FAISS index...")
-        self.index = faiss.read_index(INDEX_PATH)
-        
-        print("Loading metadata...")
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            self.metadata = json.load(f)
-            
-        print("Initializing Google GenAI Client...")
-        # Authenticate
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
-        self.client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+        self.symptom_index = None
+        # Passage labels handed to the model ("page_9_seq_2#1", see make_chunk_id)
+        # and the metadata row / vector each one names
+        self.chunk_ids = None
+        self.load_ms = None
+        self.embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE)
+        self.flights = SingleFlight("search")
+        self._client = None
+        self._lock = threading.Lock()
 
-    async def search(self, query: str, k: int = 5) -> List[Dict]:
-        
-        print("\n" + "="*60)
-        print(f"[RAG SEARCH] Query: '{query}'")
-        print(f"[RAG SEARCH] Technique: Cosine Similarity (FAISS IndexFlatIP)")
-        print(f"[RAG SEARCH] Requested top-k: {k}")
-        print("="*60)
-        
-        print(f"[RAG SEARCH] Generating query embedding (Async)...")
-        
-        # Internal retry logic for embeddings
-        max_retries = 3
-        base_delay = 1
-        query_vector = None
-        
-        for attempt in range(max_retries):
-            try:
-                response = await self.client.aio.models.embed_content(
-                    model="text-embedding-004",
-                    contents=query,
-                    config=EmbedContentConfig(task_type="RETRIEVAL_QUERY"),
+    @property
+    def loaded(self) -> bool:
+        return self.index is not None
+
+    def load(self):
+        """Load the index, metadata and symptom index once."""
+        if self.index is not None:
+            return
+        with self._lock:
+            if self.index is not None:
+                return
+            if not os.path.exists(self.index_path):
+                raise FileNotFoundError(f"FAISS index not found at {self.index_path}")
+            start = time.perf_counter()
+
+            # Memory-map the index and metadata: API workers share the pages
+            # through the OS page cache instead of each holding a private copy.
+            log.info("Loading FAISS index", path=self.index_path, mmap=INDEX_MMAP)
+            index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP_IFC if INDEX_MMAP else 0)
+
+            log.info("Loading metadata", path=self.metadata_path)
+            if INDEX_MMAP:
+                self.metadata = open_metadata(self.metadata_path)
+                self.chunk_ids = self.metadata.chunk_ids
+            else:
+                self.metadata = self._load_metadata_json()
+                self.chunk_ids = ChunkIdIndex.from_metadata(self.metadata)
+
+            self.symptom_index = load_symptom_index(
+                symptom_index_path(self.index_path), num_vectors=index.ntotal, chunks=self.chunk_ids.fingerprint()
+            )
+            if self.symptom_index:
+                log.info("Loaded symptom index", symptoms=len(self.symptom_index["symptoms"]))
+
+            # Published last so other threads never see a half-loaded tool
+            self.index = index
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    @property
+    def client(self):
+        if self._client is None:
+            log.info("Initializing Google GenAI client")
+            # Live, recording or replaying client depending on VERTEX_MODE
+            self._client = make_genai_client(PROJECT_ID, LOCATION, CREDENTIALS_PATH)
+        return self._client
+
+    def touch_pages(self) -> int:
+        """Read the mapped artifacts once so first queries don't fault pages in."""
+        self.load()
+        touched = 0
+        for path in (self.index_path, *store_paths(self.metadata_path)):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    while chunk := f.read(1 << 20):
+                        touched += len(chunk)
+        return touched
+
+    def _load_metadata_json(self) -> List[Dict]:
+        with open(self.metadata_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _build_result(self, idx: int, score: float) -> Dict:
+        meta = self.metadata[idx]
+        text = excerpt = meta.get("content", meta.get("raw_text", ""))
+        # Use contextual meaning if available
+        if "contextual_meaning" in meta:
+            excerpt = f"{excerpt}\n\n[Context: {meta['contextual_meaning']}]"
+        return {
+            "score": score,
+            "chunk_id": self.chunk_ids.chunk_id(idx),
+            "element_id": meta.get("element_id"),
+            "page": meta.get("page_number"),
+            "type": meta.get("type"),
+            "excerpt": excerpt,
+            # The chunk alone, without the generated context
+            "text": text,
+            "source": "NG12 Guideline"
+        }
+
+    def resolve_chunks(self, cited: List[str]) -> List[Dict]:
+        """Page and verbatim text for each chunk ID, in order, skipping unknown IDs."""
+        self.load()
+        chunks, seen = [], set()
+        for raw in cited:
+            idx = self.chunk_ids.row(str(raw).strip().strip("[]").strip())
+            if idx is None:
+                log.warning("Unknown chunk ID cited", chunk_id=raw)
+                continue
+            if idx in seen:
+                continue
+            seen.add(idx)
+            meta = self.metadata[idx]
+            chunks.append({
+                "chunk_id": self.chunk_ids.chunk_id(idx),
+                "page": meta.get("page_number"),
+                "excerpt": meta.get("content", meta.get("raw_text", "")).strip(),
+                "source": "NG12 Guideline",
+            })
+        return chunks
+
+    def resolve_symptom(self, text: str) -> Optional[str]:
+        """Map free text to a canonical symptom from the precomputed index."""
+        self.load()
+        if not self.symptom_index:
+            return None
+        return self.symptom_index["aliases"].get(normalize_symptom(text))
+
+    def lookup_symptom(self, text: str, k: int = 5) -> Optional[List[Dict]]:
+        """Return precomputed results for a known symptom, or None if unknown."""
+        canonical = self.resolve_symptom(text)
+        if canonical is None:
+            return None
+        log.debug("Symptom index hit", text=text, symptom=canonical)
+        ranked = self.symptom_index["symptoms"][canonical][:k]
+        return [self._build_result(idx, score) for idx, score in ranked]
+
+    async def _embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing cached vectors for repeated queries."""
+        cache_key = normalize_query(query)
+        cached = self.embedding_cache.get(cache_key)
+        if cached is not None:
+            log.debug("Embedding cache hit")
+            return cached.copy()
+
+        # Rate limiting and 429 retries are handled by the shared limiter
+        try:
+            with span("embedding"):
+                response = await rate_limiter.call(
+                    EMBEDDING_MODEL, "embed",
+                    lambda: self.client.aio.models.embed_content(
+                        model=EMBEDDING_MODEL,
+                        contents=query,
+                        config=EmbedContentConfig(task_type="RETRIEVAL_QUERY"),
+                    ),
                 )
-                query_vector = np.array([response.embeddings[0].values], dtype=np.float32)
-                break
-            except Exception as e:
-                # Check for rate limit (429) or other transient errors
-                is_rate_limit = "429" in str(e) or "ResourceExhausted" in str(type(e).__name__)
-                if is_rate_limit and attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    print(f"[RAG SEARCH] Embedding rate limited. Retrying in {delay}s...")
-                    import asyncio
-                    await asyncio.sleep(delay)
-                else:
-                    print(f"[RAG SEARCH] Embedding failed: {e}")
-                    raise e
-                    
-        if query_vector is None:
-             raise RuntimeError("Failed to generate embedding")
-
-        print(f"[RAG SEARCH] Query vector shape: {query_vector.shape}")
-        
+        except Exception as e:
+            log.error("Embedding failed", error=str(e))
+            raise
+        query_vector = np.array([response.embeddings[0].values], dtype=np.float32)
+
+        self.embedding_cache.put(cache_key, query_vector.copy())
+        return query_vector
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()}
+
+    def search_by_vector(self, query_vector: np.ndarray, k: int = 5) -> List[Dict]:
+        """Nearest guideline passages for an embedded query (no network)."""
+        self.load()
+        query_vector = np.array(query_vector, dtype=np.float32).reshape(1, -1)
         # Normalize for cosine similarity
         faiss.normalize_L2(query_vector)
-        print(f"[RAG SEARCH] Vector normalized for cosine similarity")
-        
-        print(f"[RAG SEARCH] Searching FAISS index...")
-        # FAISS CPU search is fast enough to run in thread pool if needed, 
-        # but for small indices direct call is fine. 
-        # For safety in async context, we could use run_in_executor but it's okay here.
-        distances, indices = self.index.search(query_vector, k)
-        print(f"[RAG SEARCH] Found {len(indices[0])} candidates")
-        
-        results = []
-        print("\n[RAG SEARCH] Retrieved Documents:")
-        print("-" * 60)
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:
-                meta = self.metadata[idx]
-                score = float(distances[0][i])
-                
-                print(f"\n  Document {i+1}:")
-                print(f"    Index ID: {idx}")
-                print(f"    Similarity Score: {score:.4f}")
-                print(f"    Page: {meta.get('page_number', 'N/A')}")
-                print(f"    Type: {meta.get('type', 'N/A')}")
-                print(f"    Element ID: {meta.get('element_id', 'N/A')}")
-                
-                # Format excerpt nicely
-                excerpt = meta.get("content", meta.get("raw_text", ""))
-                excerpt_preview = excerpt[:150] + "..." if len(excerpt) > 150 else excerpt
-                print(f"    Preview: {excerpt_preview}")
-                
-                # Use contextual meaning if available
-                if "contextual_meaning" in meta:
-                    excerpt = f"{excerpt}\n\n[Context: {meta['contextual_meaning']}]"
-                    print(f"    Has Contextual Meaning: Yes")
-                
-                results.append({
-                    "score": score,
-                    "element_id": meta.get("element_id"),
-                    "page": meta.get("page_number"),
-                    "type": meta.get("type"),
-                    "excerpt": excerpt,
-                    "source": "NG12 Guideline"
-                })
-        
-        print("\n" + "="*60)        
-        print(f"[RAG SEARCH] Returning {len(results)} results")
-        print("="*60 + "\n")
+        with span("faiss_search"):
+            distances, indices = self.index.search(query_vector, k)
+        return [
+            self._build_result(idx, float(distances[0][i]))
+            for i, idx in enumerate(indices[0]) if idx != -1
+        ]
+
+    async def search(self, query: str, k: int = 5) -> List[Dict]:
+        """Search the guidelines; identical concurrent queries share one search.
+
+        Bounded by the request deadline: a caller that runs out of time stops
+        waiting (raising TimeoutError) without cancelling a search others share.
+        """
+        async with asyncio.timeout_at(deadline.current_deadline.get()):
+            results = await self.flights.do(
+                (normalize_query(query), k), lambda: self._search(query, k)
+            )
+        return [dict(r) for r in results]
+
+    async def _search(self, query: str, k: int = 5) -> List[Dict]:
+        cache_key = (normalize_query(query), k)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            log.debug("Result cache hit", query=query, k=k, results=len(cached))
+            return [dict(r) for r in cached]
+
+        query_vector = await self._embed_query(query)
+        results = self.search_by_vector(query_vector, k)
+        log.info("Search finished", query=query, k=k, results=len(results),
+                 top_score=round(results[0]["score"], 4) if results else None)
+        if log.isEnabledFor(logging.DEBUG):
+            for i, result in enumerate(results):
+                excerpt = result["excerpt"]
+                log.debug(
+                    "Retrieved document", rank=i + 1, score=round(result["score"], 4), page=result["page"],
+                    type=result["type"], element_id=result["element_id"],
+                    preview=excerpt[:150] + "..." if len(excerpt) > 150 else excerpt,
+                )
+
+        self.result_cache.put(cache_key, [dict(r) for r in results])
         return results
 
 # Singleton instance for reuse
@@ -0,0 +1,263 @@
+"""Process-wide adaptive rate limiter for Vertex AI calls.
+
+Every call to a Vertex model (agent requests, query/document embeddings and
+pipeline enrichment) goes through one shared ``rate_limiter``. Each
+(model, endpoint) pair gets its own token bucket whose rate adapts with AIMD:
+successful calls raise it additively up to the configured ceiling, and a 429
+halves it. Waiting callers are served by priority, so interactive chat gets
+ahead of batch assessments, which get ahead of the offline pipeline.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.tools import deadline
+from src.tools.telemetry import get_logger
+
+log = get_logger("rate_limiter")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+    PIPELINE = 2
+
+
+# Priority of calls made from the current task; batch runners and the
+# pipeline override it.
+current_priority: ContextVar[Priority] = ContextVar("current_priority", default=Priority.INTERACTIVE)
+
+# The ceilings are for the whole deployment; each API worker process gets
+# an equal share.
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+DEFAULT_RPS = {
+    "generate": float(os.getenv("RATE_LIMIT_GENERATE_RPS", "5")) / API_WORKERS,
+    "embed": float(os.getenv("RATE_LIMIT_EMBED_RPS", "20")) / API_WORKERS,
+}
+MIN_RPS = float(os.getenv("RATE_LIMIT_MIN_RPS", "0.2"))
+ADDITIVE_INCREASE = float(os.getenv("RATE_LIMIT_INCREASE", "0.1"))
+MULTIPLICATIVE_DECREASE = 0.5
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+BASE_BACKOFF = 1.0
+MAX_WAIT_SAMPLES = 1000
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    """Run the enclosed calls at the given priority."""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """True for quota errors from pydantic-ai or the google-genai client."""
+    if getattr(e, "status_code", None) == 429 or getattr(e, "code", None) == 429:
+        return True
+    text = f"{type(e).__name__} {e}"
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "ResourceExhausted" in text
+
+
+class TokenBucket:
+    def __init__(self, key: Tuple[str, str], max_rate: float):
+        self.key = key
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.capacity = max(1.0, max_rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.last_decrease = 0.0
+        self.waiting = {p: 0 for p in Priority}
+        self.throttled = 0
+        self.granted = 0
+        self.wait_samples = {p: deque(maxlen=MAX_WAIT_SAMPLES) for p in Priority}
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, priority: Priority) -> float:
+        """Take a token if one is free for this priority, else return seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            outranked = any(self.waiting[p] for p in Priority if p < priority)
+            if self.tokens >= 1 and not outranked:
+                self.tokens -= 1
+                self.granted += 1
+                return 0.0
+            return max((1 - self.tokens) / self.rate, 0.005)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE)
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttled += 1
+            now = time.monotonic()
+            # Concurrent callers often see the same 429 burst; back off once per window.
+            if now - self.last_decrease >= 1 / self.rate:
+                self.rate = max(MIN_RPS, self.rate * MULTIPLICATIVE_DECREASE)
+                self.last_decrease = now
+            self.tokens = 0.0
+            self.updated = now
+
+    def record_wait(self, priority: Priority, seconds: float):
+        self.wait_samples[priority].append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = {}
+        for p, samples in self.wait_samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            waits[p.name.lower()] = {
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "waiting": {p.name.lower(): n for p, n in self.waiting.items() if n},
+            "queue_wait": waits,
+        }
+
+
+class RateLimiter:
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, model: str, endpoint: str) -> TokenBucket:
+        key = (model, endpoint)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(key, DEFAULT_RPS.get(endpoint, DEFAULT_RPS["generate"]))
+            return self._buckets[key]
+
+    async def acquire(self, model: str, endpoint: str, priority: Optional[Priority] = None) -> float:
+        """Wait for a token; returns the time spent queued."""
+        priority = current_priority.get() if priority is None else priority
+        bucket = self.bucket(model, endpoint)
+        start = time.monotonic()
+        wait = bucket.try_acquire(priority)
+        if wait:
+            with bucket.lock:
+                bucket.waiting[priority] += 1
+            try:
+                while wait:
+                    await asyncio.sleep(min(wait, 0.25))
+                    wait = bucket.try_acquire(priority)
+            finally:
+                with bucket.lock:
+                    bucket.waiting[priority] -= 1
+        waited = time.monotonic() - start
+        bucket.record_wait(priority, waited)
+        return waited
+
+    def acquire_sync(self, model: str, endpoint: str, priority: Optional[Priority] = None) -> float:
+        """Blocking variant of ``acquire`` for the synchronous pipeline."""
+        priority = current_priority.get() if priority is None else priority
+        bucket = self.bucket(model, endpoint)
+        start = time.monotonic()
+        wait = bucket.try_acquire(priority)
+        if wait:
+            with bucket.lock:
+                bucket.waiting[priority] += 1
+            try:
+                while wait:
+                    time.sleep(min(wait, 0.25))
+                    wait = bucket.try_acquire(priority)
+            finally:
+                with bucket.lock:
+                    bucket.waiting[priority] -= 1
+        waited = time.monotonic() - start
+        bucket.record_wait(priority, waited)
+        return waited
+
+    def _backoff(self, bucket: TokenBucket, attempt: int) -> float:
+        return max(1 / bucket.rate, BASE_BACKOFF * (2 ** attempt))
+
+    async def call(
+        self,
+        model: str,
+        endpoint: str,
+        fn: Callable[[], Awaitable[Any]],
+        priority: Optional[Priority] = None,
+        max_retries: int = MAX_RETRIES,
+    ) -> Any:
+        """Await ``fn()`` under the limiter, retrying on rate-limit errors.
+
+        A retry whose backoff would outlast the request deadline is not
+        attempted; the rate-limit error is raised instead.
+        """
+        bucket = self.bucket(model, endpoint)
+        for attempt in range(max_retries):
+            deadline.check(f"{model}/{endpoint}")
+            await self.acquire(model, endpoint, priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries - 1:
+                    raise
+                bucket.on_throttle()
+                delay = self._backoff(bucket, attempt)
+                if not deadline.can_finish(delay):
+                    log.warning("Throttled, no time left to retry", model=model, endpoint=endpoint,
+                                retry_in_s=round(delay, 1), remaining_s=round(deadline.remaining(), 1))
+                    raise
+                log.warning("Throttled, retrying", model=model, endpoint=endpoint,
+                            rate=round(bucket.rate, 2), retry_in_s=round(delay, 1))
+                await asyncio.sleep(delay)
+                continue
+            bucket.on_success()
+            return result
+
+    def call_sync(
+        self,
+        model: str,
+        endpoint: str,
+        fn: Callable[[], Any],
+        priority: Optional[Priority] = None,
+        max_retries: int = MAX_RETRIES,
+    ) -> Any:
+        """Blocking variant of ``call``."""
+        bucket = self.bucket(model, endpoint)
+        for attempt in range(max_retries):
+            self.acquire_sync(model, endpoint, priority)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries - 1:
+                    raise
+                bucket.on_throttle()
+                delay = self._backoff(bucket, attempt)
+                log.warning("Rate limited, retrying", model=model, endpoint=endpoint, delay_s=round(delay, 1))
+                time.sleep(delay)
+                continue
+            bucket.on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return {f"{b.key[0]}/{b.key[1]}": b.stats() for b in buckets}
+
+
+# Singleton shared by every Vertex caller in the process
+rate_limiter = RateLimiter()
@@ -0,0 +1,215 @@
+"""Record/replay of Vertex AI exchanges for offline load testing.
+
+``VERTEX_MODE`` selects how model and embedding calls are served:
+
+- ``live`` (default): call Vertex AI.
+- ``record``: call Vertex AI and append every exchange to ``RECORDINGS_DIR``.
+- ``replay``: serve recorded exchanges without any network access or
+  credentials, after a synthetic delay (``REPLAY_LATENCY_MS``, or the
+  recorded latency when unset).
+
+In replay mode an unknown request gets a placeholder answer unless
+``REPLAY_STRICT=1``, in which case it is an error.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.tools.telemetry import get_logger
+
+load_dotenv()
+
+log = get_logger("replay")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+
+VERTEX_MODE = os.getenv("VERTEX_MODE", "live").lower()
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", os.path.join(PROJECT_ROOT, "data", "recordings"))
+REPLAY_LATENCY_MS = os.getenv("REPLAY_LATENCY_MS")
+REPLAY_JITTER = float(os.getenv("REPLAY_JITTER", "0.2"))
+REPLAY_STRICT = os.getenv("REPLAY_STRICT", "0") == "1"
+
+EMBEDDING_DIM = 768
+
+
+class ReplayMiss(LookupError):
+    """Raised in strict replay mode when no recording matches a request."""
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replay_delay(recorded_ms: Optional[float]) -> float:
+    """Seconds to wait before serving a replayed response."""
+    if REPLAY_LATENCY_MS is not None:
+        base = float(REPLAY_LATENCY_MS)
+    else:
+        base = recorded_ms or 0.0
+    return max(0.0, base * random.uniform(1 - REPLAY_JITTER, 1 + REPLAY_JITTER)) / 1000
+
+
+class RecordingStore:
+    """Append-only JSONL store of recorded exchanges, keyed by request fingerprint."""
+
+    def __init__(self, name: str, directory: str = RECORDINGS_DIR):
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self._entries: Dict[str, List[Dict]] = {}
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        log.info("Loaded recordings", count=sum(map(len, self._entries.values())), path=self.path)
+
+    def append(self, key: str, entry: Dict):
+        entry = {"key": key, **entry}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._entries.setdefault(key, []).append(entry)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Next recording for a key; cycles when a key was recorded several times."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            i = self._next.get(key, 0)
+            self._next[key] = (i + 1) % len(entries)
+            return entries[i]
+
+    def __len__(self) -> int:
+        return sum(map(len, self._entries.values()))
+
+
+def _embedding_key(model: str, contents: str, config: Any) -> str:
+    return fingerprint({"model": model, "contents": contents, "task_type": getattr(config, "task_type", None)})
+
+
+def _embedding_response(values: List[float]) -> SimpleNamespace:
+    return SimpleNamespace(embeddings=[SimpleNamespace(values=values)])
+
+
+def _synthetic_embedding(key: str) -> List[float]:
+    """Deterministic unit vector for texts that were never recorded."""
+    rng = np.random.default_rng(int(key[:16], 16))
+    vector = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _RecordingModels:
+    def __init__(self, models, store: RecordingStore):
+        self._models = models
+        self._store = store
+
+    def embed_content(self, model: str, contents: str, config: Any = None):
+        start = time.perf_counter()
+        response = self._models.embed_content(model=model, contents=contents, config=config)
+        self._store.append(_embedding_key(model, contents, config), {
+            "values": list(response.embeddings[0].values),
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        })
+        return response
+
+
+class _AsyncRecordingModels(_RecordingModels):
+    async def embed_content(self, model: str, contents: str, config: Any = None):
+        start = time.perf_counter()
+        response = await self._models.embed_content(model=model, contents=contents, config=config)
+        self._store.append(_embedding_key(model, contents, config), {
+            "values": list(response.embeddings[0].values),
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        })
+        return response
+
+
+class RecordingGenAIClient:
+    """Wraps a google-genai client and records every embedding call."""
+
+    def __init__(self, client, store: RecordingStore):
+        self._client = client
+        self.models = _RecordingModels(client.models, store)
+        self.aio = SimpleNamespace(models=_AsyncRecordingModels(client.aio.models, store))
+
+    def __getattr__(self, item):
+        return getattr(self._client, item)
+
+
+class _ReplayModels:
+    def __init__(self, store: RecordingStore):
+        self._store = store
+
+    def _lookup(self, model: str, contents: str, config: Any):
+        key = _embedding_key(model, contents, config)
+        entry = self._store.get(key)
+        if entry is None:
+            if REPLAY_STRICT:
+                raise ReplayMiss(f"No recorded embedding for {contents[:60]!r}")
+            return _synthetic_embedding(key), None
+        return entry["values"], entry.get("latency_ms")
+
+    def embed_content(self, model: str, contents: str, config: Any = None):
+        values, latency = self._lookup(model, contents, config)
+        time.sleep(replay_delay(latency))
+        return _embedding_response(values)
+
+
+class _AsyncReplayModels(_ReplayModels):
+    async def embed_content(self, model: str, contents: str, config: Any = None):
+        values, latency = self._lookup(model, contents, config)
+        await asyncio.sleep(replay_delay(latency))
+        return _embedding_response(values)
+
+
+class ReplayGenAIClient:
+    """Offline stand-in for the google-genai client (embeddings only)."""
+
+    def __init__(self, store: RecordingStore):
+        self.models = _ReplayModels(store)
+        self.aio = SimpleNamespace(models=_AsyncReplayModels(store))
+
+
+_embedding_store: Optional[RecordingStore] = None
+
+
+def embedding_store() -> RecordingStore:
+    global _embedding_store
+    if _embedding_store is None:
+        _embedding_store = RecordingStore("embeddings")
+    return _embedding_store
+
+
+def make_genai_client(project: Optional[str], location: Optional[str], credentials_path: Optional[str]):
+    """google-genai client for the configured VERTEX_MODE."""
+    if VERTEX_MODE == "replay":
+        log.info("Serving embeddings from recordings")
+        return ReplayGenAIClient(embedding_store())
+
+    from google import genai
+    if credentials_path:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+    client = genai.Client(vertexai=True, project=project, location=location)
+    if VERTEX_MODE == "record":
+        log.info("Recording embeddings", directory=RECORDINGS_DIR)
+        return RecordingGenAIClient(client, embedding_store())
+    return client
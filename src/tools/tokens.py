@@ -0,0 +1,13 @@
+"""Token estimates shared by the chunking pipeline and the agent's memory.
+
+Both budget text against model context with the same rough ratio, so a
+300-token table chunk and a 300-token slice of history mean the same thing.
+"""
+
+# ~4 characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of ``text``."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
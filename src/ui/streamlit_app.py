@@ -5,15 +5,126 @@ Compatible with Streamlit 1.9.0.
 """
 import streamlit as st
 import requests
+import json
 import uuid
 from pathlib import Path
 import os
+import time
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+# "jobs" queues each question and polls for the answer; "stream" holds one
+# server-sent events request open while the agent runs
+UI_TRANSPORT = os.getenv("UI_TRANSPORT", "jobs")
+# Each poll waits server-side up to this long for the job to finish
+JOB_POLL_WAIT_S = 5
+JOB_TIMEOUT_S = 900
+# The server stops the agent (answering with what it has) a little before we give up
+STREAM_TIMEOUT_S = 300
 
 st.set_page_config(page_title="Clinical Agent", layout="centered")
 
 
+def iter_sse(response):
+    """Yield (event, data) pairs from a server-sent events response."""
+    event, data_lines = "message", []
+    # chunk_size=None hands over data as soon as it arrives instead of
+    # waiting for a 512-byte buffer to fill
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+def ask_stream(http, prompt, status, progress):
+    """Ask over /chat/stream, showing tool calls and partial output as they arrive."""
+    print(f"[UI] Streaming POST to {API_URL}/chat/stream...")
+    with http.post(
+        f"{API_URL}/chat/stream",
+        json={
+            "session_id": st.session_state.session_id,
+            "message": prompt
+        },
+        headers={"X-Request-Timeout": str(STREAM_TIMEOUT_S - 10)},
+        stream=True,
+        timeout=STREAM_TIMEOUT_S
+    ) as response:
+        print(f"[UI] Response status: {response.status_code}")
+        response.raise_for_status()
+
+        steps = []
+        data = None
+        for event, payload in iter_sse(response):
+            if event == "tool_call":
+                args = ", ".join(f"{k}={v}" for k, v in payload.get("args", {}).items())
+                steps.append(f"- Running `{payload['tool']}({args})`")
+            elif event == "tool_result":
+                pages = payload.get("pages", [])
+                steps.append(f"- `{payload['tool']}` done" + (f" (pages {', '.join(map(str, pages))})" if pages else ""))
+            elif event == "partial":
+                progress.markdown(
+                    f"**Assessment:** {payload.get('assessment', '...')}\n\n"
+                    f"**Reasoning:** {payload.get('reasoning', '...')}"
+                )
+            elif event == "result":
+                data = payload
+            elif event == "error":
+                raise RuntimeError(payload.get("detail", "Unknown error"))
+            status.markdown("\n".join(steps) or "_Thinking..._")
+
+    if data is None:
+        raise RuntimeError("Stream ended without a result")
+    return data
+
+
+def ask_job(http, prompt, status):
+    """Queue the question as a job and poll until it finishes.
+
+    Every request is short, so a slow agent run, an API reload or a dropped
+    connection doesn't lose the work; the job keeps running server-side.
+    """
+    print(f"[UI] Queueing job at {API_URL}/jobs/chat...")
+    response = http.post(
+        f"{API_URL}/jobs/chat",
+        json={"session_id": st.session_state.session_id, "message": prompt},
+        timeout=30
+    )
+    response.raise_for_status()
+    job = response.json()
+    print(f"[UI] Job {job['job_id']} queued")
+
+    deadline = time.monotonic() + JOB_TIMEOUT_S
+    while job["status"] not in ("done", "failed"):
+        if job["status"] == "queued":
+            status.markdown(f"_Queued ({job.get('position') or 0} ahead)..._")
+        else:
+            status.markdown("_Thinking..._" if job.get("attempts", 1) <= 1 else f"_Thinking (attempt {job['attempts']})..._")
+        if time.monotonic() > deadline:
+            raise requests.exceptions.Timeout(f"Job {job['job_id']} still {job['status']}")
+        try:
+            response = http.get(
+                f"{API_URL}/jobs/{job['job_id']}",
+                params={"wait": JOB_POLL_WAIT_S},
+                timeout=JOB_POLL_WAIT_S + 10
+            )
+            response.raise_for_status()
+            job = response.json()
+        except requests.exceptions.ConnectionError:
+            # The API may be restarting; the job is persisted, so keep polling
+            status.markdown("_Reconnecting to the API..._")
+            time.sleep(2)
+
+    if job["status"] == "failed":
+        raise RuntimeError(job.get("error") or "Job failed")
+    return job["result"]
+
+
 css_file = Path(__file__).parent / "style.css"
 if css_file.exists():
     st.markdown(f"<style>{css_file.read_text()}</style>", unsafe_allow_html=True)
@@ -23,6 +134,10 @@ if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "http" not in st.session_state:
+    # One keep-alive connection pool for every request this session makes
+    st.session_state.http = requests.Session()
+http = st.session_state.http
 
 
 with st.sidebar:
@@ -31,7 +146,7 @@ with st.sidebar:
     
     def clear_history():
         try:
-            requests.delete(f"{API_URL}/chat/{st.session_state.session_id}")
+            http.delete(f"{API_URL}/chat/{st.session_state.session_id}", timeout=30)
         except:
             pass
         st.session_state.messages = []
@@ -78,42 +193,35 @@ if submitted and prompt:
     print(f"[UI] Added to history. Current len: {len(st.session_state.messages)}")
     
 
-    with st.spinner("Thinking..."):
-        try:
-            print(f"[UI] Sending POST to {API_URL}/chat...")
-            response = requests.post(
-                f"{API_URL}/chat",
-                json={
-                    "session_id": st.session_state.session_id,
-                    "message": prompt
-                },
-                timeout=300
-            )
-            print(f"[UI] Response status: {response.status_code}")
-            response.raise_for_status()
-            data = response.json()
-            print(f"[UI] Response data keys: {data.keys()}")
-            
-            answer = data.get("answer", "No response")
-            citations = data.get("citations", [])
-            
-            # Save to state
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": answer,
-                "citations": citations
-            })
-            print(f"[UI] Added assessment to history. New len: {len(st.session_state.messages)}")
-            
-        except requests.exceptions.ConnectionError:
-            print("[UI ERROR] ConnectionError")
-            st.error("Cannot connect to API. Please make sure the server is running.")
-        except requests.exceptions.Timeout:
-            print("[UI ERROR] Timeout")
-            st.error("Request timed out. The agent might be busy or retrying. Please try again.")
-        except Exception as e:
-            print(f"[UI ERROR] Exception: {e}")
-            st.error(f"Error: {str(e)}. Please try again.")
+    status = st.empty()
+    progress = st.empty()
+    status.markdown("_Thinking..._")
+    try:
+        if UI_TRANSPORT == "stream":
+            data = ask_stream(http, prompt, status, progress)
+        else:
+            data = ask_job(http, prompt, status)
+
+        answer = data.get("answer", "No response")
+        citations = data.get("citations", [])
+        
+        # Save to state
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": answer,
+            "citations": citations
+        })
+        print(f"[UI] Added assessment to history. New len: {len(st.session_state.messages)}")
+        
+    except requests.exceptions.ConnectionError:
+        print("[UI ERROR] ConnectionError")
+        st.error("Cannot connect to API. Please make sure the server is running.")
+    except requests.exceptions.Timeout:
+        print("[UI ERROR] Timeout")
+        st.error("Request timed out. The agent might be busy or retrying. Please try again.")
+    except Exception as e:
+        print(f"[UI ERROR] Exception: {e}")
+        st.error(f"Error: {str(e)}. Please try again.")
     
     print("[UI] Rerunning app...")
     if hasattr(st, "rerun"):